@@ -1,65 +1,113 @@
-import random
+import os
+import json
+import urllib.error
+import urllib.request
 from datetime import datetime
-from typing import Optional
-from firebase_admin import auth
-from google.cloud.firestore_v1 import Client as FirestoreClient
-from config import db, firebase_auth
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from google.api_core.exceptions import AlreadyExists
+from config import db, firebase_auth, STORAGE_BACKEND
+from session import create_session_token
+from datastore import run_transaction
+from tag_service import allocate_tag, is_valid_tag, release_tags, reserve_tag, reserve_tags
+from handle_service import (
+    create_handle,
+    handle_doc,
+    handle_index,
+    handle_ref,
+    get_handle,
+    nickname_auth_email,
+    normalize_handle,
+    normalize_nickname,
+)
 from models import (
     RegisterWithEmailRequest,
     RegisterWithNicknameRequest,
+    RegisterBatchRequest,
+    RegisterBatchError,
+    RegisterBatchResponse,
     LoginWithEmailRequest,
     LoginWithNicknameRequest,
     UserResponse,  # <-- Cambiato da AuthResponse
 )
 
-def _generate_tag() -> str:
-    return f"{random.randint(0, 9999):04d}"
+# Max 500 scritture per commit: 3 documenti per utente (profilo, statistiche, handle)
+_BATCH_USERS = 166
 
-def _nickname_tag_exists(
-    db_client: FirestoreClient, nickname: str, tag: str
-) -> bool:
-    q = (
-        db_client.collection("users")
-        .where("nickname", "==", nickname)
-        .where("tag", "==", tag)
-        .limit(1)
-    )
-    docs = list(q.stream())
-    return len(docs) > 0
+# Login degli handle non ancora nella directory (utenti registrati prima
+# di handles/): una query su users. Da spegnere dopo
+# `python handle_service.py backfill`.
+HANDLE_QUERY_FALLBACK = os.getenv("HANDLE_QUERY_FALLBACK", "1") == "1"
 
-def _generate_unique_tag_for_nickname(
-    db_client: FirestoreClient, nickname: str
-) -> str:
-    for _ in range(50):
-        candidate = _generate_tag()
-        if not _nickname_tag_exists(db_client, nickname, candidate):
-            return candidate
-    raise RuntimeError("Impossibile generare un tag univoco per il nickname")
+# Con Firestore la password si verifica con l'API REST di Firebase Auth
+# (signInWithPassword), che richiede la Web API key del progetto.
+FIREBASE_WEB_API_KEY: Optional[str] = os.getenv("FIREBASE_WEB_API_KEY")
+_SIGN_IN_URL = "https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={key}"
 
-def register_with_email(data: RegisterWithEmailRequest) -> UserResponse:
-    user_record = firebase_auth.create_user(
-        email=data.email,
-        password=data.password,
-        display_name=data.nickname,
+
+class AuthNotConfigured(RuntimeError):
+    """Il backend non può verificare le password o firmare i token: niente login."""
+
+
+def check_auth_config() -> None:
+    """
+    Chiamata all'avvio: con Firestore senza FIREBASE_WEB_API_KEY le password
+    non si possono verificare, senza SESSION_SECRET i token non si possono
+    firmare. In entrambi i casi l'app non parte.
+    """
+    if STORAGE_BACKEND != "firestore":
+        return
+    missing = [name for name in ("FIREBASE_WEB_API_KEY", "SESSION_SECRET") if not os.getenv(name)]
+    if missing:
+        raise AuthNotConfigured(f"Variabili mancanti per il login: {', '.join(missing)}")
+
+
+def _authenticate(auth_email: str, password: str) -> Tuple[str, Optional[str]]:
+    """
+    Verifica email e password dell'account auth e restituisce
+    (uid, display_name). Senza FIREBASE_WEB_API_KEY il backend Firestore
+    non può verificare la password: il login viene rifiutato.
+    """
+    if STORAGE_BACKEND != "firestore":
+        record = firebase_auth.verify_password(auth_email, password)
+        return record.uid, record.display_name
+    if not FIREBASE_WEB_API_KEY:
+        raise AuthNotConfigured("FIREBASE_WEB_API_KEY non impostata: impossibile verificare la password")
+
+    body = json.dumps({"email": auth_email, "password": password, "returnSecureToken": False})
+    request = urllib.request.Request(
+        _SIGN_IN_URL.format(key=FIREBASE_WEB_API_KEY),
+        data=body.encode(),
+        headers={"Content-Type": "application/json"},
     )
-    uid = user_record.uid
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            result = json.loads(response.read())
+    except urllib.error.HTTPError:
+        raise ValueError("Credenziali non valide")
+    return result["localId"], result.get("displayName")
 
-    tag = data.tag or _generate_unique_tag_for_nickname(db, data.nickname)
 
-    now = datetime.utcnow()
+def _with_session(user: UserResponse) -> UserResponse:
+    # Token firmato in locale (HMAC): nessuna chiamata all'Admin SDK
+    user.session_token, user.session_expires_at = create_session_token(user.uid)
+    return user
+
+
+def _new_profile_docs(
+    uid: str, nickname: str, tag: str, email: Optional[str], now: datetime
+) -> Tuple[dict, dict]:
     user_doc = {
         "uid": uid,
-        "nickname": data.nickname,
+        "nickname": nickname,
         "tag": tag,
-        "email": data.email,
+        "email": email,
         "avatar_url": None,
         "favorite_team": None,
         "status": "active",
         "created_at": now.isoformat(),
         "updated_at": now.isoformat(),
     }
-    db.collection("users").document(uid).set(user_doc)
-
     stats_doc = {
         "uid": uid,
         "total_matches": 0,
@@ -68,82 +116,196 @@ def register_with_email(data: RegisterWithEmailRequest) -> UserResponse:
         "draws": 0,
         "goals_scored": 0,
         "goals_conceded": 0,
+        "clean_sheets": 0,
+        "total_paid": 0,
+        "total_fines": 0,
+        "mvp_count": 0,
+        "lvp_count": 0,
         "last_match_at": None,
     }
-    db.collection("user_stats").document(uid).set(stats_doc)
+    return user_doc, stats_doc
 
-    return UserResponse(
-        uid=uid,
-        email=data.email,
-        nickname=data.nickname,
-        tag=tag,
-        created_at=now.isoformat(),
-    )
 
-def register_with_nickname(data: RegisterWithNicknameRequest) -> UserResponse:
-    if _nickname_tag_exists(db, data.nickname, data.tag):
-        raise ValueError(f"Il nickname '{data.nickname}#{data.tag}' è già in uso")
+def _write_profile(
+    transaction,
+    uid: str,
+    nickname: str,
+    tag: Optional[str],
+    email: Optional[str],
+    auth_email: str,
+    now: datetime,
+) -> dict:
+    # Tag, profilo, statistiche e handle vengono salvati nello stesso commit
+    tag = reserve_tag(transaction, nickname, tag)
+    user_doc, stats_doc = _new_profile_docs(uid, nickname, tag, email, now)
+    transaction.set(db.collection("users").document(uid), user_doc)
+    transaction.set(db.collection("user_stats").document(uid), stats_doc)
+    handle = handle_doc(uid, nickname, tag, email, auth_email, user_doc["created_at"], now)
+    create_handle(transaction, handle)
+    return handle
+
 
+def _create_account(
+    auth_email: str, password: str, nickname: str, tag: Optional[str], email: Optional[str]
+) -> UserResponse:
     user_record = firebase_auth.create_user(
-        email=f"{data.nickname}_{data.tag}@penaltyhub.local",
-        password=data.password,
-        display_name=data.nickname,
+        email=auth_email,
+        password=password,
+        display_name=nickname,
     )
     uid = user_record.uid
 
     now = datetime.utcnow()
-    user_doc = {
-        "uid": uid,
-        "nickname": data.nickname,
-        "tag": data.tag,
-        "email": None,
-        "avatar_url": None,
-        "favorite_team": None,
-        "status": "active",
-        "created_at": now.isoformat(),
-        "updated_at": now.isoformat(),
-    }
-    db.collection("users").document(uid).set(user_doc)
-
-    stats_doc = {
-        "uid": uid,
-        "total_matches": 0,
-        "wins": 0,
-        "losses": 0,
-        "draws": 0,
-        "goals_scored": 0,
-        "goals_conceded": 0,
-        "last_match_at": None,
-    }
-    db.collection("user_stats").document(uid).set(stats_doc)
+    try:
+        handle = run_transaction(db, _write_profile, uid, nickname, tag, email, auth_email, now)
+    except Exception as e:
+        # Nessun documento è stato scritto: si elimina anche l'account auth
+        firebase_auth.delete_user(uid)
+        if isinstance(e, AlreadyExists):
+            # Stesso handle con maiuscole/minuscole diverse
+            handle_name = f"{nickname}#{tag}" if tag else nickname
+            raise ValueError(f"Il nickname '{handle_name}' è già in uso")
+        raise
+    handle_index.apply([handle])
 
     return UserResponse(
         uid=uid,
-        email=None,
-        nickname=data.nickname,
-        tag=data.tag,
+        email=email,
+        nickname=nickname,
+        tag=handle["tag"],
         created_at=now.isoformat(),
     )
 
-def login_with_email(data: LoginWithEmailRequest) -> UserResponse:
-    try:
-        from firebase_admin import auth as firebase_auth_module
-        user_record = firebase_auth.get_user_by_email(data.email)
-        uid = user_record.uid
+def register_with_email(data: RegisterWithEmailRequest) -> UserResponse:
+    nickname = data.nickname or data.email.split("@")[0]
+    return _with_session(_create_account(data.email, data.password, nickname, data.tag, data.email))
+
+def register_with_nickname(data: RegisterWithNicknameRequest) -> UserResponse:
+    return _with_session(_create_account(
+        nickname_auth_email(data.nickname, data.tag),
+        data.password,
+        data.nickname,
+        data.tag,
+        None,
+    ))
+
+def register_batch(data: RegisterBatchRequest) -> RegisterBatchResponse:
+    errors: List[RegisterBatchError] = []
+
+    def _fail(index: int, req: RegisterWithNicknameRequest, detail: str) -> None:
+        errors.append(
+            RegisterBatchError(index=index, nickname=req.nickname, tag=req.tag, detail=detail)
+        )
 
+    # 1. Tag non validi e handle duplicati nella stessa richiesta: scartati
+    #    prima delle transazioni, che altrimenti fallirebbero per tutti
+    by_nickname: Dict[str, List[Tuple[int, RegisterWithNicknameRequest]]] = defaultdict(list)
+    seen = set()
+    for index, req in enumerate(data.users):
+        if not is_valid_tag(req.tag):
+            _fail(index, req, f"Tag non valido: '{req.tag}' (servono 4 cifre)")
+            continue
+        handle = normalize_handle(req.nickname, req.tag)
+        if handle in seen:
+            _fail(index, req, "Handle duplicato nella richiesta")
+            continue
+        seen.add(handle)
+        by_nickname[normalize_nickname(req.nickname)].append((index, req))
+
+    # 2. Prenotazione dei tag: una transazione per nickname normalizzato
+    reserved: List[Tuple[int, RegisterWithNicknameRequest]] = []
+    for nickname, items in by_nickname.items():
+        taken = set(run_transaction(db, reserve_tags, nickname, [req.tag for _, req in items]))
+        for index, req in items:
+            if req.tag in taken:
+                _fail(index, req, f"Il nickname '{req.nickname}#{req.tag}' è già in uso")
+            else:
+                reserved.append((index, req))
+
+    # 3. Handle già presenti nella directory con maiuscole diverse: un solo get_all
+    to_release: Dict[str, List[str]] = defaultdict(list)
+    if reserved:
+        refs = [handle_ref(normalize_handle(req.nickname, req.tag)) for _, req in reserved]
+        existing = {doc.id for doc in db.get_all(refs) if doc.exists}
+        available = []
+        for (index, req), ref in zip(reserved, refs):
+            if ref.id in existing:
+                _fail(index, req, f"Il nickname '{req.nickname}#{req.tag}' è già in uso")
+                to_release[req.nickname].append(req.tag)
+            else:
+                available.append((index, req))
+        reserved = available
+
+    # 4. Account Firebase Auth
+    created: List[Tuple[int, RegisterWithNicknameRequest, str]] = []
+    for index, req in reserved:
         try:
-            custom_token = firebase_auth.create_custom_token(uid)
-        except Exception:
-            pass
+            user_record = firebase_auth.create_user(
+                email=nickname_auth_email(req.nickname, req.tag),
+                password=req.password,
+                display_name=req.nickname,
+            )
+        except Exception as e:
+            _fail(index, req, str(e))
+            to_release[req.nickname].append(req.tag)
+            continue
+        created.append((index, req, user_record.uid))
 
+    # 5. Profili, statistiche e handle: un commit ogni _BATCH_USERS utenti
+    now = datetime.utcnow()
+    users: List[UserResponse] = []
+    for start in range(0, len(created), _BATCH_USERS):
+        chunk = created[start:start + _BATCH_USERS]
+        batch = db.batch()
+        handles = []
+        for _, req, uid in chunk:
+            user_doc, stats_doc = _new_profile_docs(uid, req.nickname, req.tag, None, now)
+            batch.set(db.collection("users").document(uid), user_doc)
+            batch.set(db.collection("user_stats").document(uid), stats_doc)
+            handles.append(handle_doc(
+                uid, req.nickname, req.tag, None,
+                nickname_auth_email(req.nickname, req.tag), user_doc["created_at"], now,
+            ))
+            create_handle(batch, handles[-1])
+        try:
+            batch.commit()
+        except Exception as e:
+            for index, req, uid in chunk:
+                firebase_auth.delete_user(uid)
+                _fail(index, req, str(e))
+                to_release[req.nickname].append(req.tag)
+            continue
+        handle_index.apply(handles)
+        users.extend(
+            UserResponse(
+                uid=uid,
+                email=None,
+                nickname=req.nickname,
+                tag=req.tag,
+                created_at=now.isoformat(),
+            )
+            for _, req, uid in chunk
+        )
+
+    for nickname, tags in to_release.items():
+        release_tags(nickname, tags)
+
+    errors.sort(key=lambda err: err.index)
+    return RegisterBatchResponse(users=users, errors=errors)
+
+def login_with_email(data: LoginWithEmailRequest) -> UserResponse:
+    try:
+        uid, display_name = _authenticate(data.email, data.password)
+    except AuthNotConfigured:
+        raise
     except Exception as e:
         raise ValueError(f"Email o password non validi: {str(e)}")
 
     doc = db.collection("users").document(uid).get()
 
     if not doc.exists:
-        nickname = user_record.display_name or "User"
-        tag = _generate_unique_tag_for_nickname(db, nickname)
+        nickname = display_name or "User"
+        tag = allocate_tag(nickname)
         now = datetime.utcnow()
         profile = {
             "uid": uid,
@@ -156,48 +318,65 @@ def login_with_email(data: LoginWithEmailRequest) -> UserResponse:
             "created_at": now.isoformat(),
             "updated_at": now.isoformat(),
         }
-        db.collection("users").document(uid).set(profile)
+        handle = handle_doc(uid, nickname, tag, data.email, data.email, profile["created_at"], now)
+        batch = db.batch()
+        batch.set(db.collection("users").document(uid), profile)
+        create_handle(batch, handle)
+        try:
+            batch.commit()
+            handle_index.apply([handle])
+        except AlreadyExists:
+            # Handle già preso con maiuscole diverse: il profilo si salva
+            # comunque, il login con nickname#tag non sarà disponibile
+            db.collection("users").document(uid).set(profile)
     else:
         profile = doc.to_dict()
 
-    return UserResponse(
+    return _with_session(UserResponse(
         uid=uid,
         email=profile.get("email"),
         nickname=profile.get("nickname"),
         tag=profile.get("tag"),
         created_at=profile.get("created_at"),
-    )
+    ))
 
-def login_with_nickname(data: LoginWithNicknameRequest) -> Optional[UserResponse]:
+def _legacy_handle(nickname: str, tag: str) -> Optional[dict]:
+    # Utenti senza documento in handles/: query su users come prima della directory
     q = (
         db.collection("users")
-        .where("nickname", "==", data.nickname)
-        .where("tag", "==", data.tag)
+        .where("nickname", "==", nickname)
+        .where("tag", "==", tag)
         .limit(1)
     )
     docs = list(q.stream())
     if not docs:
         return None
-
     profile = docs[0].to_dict()
-    uid = profile["uid"]
+    profile["auth_email"] = profile.get("email") or nickname_auth_email(nickname, tag)
+    return profile
+
+def login_with_nickname(data: LoginWithNicknameRequest) -> Optional[UserResponse]:
+    # Un solo get sulla directory degli handle (senza distinzione maiuscole/minuscole)
+    handle = get_handle(data.nickname, data.tag)
+    if handle is None and HANDLE_QUERY_FALLBACK:
+        handle = _legacy_handle(data.nickname, data.tag)
+    if handle is None:
+        return None
 
+    uid = handle["uid"]
     try:
-        user_record = firebase_auth.get_user(uid)
-        email = user_record.email
-
-        if email:
-            try:
-                custom_token = firebase_auth.create_custom_token(uid)
-            except Exception:
-                pass
+        auth_uid, _ = _authenticate(handle["auth_email"], data.password)
+        if auth_uid != uid:
+            raise ValueError("account non corrispondente")
+    except AuthNotConfigured:
+        raise
     except Exception as e:
         raise ValueError(f"Nickname/Tag o password non validi: {str(e)}")
 
-    return UserResponse(
-        uid=profile["uid"],
-        email=profile.get("email"),
-        nickname=profile["nickname"],
-        tag=profile["tag"],
-        created_at=profile.get("created_at"),
-    )
\ No newline at end of file
+    return _with_session(UserResponse(
+        uid=uid,
+        email=handle.get("email"),
+        nickname=handle["nickname"],
+        tag=handle["tag"],
+        created_at=handle.get("created_at"),
+    ))
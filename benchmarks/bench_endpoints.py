@@ -0,0 +1,494 @@
+"""
+Benchmark degli endpoint di main.py.
+
+Ogni scenario chiama una route attraverso un client ASGI in processo
+(httpx.ASGITransport), con il backend in memoria di local_store.py al posto
+di Firestore: niente rete, stessi dati a ogni esecuzione (seed fisso).
+Per ogni scenario vengono riportati throughput, latenza p50/p99 e numero
+medio di round trip al datastore per richiesta (get, query, commit, ...),
+cioè le chiamate che su Firestore sarebbero una RPC. Con il backend locale
+anche gli utenti di Firebase Auth stanno nel datastore: le loro chiamate
+(create_user, get_user_by_email, ...) rientrano nel conteggio.
+
+    python benchmarks/bench_endpoints.py [--requests 200] [--concurrency 8]
+                                         [--only get_user,list_matches]
+                                         [--output risultati.json]
+
+L'output è JSON: salvato per commit, due esecuzioni si confrontano campo
+per campo. Le cache in-process vengono svuotate all'inizio di ogni scenario.
+"""
+import os
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("FIREBASE_WARMUP", "0")
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+import fast_json
+from cache import all_cache_stats, get_cache
+from config import db
+from main import ADMIN_UIDS, app
+
+# (metodo, url, body json[, header])
+Call = Tuple[Any, ...]
+
+
+# ============================================================
+# Dati di partenza
+# ============================================================
+
+class Fixture:
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.users: List[Dict[str, Any]] = []
+        self.matches: List[str] = []
+        self.finished: List[str] = []
+
+    def user(self) -> Dict[str, Any]:
+        return self.rng.choice(self.users)
+
+    def match(self) -> str:
+        return self.rng.choice(self.matches)
+
+    def admin(self) -> Dict[str, str]:
+        # Il primo utente è amministratore (vedi seed)
+        return {"Authorization": f"Bearer {self.users[0]['session_token']}"}
+
+    def event(self, event_id: str, participants: int = 20) -> dict:
+        rng = self.rng
+        people = []
+        for i in range(participants):
+            user = self.users[i % len(self.users)]
+            people.append({
+                "id": f"p{i}",
+                "userId": user["uid"] if i < len(self.users) else None,
+                "name": f"{user['nickname']}{i}",
+                "arrivalTime": f"20:{rng.randint(0, 40):02d}",
+                "goals": rng.randint(0, 3),
+                "nutmegs": rng.randint(0, 2),
+                "yellowCards": rng.randint(0, 1),
+                "forgotKit": rng.random() < 0.1,
+                "team": "A" if i % 2 == 0 else "B",
+            })
+        return {
+            "id": event_id,
+            "totalCost": 120,
+            "participants": people,
+            "scoreA": rng.randint(0, 6),
+            "scoreB": rng.randint(0, 6),
+            "votes": [
+                {"voterId": p["id"], "mvpId": people[0]["name"], "lvpId": people[1]["name"]}
+                for p in people[:5]
+            ],
+        }
+
+
+GLOBAL_RULES = [
+    {"id": "late", "variable": "arrival_time", "operator": ">", "value": "20:15",
+     "action": "add_fixed", "actionValue": 0.5},
+    {"id": "kit", "variable": "forgot_kit", "operator": "==", "value": "true",
+     "action": "add_fixed", "actionValue": 2},
+    {"id": "yellow", "variable": "yellow_cards", "operator": ">", "value": 0,
+     "action": "multiply_quota", "actionValue": 1.5},
+]
+
+
+SEED_EMAIL_USERS = 20
+
+
+async def seed(client: httpx.AsyncClient, fx: Fixture, users: int, matches: int, finished: int) -> None:
+    for i in range(SEED_EMAIL_USERS):
+        r = await client.post("/auth/register/email", json={
+            "email": f"seed{i}@penaltyhub.it", "password": "benchmark",
+        })
+        r.raise_for_status()
+
+    for start in range(0, users, 100):
+        batch = [
+            {"nickname": f"player{i % 50:02d}", "tag": f"{i:04d}", "password": "benchmark"}
+            for i in range(start, min(start + 100, users))
+        ]
+        r = await client.post("/auth/register/batch", json={"users": batch})
+        r.raise_for_status()
+        fx.users.extend(r.json()["users"])
+
+    # Token di sessione per le route autenticate
+    for user in fx.users:
+        r = await client.post("/auth/login/nickname", json={
+            "nickname": user["nickname"], "tag": user["tag"], "password": "benchmark",
+        })
+        r.raise_for_status()
+        user["session_token"] = r.json()["session_token"]
+    # Il primo utente usa le route riservate agli amministratori
+    ADMIN_UIDS.add(fx.users[0]["uid"])
+
+    for i in range(matches + finished):
+        r = await client.post("/matches", json={
+            "home_team": f"Squadra {i % 20}",
+            "away_team": f"Squadra {(i + 3) % 20}",
+            "start_time": f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}T20:{i % 60:02d}:00",
+            "league": ("Serie A", "Serie B", "Calcetto")[i % 3],
+        })
+        r.raise_for_status()
+        match_id = r.json()["match_id"]
+        if i < matches:
+            fx.matches.append(match_id)
+        else:
+            r = await client.put(f"/matches/{match_id}/score", json={
+                "home_score": i % 4, "away_score": i % 3, "status": "finished",
+            }, headers=fx.admin())
+            r.raise_for_status()
+            fx.finished.append(match_id)
+
+    # Storico: ogni utente ha giocato una partita, così è in classifica
+    for start in range(0, len(fx.users), 10):
+        r = await client.post("/matches", json={
+            "home_team": "Storico A", "away_team": "Storico B",
+            "start_time": f"2025-01-01T{start // 10 % 24:02d}:00:00", "league": "Storico",
+        })
+        r.raise_for_status()
+        match_id = r.json()["match_id"]
+        r = await client.put(f"/matches/{match_id}/score", json={
+            "home_score": start % 4, "away_score": start % 3, "status": "finished",
+        }, headers=fx.admin())
+        r.raise_for_status()
+        players = [
+            {"uid": user["uid"], "team": ("home", "away")[k % 2], "goals": k % 3}
+            for k, user in enumerate(fx.users[start:start + 10])
+        ]
+        r = await client.post(f"/matches/{match_id}/settle", json={"players": players}, headers=fx.admin())
+        r.raise_for_status()
+
+
+# ============================================================
+# Scenari: nome -> (numero di richieste relativo, generatore della chiamata)
+# ============================================================
+
+def _register_email(i: int, fx: Fixture) -> Call:
+    return "POST", "/auth/register/email", {"email": f"bench{i}@penaltyhub.it", "password": "benchmark"}
+
+
+def _register_nickname(i: int, fx: Fixture) -> Call:
+    return "POST", "/auth/register/nickname", {
+        "nickname": f"solo{i % 50:02d}", "tag": f"{i:04d}", "password": "benchmark",
+    }
+
+
+def _register_batch(i: int, fx: Fixture) -> Call:
+    users = [
+        {"nickname": f"club{i:03d}", "tag": f"{j:04d}", "password": "benchmark"} for j in range(10)
+    ]
+    return "POST", "/auth/register/batch", {"users": users}
+
+
+def _login_email(i: int, fx: Fixture) -> Call:
+    return "POST", "/auth/login/email", {
+        "email": f"seed{i % SEED_EMAIL_USERS}@penaltyhub.it", "password": "benchmark",
+    }
+
+
+def _login_nickname(i: int, fx: Fixture) -> Call:
+    user = fx.user()
+    return "POST", "/auth/login/nickname", {
+        "nickname": user["nickname"], "tag": user["tag"], "password": "benchmark",
+    }
+
+
+def _get_user(i: int, fx: Fixture) -> Call:
+    return "GET", f"/users/{fx.user()['uid']}", None
+
+
+def _update_user(i: int, fx: Fixture) -> Call:
+    user = fx.user()
+    return "PUT", f"/users/{user['uid']}", {"status": ("active", "away")[i % 2]}, {
+        "Authorization": f"Bearer {user['session_token']}",
+    }
+
+
+def _get_stats(i: int, fx: Fixture) -> Call:
+    return "GET", f"/users/{fx.user()['uid']}/stats", None
+
+
+def _create_match(i: int, fx: Fixture) -> Call:
+    return "POST", "/matches", {
+        "home_team": "Bench A", "away_team": "Bench B",
+        "start_time": f"2027-01-01T{i % 24:02d}:00:00", "league": "Bench",
+    }
+
+
+def _get_match(i: int, fx: Fixture) -> Call:
+    return "GET", f"/matches/{fx.match()}", None
+
+
+def _get_hot_match(i: int, fx: Fixture) -> Call:
+    # Tutti sulla stessa partita (diretta): le letture concorrenti si uniscono
+    return "GET", f"/matches/{fx.matches[0]}", None
+
+
+def _update_score(i: int, fx: Fixture) -> Call:
+    return "PUT", f"/matches/{fx.match()}/score", {
+        "home_score": i % 5, "away_score": i % 4, "status": "live",
+    }, fx.admin()
+
+
+def _list_matches(i: int, fx: Fixture) -> Call:
+    return "GET", "/matches?limit=50&league=Serie%20A", None
+
+
+def _list_matches_ndjson(i: int, fx: Fixture) -> Call:
+    return "GET", "/matches?format=ndjson&status=scheduled", None
+
+
+def _settle_match(i: int, fx: Fixture) -> Call:
+    players = [
+        {"uid": user["uid"], "team": ("home", "away")[k % 2], "goals": k % 3}
+        for k, user in enumerate(fx.users[:10])
+    ]
+    return "POST", f"/matches/{fx.finished[i]}/settle", {"players": players}, fx.admin()
+
+
+def _settle_event(i: int, fx: Fixture) -> Call:
+    return "POST", f"/events/bench-{i}/settle", {
+        "event": fx.event(f"bench-{i}"), "global_rules": GLOBAL_RULES,
+    }
+
+
+def _settle_events_batch(i: int, fx: Fixture) -> Call:
+    events = [fx.event(f"batch-{i}-{k}") for k in range(50)]
+    return "POST", "/events/settle/batch", {"events": events, "global_rules": GLOBAL_RULES}
+
+
+def _finalize_event(i: int, fx: Fixture) -> Call:
+    return "POST", f"/events/final-{i}/finalize", {
+        "event": fx.event(f"final-{i}"), "global_rules": GLOBAL_RULES,
+    }, fx.admin()
+
+
+def _balance_teams(i: int, fx: Fixture) -> Call:
+    players = [
+        {"id": u["uid"], "name": u["nickname"], "uid": u["uid"],
+         "roles": [("Portiere", "Difensore", "Attaccante", "Universale")[k % 4]]}
+        for k, u in enumerate(fx.rng.sample(fx.users, 12))
+    ]
+    return "POST", "/teams/balance", {"players": players, "time_budget_ms": 5}
+
+
+def _bet(i: int, fx: Fixture, user: Dict[str, Any]) -> Dict[str, Any]:
+    bet_type, prediction = (("1X2", "1"), ("over_under", "over_2.5"), ("both_teams_score", "yes"))[i % 3]
+    return {
+        "match_id": fx.match(), "uid": user["uid"],
+        "bet_type": bet_type, "prediction": prediction, "stake": 5,
+    }
+
+
+def _place_bet(i: int, fx: Fixture) -> Call:
+    user = fx.user()
+    return "POST", "/bets", _bet(i, fx, user), {
+        "Authorization": f"Bearer {user['session_token']}",
+    }
+
+
+def _place_bets_batch(i: int, fx: Fixture) -> Call:
+    user = fx.user()
+    return "POST", "/bets/batch", {"bets": [_bet(i + k, fx, user) for k in range(50)]}, {
+        "Authorization": f"Bearer {user['session_token']}",
+    }
+
+
+def _list_user_bets(i: int, fx: Fixture) -> Call:
+    user = fx.user()
+    return "GET", f"/users/{user['uid']}/bets?limit=50", None, {
+        "Authorization": f"Bearer {user['session_token']}",
+    }
+
+
+def _append_match_events(i: int, fx: Fixture) -> Call:
+    kind = ("goal", "shot", "corner", "nutmeg", "yellow_card")[i % 5]
+    return "POST", f"/matches/{fx.match()}/events", {
+        "events": [{"type": kind, "team": ("home", "away")[i % 2], "minute": i % 90}],
+    }, fx.admin()
+
+
+def _poll_match_events(i: int, fx: Fixture) -> Call:
+    return "GET", f"/matches/{fx.match()}/events?limit={50 + i % 3}", None
+
+
+def _leaderboard(i: int, fx: Fixture) -> Call:
+    metric = ("wins", "goals_scored", "clean_sheets", "win_rate")[i % 4]
+    return "GET", f"/leaderboard?metric={metric}&limit=50", None
+
+
+def _user_rank(i: int, fx: Fixture) -> Call:
+    return "GET", f"/users/{fx.user()['uid']}/rank?metric=goals_scored", None
+
+
+def _search_users(i: int, fx: Fixture) -> Call:
+    prefix = ("p", "pl", "play", "player1", "Player0")[i % 5]
+    return "GET", f"/users/search?prefix={prefix}&limit=10", None
+
+
+def _health(i: int, fx: Fixture) -> Call:
+    return "GET", "/health", None
+
+
+# Le registrazioni pagano l'hash della password: meno richieste
+SCENARIOS: Dict[str, Tuple[float, Callable[[int, Fixture], Call]]] = {
+    "register_email": (0.25, _register_email),
+    "register_nickname": (0.25, _register_nickname),
+    "register_batch": (0.05, _register_batch),
+    "login_email": (1, _login_email),
+    "login_nickname": (1, _login_nickname),
+    "get_user": (1, _get_user),
+    "update_user": (1, _update_user),
+    "get_stats": (1, _get_stats),
+    "create_match": (1, _create_match),
+    "get_match": (1, _get_match),
+    "get_hot_match": (1, _get_hot_match),
+    "update_score": (1, _update_score),
+    "list_matches": (1, _list_matches),
+    "list_matches_ndjson": (0.25, _list_matches_ndjson),
+    "settle_match": (1, _settle_match),
+    "settle_event": (1, _settle_event),
+    "settle_events_batch": (0.25, _settle_events_batch),
+    "finalize_event": (1, _finalize_event),
+    "balance_teams": (0.5, _balance_teams),
+    "place_bet": (1, _place_bet),
+    "place_bets_batch": (0.25, _place_bets_batch),
+    "list_user_bets": (0.5, _list_user_bets),
+    "append_match_events": (1, _append_match_events),
+    "poll_match_events": (1, _poll_match_events),
+    "leaderboard": (1, _leaderboard),
+    "user_rank": (1, _user_rank),
+    "search_users": (1, _search_users),
+    "health": (1, _health),
+}
+
+
+# ============================================================
+# Esecuzione
+# ============================================================
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, fx: Fixture, factory: Callable[[int, Fixture], Call],
+    requests: int, concurrency: int,
+) -> Dict[str, Any]:
+    calls = [factory(i, fx) for i in range(requests)]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    next_call = iter(calls)
+
+    async def worker() -> None:
+        for method, url, body, *headers in next_call:
+            t0 = time.perf_counter()
+            r = await client.request(method, url, json=body, headers=headers[0] if headers else None)
+            await r.aread()
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if r.status_code >= 400:
+                errors[str(r.status_code)] = errors.get(str(r.status_code), 0) + 1
+
+    for name in all_cache_stats():
+        get_cache(name).clear()
+    db.reset_round_trips()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    round_trips = db.round_trips()
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "round_trips_per_request": round(sum(round_trips.values()) / requests, 2),
+        "round_trips_by_kind": {k: round(v / requests, 2) for k, v in sorted(round_trips.items())},
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    selected = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Scenari sconosciuti: {', '.join(unknown)}")
+
+    random.seed(args.seed)  # tag casuali di tag_service
+    fx = Fixture(args.seed)
+    results: Dict[str, Any] = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await seed(client, fx, args.users, args.matches, max(1, args.requests))
+            for name in selected:
+                factor, factory = SCENARIOS[name]
+                requests = max(1, int(args.requests * factor))
+                results[name] = await run_scenario(client, fx, factory, requests, args.concurrency)
+                print(f"{name}: {results[name]['throughput_rps']} req/s", file=sys.stderr)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "backend": "memory",
+            "fast_json": fast_json.FAST_JSON,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "matches": args.matches,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--matches", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", default="")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Micro-benchmark della serializzazione delle liste di partite.
+
+Confronta, su liste di partite di varie dimensioni, il percorso standard
+di FastAPI (response_model / jsonable_encoder + encoder json della libreria
+standard) con il percorso veloce di fast_json.respond (orjson, nessuna
+seconda validazione). Le richieste passano per l'app ASGI in processo.
+
+    python benchmarks/bench_serialization.py [--sizes 100,1000,5000] [--repeat 30]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+from fastapi import FastAPI
+
+import fast_json
+from models import Match, MatchResponse
+
+
+def _matches(n: int) -> List[Match]:
+    return [
+        Match(
+            match_id=f"m{i:06d}",
+            home_team=f"Squadra {i % 40}",
+            away_team=f"Squadra {(i + 7) % 40}",
+            start_time=f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}T20:00:00",
+            status=("scheduled", "live", "finished")[i % 3],
+            home_score=i % 5,
+            away_score=i % 3,
+            players=[f"uid{j}" for j in range(10)],
+            league="Serie A",
+            created_at="2026-01-01T00:00:00",
+            updated_at="2026-01-01T00:00:00",
+        )
+        for i in range(n)
+    ]
+
+
+def _build_app(matches: List[Match]) -> FastAPI:
+    app = FastAPI()
+
+    # Come GET /matches: dict senza response_model (jsonable_encoder)
+    @app.get("/standard/page")
+    async def standard_page():
+        return {"matches": matches, "next_cursor": None}
+
+    # Lista tipizzata: validazione del response_model
+    @app.get("/standard/typed", response_model=List[MatchResponse])
+    async def standard_typed():
+        return matches
+
+    @app.get("/fast/page")
+    async def fast_page():
+        return fast_json.ORJSONResponse({"matches": matches, "next_cursor": None})
+
+    @app.get("/fast/typed")
+    async def fast_typed():
+        return fast_json.ORJSONResponse(
+            [fast_json._as_response_model(m, MatchResponse) for m in matches]
+        )
+
+    return app
+
+
+async def _time(client: httpx.AsyncClient, path: str, repeat: int) -> List[float]:
+    await client.get(path)  # warm-up
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        r = await client.get(path)
+        r.raise_for_status()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+async def run(sizes: List[int], repeat: int) -> dict:
+    results = {}
+    for n in sizes:
+        app = _build_app(_matches(n))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Stesso contenuto nei due percorsi
+            for kind in ("page", "typed"):
+                a = (await client.get(f"/standard/{kind}")).json()
+                b = (await client.get(f"/fast/{kind}")).json()
+                assert a == b, f"Output diverso per {kind}"
+            for kind in ("page", "typed"):
+                std = statistics.median(await _time(client, f"/standard/{kind}", repeat))
+                fast = statistics.median(await _time(client, f"/fast/{kind}", repeat))
+                results[f"{kind}_{n}"] = {
+                    "standard_ms": round(std, 3),
+                    "fast_ms": round(fast, 3),
+                    "speedup": round(std / fast, 2),
+                }
+    return results
+
+
+def main() -> None:
+    if fast_json.orjson is None:
+        sys.exit("Serve il pacchetto orjson")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,5000")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    print(json.dumps(asyncio.run(run(sizes, args.repeat)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
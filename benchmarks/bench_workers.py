@@ -0,0 +1,245 @@
+"""
+Benchmark della modalità multi-worker (gunicorn.conf.py).
+
+Per ogni numero di worker avvia `gunicorn main:app -c gunicorn.conf.py`
+su una porta locale (backend in memoria, un datastore per worker;
+BENCH_LOCAL_WORKERS=1 toglie il limite di un solo worker dei backend
+locali) e lo satura con richieste HTTP reali da un client asincrono.
+Gli scenari non dipendono da dati condivisi tra i worker:
+
+- health: overhead di framework e server, quasi nessun lavoro;
+- balance_teams: bilanciamento di 16 giocatori con skill nel body, solo
+  CPU (pool di processi di compute.py);
+- settle_event: calcolo delle quote di un evento inviato nel body.
+
+Per ogni scenario vengono riportati throughput, latenza p50/p99 e lo
+speedup rispetto alla prima configurazione. Su una macchina con N core lo
+speedup atteso cresce fino a circa N worker.
+
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--requests 400]
+                                       [--concurrency 32] [--only balance_teams]
+                                       [--output risultati.json]
+"""
+import os
+import argparse
+import asyncio
+import json
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+Call = Tuple[str, str, Optional[dict]]
+
+
+# ============================================================
+# Scenari
+# ============================================================
+
+def _health(i: int) -> Call:
+    return "GET", "/health", None
+
+
+def _balance_teams(i: int) -> Call:
+    players = [
+        {"id": f"p{k}", "name": f"Giocatore {k}", "skill": float((k * 7 + i) % 10 + 1),
+         "roles": [("Portiere", "Difensore", "Attaccante", "Universale")[k % 4]]}
+        for k in range(16)
+    ]
+    return "POST", "/teams/balance", {"players": players, "splits": 3, "time_budget_ms": 20}
+
+
+_LATE_RULE = {"id": "late", "variable": "arrival_time", "operator": ">", "value": "20:15",
+              "action": "add_fixed", "actionValue": 0.5}
+
+
+def _settle_event(i: int) -> Call:
+    participants = [
+        {"id": f"p{k}", "name": f"Giocatore {k}", "arrivalTime": f"20:{(k * 3 + i) % 40:02d}",
+         "goals": k % 3, "yellowCards": k % 2, "team": "A" if k % 2 == 0 else "B"}
+        for k in range(20)
+    ]
+    event = {
+        "id": f"bench-{i}", "totalCost": 120, "participants": participants, "scoreA": i % 5, "scoreB": 2,
+        "votes": [{"voterId": f"p{k}", "mvpId": "Giocatore 0", "lvpId": "Giocatore 1"} for k in range(5)],
+    }
+    return "POST", f"/events/bench-{i}/settle", {"event": event, "global_rules": [_LATE_RULE]}
+
+
+SCENARIOS: Dict[str, Callable[[int], Call]] = {
+    "health": _health,
+    "balance_teams": _balance_teams,
+    "settle_event": _settle_event,
+}
+
+
+# ============================================================
+# Server e carico
+# ============================================================
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(workers: int, port: int, log: Any) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": "memory",
+        "FIREBASE_WARMUP": "0",
+        "WEB_CONCURRENCY": str(workers),
+        "BENCH_LOCAL_WORKERS": "1",
+        "PORT": str(port),
+        "LOG_LEVEL": "warning",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+
+
+async def _wait_ready(client: httpx.AsyncClient, server: subprocess.Popen, workers: int, log: Any) -> None:
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            log.seek(0)
+            raise SystemExit(f"gunicorn terminato: {log.read().decode()[-2000:]}")
+        try:
+            r = await client.get("/health")
+            if r.status_code == 200:
+                break
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    else:
+        raise SystemExit("gunicorn non ha risposto entro 60 secondi")
+    # Gli altri worker e i pool di processi finiscono di avviarsi
+    await asyncio.sleep(1 + workers * 0.5)
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, factory: Callable[[int], Call], requests: int, concurrency: int,
+) -> Dict[str, Any]:
+    # Riscaldamento: una richiesta per slot di concorrenza, non misurata
+    await asyncio.gather(*(client.request(m, u, json=b) for m, u, b in (factory(i) for i in range(concurrency))))
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    next_call = iter([factory(i) for i in range(requests)])
+
+    async def worker() -> None:
+        for method, url, body in next_call:
+            t0 = time.perf_counter()
+            r = await client.request(method, url, json=body)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if r.status_code >= 400:
+                errors[str(r.status_code)] = errors.get(str(r.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+    }
+
+
+async def run_workers(workers: int, selected: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    port = _free_port()
+    log = tempfile.TemporaryFile()
+    server = _start_server(workers, port, log)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            await _wait_ready(client, server, workers, log)
+            results = {}
+            for name in selected:
+                results[name] = await run_scenario(client, SCENARIOS[name], args.requests, args.concurrency)
+                print(f"workers={workers} {name}: {results[name]['throughput_rps']} req/s", file=sys.stderr)
+            return results
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    selected = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Scenari sconosciuti: {', '.join(unknown)}")
+    worker_counts = [int(n) for n in args.workers.split(",")]
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for workers in worker_counts:
+        results[str(workers)] = await run_workers(workers, selected, args)
+
+    baseline = results[str(worker_counts[0])]
+    for by_scenario in results.values():
+        for name, result in by_scenario.items():
+            base = baseline[name]["throughput_rps"]
+            result["speedup"] = round(result["throughput_rps"] / base, 2) if base else None
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "backend": "memory",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--only", default="")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
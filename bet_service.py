@@ -0,0 +1,274 @@
+import os
+import json
+import base64
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud.firestore_v1 import Query
+
+from config import db
+from datastore import run_transaction
+from models import BetCreateRequest, BetResponse, BetSettlementResponse
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# 1. Piazzamento delle scommesse
+# ============================================================
+# Ogni scommessa è un documento bets/{bet_id}. Il piazzamento legge la
+# partita nella stessa transazione che crea le scommesse: se la partita
+# viene chiusa in contemporanea, la transazione viene ripetuta e vede lo
+# stato "finished", quindi nessuna scommessa può arrivare dopo che il
+# regolamento ha letto quelle in sospeso.
+
+BET_PAGE_SIZE = 500
+
+_OPEN_STATUSES = ("scheduled", "live")
+
+
+def _parse_line(prediction: str) -> Tuple[str, float]:
+    side, _, line = prediction.partition("_")
+    if side not in ("over", "under"):
+        raise ValueError(f"Pronostico over/under non valido: {prediction}")
+    try:
+        value = float(line)
+    except ValueError:
+        raise ValueError(f"Linea over/under non valida: {prediction}")
+    if value < 0:
+        raise ValueError(f"Linea over/under non valida: {prediction}")
+    return side, value
+
+
+def validate_prediction(bet_type: str, prediction: str) -> None:
+    if bet_type == "1X2":
+        if prediction not in ("1", "X", "2"):
+            raise ValueError(f"Pronostico 1X2 non valido: {prediction}")
+    elif bet_type == "over_under":
+        _parse_line(prediction)
+    elif bet_type == "both_teams_score":
+        if prediction not in ("yes", "no"):
+            raise ValueError(f"Pronostico both_teams_score non valido: {prediction}")
+    else:
+        raise ValueError(f"Tipo di scommessa non valido: {bet_type}")
+
+
+def bet_outcome(bet_type: str, prediction: str, home_score: int, away_score: int) -> str:
+    """won, lost oppure void (linea over/under esattamente uguale ai gol, o pronostico illeggibile)."""
+    try:
+        validate_prediction(bet_type, prediction)
+    except ValueError:
+        return "void"
+    if bet_type == "1X2":
+        result = "1" if home_score > away_score else "2" if home_score < away_score else "X"
+        return "won" if prediction == result else "lost"
+    if bet_type == "over_under":
+        side, line = _parse_line(prediction)
+        total = home_score + away_score
+        if total == line:
+            return "void"
+        return "won" if (total > line) == (side == "over") else "lost"
+    both_scored = home_score > 0 and away_score > 0
+    return "won" if both_scored == (prediction == "yes") else "lost"
+
+
+def _place_bets_transaction(transaction: Any, bets: List[BetCreateRequest]) -> List[BetResponse]:
+    match_ids = list(dict.fromkeys(bet.match_id for bet in bets))
+    refs = [db.collection("matches").document(match_id) for match_id in match_ids]
+    # Una sola lettura per tutte le partite coinvolte (prima delle scritture)
+    for snapshot in db.get_all(refs, transaction=transaction):
+        if not snapshot.exists:
+            raise ValueError(f"Partita {snapshot.id} non trovata")
+        status = snapshot.get("status")
+        if status not in _OPEN_STATUSES:
+            raise ValueError(f"La partita {snapshot.id} non accetta scommesse (stato: {status})")
+
+    created_at = datetime.utcnow().isoformat()
+    placed = []
+    for bet in bets:
+        doc_ref = db.collection("bets").document()
+        bet_data = {
+            "bet_id": doc_ref.id,
+            "match_id": bet.match_id,
+            "uid": bet.uid,
+            "bet_type": bet.bet_type,
+            "prediction": bet.prediction,
+            "stake": bet.stake,
+            "status": "pending",
+            "created_at": created_at,
+            "settled_at": None,
+        }
+        transaction.create(doc_ref, bet_data)
+        placed.append(BetResponse(**bet_data))
+    return placed
+
+
+def place_bets(bets: List[BetCreateRequest]) -> List[BetResponse]:
+    """
+    Piazza fino a 500 scommesse con un solo commit: o vengono create
+    tutte o nessuna (partita inesistente o già chiusa, pronostico non valido).
+    """
+    if len(bets) > BET_PAGE_SIZE:
+        raise ValueError(f"Massimo {BET_PAGE_SIZE} scommesse per richiesta")
+    for bet in bets:
+        validate_prediction(bet.bet_type, bet.prediction)
+    return run_transaction(db, _place_bets_transaction, bets)
+
+
+def place_bet(bet: BetCreateRequest) -> BetResponse:
+    return place_bets([bet])[0]
+
+
+# ============================================================
+# 2. Letture per utente e per partita (paginazione a cursore)
+# ============================================================
+
+def encode_bet_cursor(bet: BetResponse) -> str:
+    raw = json.dumps([bet.created_at, bet.bet_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_bet_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        created_at, bet_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Cursore non valido")
+    return {"created_at": created_at, "bet_id": bet_id}
+
+
+def _list_bets(
+    field: str,
+    value: str,
+    status: Optional[str],
+    limit: int,
+    start_after: Optional[str],
+) -> Tuple[List[BetResponse], Optional[str]]:
+    query = db.collection("bets").where(field, "==", value)
+    if status:
+        query = query.where("status", "==", status)
+    # Le più recenti per prime
+    query = query.order_by("created_at", direction=Query.DESCENDING).order_by(
+        "bet_id", direction=Query.DESCENDING
+    )
+    if start_after:
+        query = query.start_after(decode_bet_cursor(start_after))
+
+    bets = [BetResponse(**doc.to_dict()) for doc in query.limit(limit + 1).stream()]
+    if len(bets) > limit:
+        bets = bets[:limit]
+        return bets, encode_bet_cursor(bets[-1])
+    return bets, None
+
+
+def list_bets_by_user(
+    uid: str,
+    status: Optional[str] = None,
+    limit: int = 50,
+    start_after: Optional[str] = None,
+) -> Tuple[List[BetResponse], Optional[str]]:
+    return _list_bets("uid", uid, status, limit, start_after)
+
+
+def list_bets_by_match(
+    match_id: str,
+    status: Optional[str] = None,
+    limit: int = 50,
+    start_after: Optional[str] = None,
+) -> Tuple[List[BetResponse], Optional[str]]:
+    return _list_bets("match_id", match_id, status, limit, start_after)
+
+
+# ============================================================
+# 3. Regolamento a fine partita
+# ============================================================
+# Le scommesse in sospeso vengono lette a pagine di 500 (ordinate per
+# bet_id, con cursore) e ogni pagina diventa un solo batch di update:
+# 10k scommesse sono 20 query e 20 commit, non 10k scritture. Il job gira
+# in un pool separato da quello delle richieste; rieseguirlo è sicuro
+# perché tocca solo le scommesse ancora "pending".
+
+BET_SETTLEMENT_WORKERS = int(os.getenv("BET_SETTLEMENT_WORKERS", "2"))
+
+_settlement_executor: Optional[ThreadPoolExecutor] = None
+
+
+def settle_match_bets(match_id: str, home_score: int, away_score: int) -> BetSettlementResponse:
+    result = BetSettlementResponse(match_id=match_id)
+    query = (
+        db.collection("bets")
+        .where("match_id", "==", match_id)
+        .where("status", "==", "pending")
+        .order_by("bet_id")
+    )
+    last_bet_id = None
+    while True:
+        page = query
+        if last_bet_id is not None:
+            page = page.start_after({"bet_id": last_bet_id})
+        docs = list(page.limit(BET_PAGE_SIZE).stream())
+        if not docs:
+            return result
+
+        settled_at = datetime.utcnow().isoformat()
+        batch = db.batch()
+        for doc in docs:
+            data = doc.to_dict()
+            outcome = bet_outcome(data.get("bet_type"), data.get("prediction"), home_score, away_score)
+            batch.update(doc.reference, {"status": outcome, "settled_at": settled_at})
+            setattr(result, outcome, getattr(result, outcome) + 1)
+        batch.commit()
+        result.settled += len(docs)
+
+        if len(docs) < BET_PAGE_SIZE:
+            return result
+        last_bet_id = docs[-1].id
+
+
+def settle_finished_match_bets(match_id: str) -> Optional[BetSettlementResponse]:
+    """
+    Regolamento sincrono (es. dopo un riavvio che ha interrotto il job):
+    usa il risultato salvato della partita, che deve essere finita.
+    """
+    doc = db.collection("matches").document(match_id).get()
+    if not doc.exists:
+        return None
+    match = doc.to_dict()
+    if match.get("status") != "finished":
+        raise ValueError(f"La partita {match_id} non è ancora finita")
+    return settle_match_bets(match_id, match.get("home_score", 0), match.get("away_score", 0))
+
+
+def _get_settlement_executor() -> ThreadPoolExecutor:
+    global _settlement_executor
+    if _settlement_executor is None:
+        _settlement_executor = ThreadPoolExecutor(
+            max_workers=BET_SETTLEMENT_WORKERS,
+            thread_name_prefix="bet-settlement",
+        )
+    return _settlement_executor
+
+
+def _log_settlement(future: "Future[BetSettlementResponse]") -> None:
+    error = future.exception()
+    if error is not None:
+        logger.error("Regolamento delle scommesse fallito", exc_info=error)
+
+
+def schedule_bet_settlement(match_id: str, home_score: int, away_score: int) -> "Future[BetSettlementResponse]":
+    """
+    Avvia il regolamento in background e ritorna subito: la richiesta che
+    ha chiuso la partita non aspetta le scritture sulle scommesse.
+    """
+    future = _get_settlement_executor().submit(settle_match_bets, match_id, home_score, away_score)
+    future.add_done_callback(_log_settlement)
+    return future
+
+
+def shutdown_settlement_executor() -> None:
+    # wait=True: i regolamenti già avviati vengono completati
+    global _settlement_executor
+    if _settlement_executor is not None:
+        _settlement_executor.shutdown(wait=True)
+        _settlement_executor = None
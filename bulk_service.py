@@ -0,0 +1,468 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+
+from google.api_core import exceptions as api_exceptions
+from pydantic import BaseModel
+
+from cache import get_cache
+from config import db
+from handle_service import (
+    handle_doc,
+    handle_index,
+    handle_ref,
+    nickname_auth_email,
+    normalize_handle,
+    normalize_nickname,
+    retire_handle,
+)
+from leaderboard_service import leaderboard
+from metrics import unwrap
+from models import BulkImportError, BulkImportResponse, Match, MatchStats, UserResponse, UserStats
+from tag_service import reset_reservation
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# 1. Collection esportabili e importabili
+# ============================================================
+# Per ogni collection: campo che coincide con l'id del documento (usato
+# anche per l'ordinamento dell'export), modello Pydantic con cui validare
+# le righe importate, cache in-process da svuotare e indice in memoria da
+# riallineare dopo un import. match_stats non include la sottocollection
+# degli eventi. Gli utenti importati ricevono anche handle e tag
+# prenotato (vedi _user_writes).
+
+class _Spec:
+    def __init__(
+        self,
+        key: str,
+        model: Type[BaseModel],
+        cache: Optional[str] = None,
+        drop: Tuple[str, ...] = (),
+        refresh: Optional[Callable[[], Any]] = None,
+    ):
+        self.key = key
+        self.model = model
+        self.cache = cache
+        self.drop = drop  # campi delle risposte API che non vanno salvati
+        self.refresh = refresh
+
+
+BULK_COLLECTIONS: Dict[str, _Spec] = {
+    "users": _Spec("uid", UserResponse, "user_profiles", drop=("session_token", "session_expires_at"),
+                   refresh=handle_index.refresh),
+    "user_stats": _Spec("uid", UserStats, "user_stats", refresh=leaderboard.rebuild),
+    "matches": _Spec("match_id", Match),
+    "match_stats": _Spec("match_id", MatchStats),
+}
+
+BULK_PAGE_SIZE = 500
+# Thread che inviano i batch in parallelo (e modalità parallela del BulkWriter)
+BULK_PARALLELISM = int(os.getenv("BULK_PARALLELISM", "8"))
+# Tentativi per scrittura (BulkWriter) o per batch (fallback) prima di rinunciare
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "5"))
+# Ritmo iniziale del BulkWriter: parte da qui e sale gradualmente (regola 500/50/5)
+BULK_OPS_PER_SECOND = int(os.getenv("BULK_OPS_PER_SECOND", "500"))
+BULK_MAX_OPS_PER_SECOND = int(os.getenv("BULK_MAX_OPS_PER_SECOND", "10000"))
+# Errori riportati nel risultato dell'import (gli altri vengono solo contati)
+BULK_MAX_ERRORS = 100
+
+# Errori per cui ha senso ripetere il commit di un batch
+_TRANSIENT_ERRORS = (
+    api_exceptions.Aborted,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.ServiceUnavailable,
+)
+
+
+def _spec(collection: str) -> _Spec:
+    spec = BULK_COLLECTIONS.get(collection)
+    if spec is None:
+        raise ValueError(f"Collection non supportata: {collection} (valide: {', '.join(BULK_COLLECTIONS)})")
+    return spec
+
+
+def _json_default(obj: Any) -> Any:
+    # Timestamp di Firestore (DatetimeWithNanoseconds) e date
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Tipo non serializzabile: {type(obj).__name__}")
+
+
+def to_ndjson(row: dict) -> str:
+    return json.dumps(row, default=_json_default, ensure_ascii=False) + "\n"
+
+
+# ============================================================
+# 2. Export in streaming
+# ============================================================
+
+def export_page(collection: str, start_after: Optional[str] = None, limit: int = BULK_PAGE_SIZE) -> Tuple[List[dict], Optional[str]]:
+    """
+    Una pagina di documenti ordinati per id. Restituisce anche l'id da cui
+    riprendere, o None all'ultima pagina.
+    """
+    key = _spec(collection).key
+    query = db.collection(collection).order_by(key)
+    if start_after is not None:
+        query = query.start_after({key: start_after})
+    rows = [doc.to_dict() for doc in query.limit(limit).stream()]
+    cursor = rows[-1][key] if len(rows) == limit else None
+    return rows, cursor
+
+
+def iter_export(collection: str) -> Iterator[dict]:
+    """Tutti i documenti della collection, una pagina alla volta in memoria."""
+    cursor = None
+    while True:
+        rows, cursor = export_page(collection, cursor)
+        yield from rows
+        if cursor is None:
+            return
+
+
+def export_ndjson(collection: str, out: Any) -> Dict[str, Any]:
+    started = time.perf_counter()
+    rows = 0
+    for row in iter_export(collection):
+        out.write(to_ndjson(row))
+        rows += 1
+    seconds = time.perf_counter() - started
+    return {"collection": collection, "rows": rows, "seconds": round(seconds, 3),
+            "rows_per_second": round(rows / seconds, 1) if seconds else 0.0}
+
+
+# ============================================================
+# 3. Import: BulkWriter di Firestore, batch paralleli come fallback
+# ============================================================
+# Le righe sono validate una per una e scritte con set(): rieseguire un
+# import è sicuro. Con Firestore le scritture passano dal BulkWriter (ritmo
+# adattivo e retry per singola scrittura); ogni BULK_PAGE_SIZE * 10 righe
+# si attende lo svuotamento della coda, così la memoria resta costante
+# anche con file molto grandi. Il backend locale, che non ha BulkWriter,
+# usa batch da BULK_PAGE_SIZE scritture inviati da BULK_PARALLELISM thread.
+#
+# Una riga può comportare più scritture (_Writes): per gli utenti anche
+# l'handle nickname#tag, il ritiro dell'handle precedente e l'azzeramento
+# della bitmap dei tag del nickname, che alla prossima registrazione viene
+# ricostruita dagli utenti salvati. Con il backend locale finiscono nello
+# stesso batch della riga.
+
+class _Writes:
+    """Scritture di una riga importata, nell'ordine in cui vanno applicate."""
+
+    def __init__(self) -> None:
+        self.ops: List[Tuple[str, Any, Optional[dict]]] = []
+
+    def set(self, reference: Any, data: dict) -> None:
+        self.ops.append(("set", unwrap(reference), data))
+
+    def update(self, reference: Any, data: dict) -> None:
+        self.ops.append(("update", unwrap(reference), data))
+
+    def delete(self, reference: Any) -> None:
+        self.ops.append(("delete", unwrap(reference), None))
+
+    def apply(self, writer: Any) -> None:
+        for op, reference, data in self.ops:
+            if data is None:
+                getattr(writer, op)(reference)
+            else:
+                getattr(writer, op)(reference, data)
+
+
+def _user_writes(page: List[Tuple[int, str, dict]], report: "_Report") -> Iterator[Tuple[int, str, _Writes]]:
+    """
+    Scritture di una pagina di utenti: profilo, handle e bitmap dei tag.
+    Due letture per pagina (handle e profili già salvati); le righe il cui
+    handle appartiene a un altro utente vengono scartate.
+    """
+    now = datetime.utcnow()
+    current = {
+        doc.id: doc.to_dict()
+        for doc in db.get_all([db.collection("users").document(uid) for _, uid, _ in page])
+        if doc.exists
+    }
+    wanted = {normalize_handle(row["nickname"], row["tag"]) for _, _, row in page}
+    for profile in current.values():
+        if profile.get("nickname") and profile.get("tag"):
+            wanted.add(normalize_handle(profile["nickname"], profile["tag"]))
+    handles = {
+        doc.get("handle"): doc.to_dict()
+        for doc in db.get_all([handle_ref(handle) for handle in wanted])
+        if doc.exists
+    }
+
+    reset = set()
+    for line, uid, row in page:
+        nickname, tag = row["nickname"], row["tag"]
+        handle = normalize_handle(nickname, tag)
+        owner = handles.get(handle)
+        if owner is not None and owner.get("uid") != uid:
+            report.error(line, uid, f"Il nickname '{nickname}#{tag}' è già in uso", invalid=True)
+            continue
+        handles[handle] = {"uid": uid}  # righe successive della stessa pagina
+
+        old = current.get(uid) or {}
+        old_handle = normalize_handle(old["nickname"], old["tag"]) if old.get("nickname") and old.get("tag") else None
+        previous = owner or handles.get(old_handle) or {}
+        email = row.get("email")
+        auth_email = previous.get("auth_email") or email or nickname_auth_email(nickname, tag)
+
+        writes = _Writes()
+        writes.set(db.collection("users").document(uid), row)
+        writes.set(handle_ref(handle), handle_doc(uid, nickname, tag, email, auth_email, row["created_at"], now))
+        if old_handle and old_handle != handle and old_handle in handles:
+            retire_handle(writes, old_handle, now)
+        for name in (nickname, old.get("nickname")):
+            if name and normalize_nickname(name) not in reset:
+                reset.add(normalize_nickname(name))
+                reset_reservation(writes, name)
+        yield line, uid, writes
+
+
+class _Report:
+    def __init__(self):
+        self.rows = 0
+        self.written = 0
+        self.invalid = 0
+        self.failed = 0
+        self.errors: List[BulkImportError] = []
+        self._lock = threading.Lock()
+
+    def error(self, line: Optional[int], doc_id: Optional[str], detail: str, invalid: bool = False) -> None:
+        with self._lock:
+            if invalid:
+                self.invalid += 1
+            else:
+                self.failed += 1
+            if len(self.errors) < BULK_MAX_ERRORS:
+                self.errors.append(BulkImportError(line=line, doc_id=doc_id, detail=detail))
+
+    def add_written(self, count: int) -> None:
+        with self._lock:
+            self.written += count
+
+
+class _BulkWriterSink:
+    def __init__(self, client: Any, collection: str, report: _Report, parallelism: int, max_retries: int):
+        from google.cloud.firestore_v1.bulk_writer import BulkRetry, BulkWriterOptions, SendMode
+
+        self._report = report
+        self._pending = 0
+        self._writer = client.bulk_writer(options=BulkWriterOptions(
+            initial_ops_per_second=BULK_OPS_PER_SECOND,
+            max_ops_per_second=max(BULK_MAX_OPS_PER_SECOND, BULK_OPS_PER_SECOND),
+            mode=SendMode.parallel if parallelism > 1 else SendMode.serial,
+            retry=BulkRetry.exponential,
+        ))
+        # Si contano le righe, non le scritture accessorie (handle, bitmap)
+        self._writer.on_write_result(
+            lambda reference, result, writer: report.add_written(1 if reference.parent.id == collection else 0)
+        )
+        self._writer.on_write_error(lambda error, writer: self._on_error(error, max_retries))
+
+    def _on_error(self, error: Any, max_retries: int) -> bool:
+        if error.attempts < max_retries:
+            return True
+        self._report.error(None, error.operation.reference.id, f"{error.code}: {error.message}")
+        return False
+
+    def write(self, doc_id: str, writes: _Writes, line: int) -> None:
+        writes.apply(self._writer)
+        self._pending += len(writes.ops)
+        if self._pending >= BULK_PAGE_SIZE * 10:
+            self._writer.flush()
+            self._pending = 0
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+class _BatchSink:
+    def __init__(self, client: Any, collection: str, report: _Report, parallelism: int, max_retries: int):
+        self._client = client
+        self._report = report
+        self._max_retries = max_retries
+        self._rows: List[Tuple[int, str, _Writes]] = []
+        self._ops = 0
+        self._executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="bulk-import")
+        # Al massimo due batch in attesa per thread: memoria costante
+        self._slots = threading.BoundedSemaphore(parallelism * 2)
+
+    def _commit(self, rows: List[Tuple[int, str, _Writes]]) -> None:
+        try:
+            for attempt in range(1, self._max_retries + 1):
+                batch = self._client.batch()
+                for _, _, writes in rows:
+                    writes.apply(batch)
+                try:
+                    batch.commit()
+                    self._report.add_written(len(rows))
+                    return
+                except _TRANSIENT_ERRORS as e:
+                    if attempt == self._max_retries:
+                        raise
+                    logger.warning("Commit di %d righe fallito (tentativo %d): %s", len(rows), attempt, e)
+                    time.sleep(min(2 ** attempt * 0.1, 10))
+        except Exception as e:
+            for line, doc_id, _ in rows:
+                self._report.error(line, doc_id, str(e))
+        finally:
+            self._slots.release()
+
+    def _submit(self) -> None:
+        rows, self._rows, self._ops = self._rows, [], 0
+        self._slots.acquire()
+        self._executor.submit(self._commit, rows)
+
+    def write(self, doc_id: str, writes: _Writes, line: int) -> None:
+        # Un commit contiene al massimo BULK_PAGE_SIZE scritture
+        if self._ops + len(writes.ops) > BULK_PAGE_SIZE:
+            self._submit()
+        self._rows.append((line, doc_id, writes))
+        self._ops += len(writes.ops)
+
+    def close(self) -> None:
+        if self._rows:
+            self._submit()
+        self._executor.shutdown(wait=True)
+
+
+class NdjsonImporter:
+    """
+    Import incrementale: feed() accetta le righe NDJSON man mano che
+    arrivano (file o body di una richiesta), close() attende le scritture
+    in corso e restituisce il resoconto con le righe al secondo.
+    """
+
+    def __init__(
+        self,
+        collection: str,
+        parallelism: int = BULK_PARALLELISM,
+        max_retries: int = BULK_MAX_RETRIES,
+    ):
+        self.collection = collection
+        self._spec = _spec(collection)
+        self._report = _Report()
+        self._line = 0
+        self._users: List[Tuple[int, str, dict]] = []
+        self._started = time.perf_counter()
+        client = unwrap(db)
+        sink = _BulkWriterSink if hasattr(client, "bulk_writer") else _BatchSink
+        self._sink = sink(client, collection, self._report, max(parallelism, 1), max(max_retries, 1))
+
+    def _validate(self, raw: Union[str, bytes]) -> Tuple[str, dict]:
+        row = json.loads(raw)
+        if not isinstance(row, dict):
+            raise ValueError("La riga non è un oggetto JSON")
+        doc_id = row.get(self._spec.key)
+        if not isinstance(doc_id, str) or not doc_id or "/" in doc_id:
+            raise ValueError(f"Campo {self._spec.key} mancante o non valido")
+        model = self._spec.model
+        validated = model.model_validate(row)
+        # Si salvano i valori convertiti dal modello ("3" -> 3); i campi che
+        # il modello non conosce (es. updated_at degli utenti) restano invariati
+        row.update(validated.model_dump(exclude=set(model.model_computed_fields)))
+        for field in self._spec.drop:
+            row.pop(field, None)
+        return doc_id, row
+
+    def _flush_users(self) -> None:
+        page, self._users = self._users, []
+        try:
+            for line, doc_id, writes in _user_writes(page, self._report):
+                self._sink.write(doc_id, writes, line)
+        except Exception as e:
+            for line, doc_id, _ in page:
+                self._report.error(line, doc_id, str(e))
+
+    def feed(self, lines: Iterable[Union[str, bytes]]) -> None:
+        for raw in lines:
+            self._line += 1
+            if not raw.strip():
+                continue
+            self._report.rows += 1
+            try:
+                doc_id, row = self._validate(raw)
+            except ValueError as e:  # anche JSONDecodeError e ValidationError
+                self._report.error(self._line, None, str(e), invalid=True)
+                continue
+            if self.collection == "users":
+                self._users.append((self._line, doc_id, row))
+                if len(self._users) == BULK_PAGE_SIZE:
+                    self._flush_users()
+                continue
+            writes = _Writes()
+            writes.set(unwrap(db).collection(self.collection).document(doc_id), row)
+            self._sink.write(doc_id, writes, self._line)
+
+    def close(self) -> BulkImportResponse:
+        if self._users:
+            self._flush_users()
+        self._sink.close()
+        if self._report.written:
+            if self._spec.cache:
+                cache = get_cache(self._spec.cache)
+                if cache is not None:
+                    cache.clear()
+            if self._spec.refresh:
+                self._spec.refresh()
+        seconds = time.perf_counter() - self._started
+        report = self._report
+        return BulkImportResponse(
+            collection=self.collection,
+            rows=report.rows,
+            written=report.written,
+            invalid=report.invalid,
+            failed=report.failed,
+            errors=report.errors,
+            seconds=round(seconds, 3),
+            rows_per_second=round(report.rows / seconds, 1) if seconds else 0.0,
+        )
+
+
+def import_ndjson(collection: str, lines: Iterable[Union[str, bytes]], **options: Any) -> BulkImportResponse:
+    importer = NdjsonImporter(collection, **options)
+    importer.feed(lines)
+    return importer.close()
+
+
+if __name__ == "__main__":
+    # python bulk_service.py export users > users.ndjson
+    # python bulk_service.py import users users.ndjson [--parallelism 8] [--retries 5]
+    parser = argparse.ArgumentParser(description="Export/import NDJSON delle collection di PenaltyHub.")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("collection", choices=tuple(BULK_COLLECTIONS))
+    parser.add_argument("path", nargs="?", default="-", help="file NDJSON (- = stdout/stdin)")
+    parser.add_argument("--parallelism", type=int, default=BULK_PARALLELISM)
+    parser.add_argument("--retries", type=int, default=BULK_MAX_RETRIES)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        if args.path == "-":
+            summary = export_ndjson(args.collection, sys.stdout)
+        else:
+            with open(args.path, "w", encoding="utf-8") as out:
+                summary = export_ndjson(args.collection, out)
+        print(json.dumps(summary), file=sys.stderr)
+    else:
+        options = {"parallelism": args.parallelism, "max_retries": args.retries}
+        if args.path == "-":
+            result = import_ndjson(args.collection, sys.stdin, **options)
+        else:
+            with open(args.path, encoding="utf-8") as source:
+                result = import_ndjson(args.collection, source, **options)
+        print(result.model_dump_json(indent=2), file=sys.stderr)
+        sys.exit(1 if result.invalid or result.failed else 0)
@@ -0,0 +1,117 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+# ============================================================
+# Cache in-process LRU con scadenza (TTL)
+# ============================================================
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache read-through limitata in dimensione (LRU) e in durata (TTL).
+    Thread-safe: i service girano nel pool di thread di datastore.py.
+    Con ttl <= 0 non memorizza nulla (es. con più worker, gunicorn.conf.py).
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 30.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # Incrementato a ogni invalidazione: evita che una lettura partita
+        # prima di una scrittura ripopoli la cache con il valore vecchio
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """
+        Se generation è indicata (letta prima del caricamento) il valore
+        viene scartato quando nel frattempo c'è stata un'invalidazione.
+        """
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._store(key, value)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._generation += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self._generation
+        value = loader()
+        # I risultati vuoti (documento inesistente) non vengono memorizzati
+        if value is not None:
+            self.set(key, value, generation)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._data)
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+_registry: Dict[str, TTLCache] = {}
+
+
+def create_cache(name: str, maxsize: int, ttl: float) -> TTLCache:
+    cache = TTLCache(name, maxsize=maxsize, ttl=ttl)
+    _registry[name] = cache
+    return cache
+
+
+def get_cache(name: str) -> Optional[TTLCache]:
+    return _registry.get(name)
+
+
+def all_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in _registry.items()}
@@ -0,0 +1,85 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from datastore import run_db
+
+
+# ============================================================
+# Pool di processi per il lavoro CPU-bound
+# ============================================================
+# Calcolo delle quote degli eventi e bilanciamento delle squadre tengono
+# occupato il GIL: eseguiti nell'event loop o nel pool del datastore
+# rallentano tutte le altre richieste del worker. run_cpu() li manda in
+# un pool di processi condiviso dal worker. Le funzioni devono essere
+# pure (niente datastore né cache) e argomenti e risultati serializzabili
+# con pickle: le letture si fanno prima, con run_db().
+#
+# I processi sono avviati con "spawn": un fork di un worker che ha già
+# aperto il canale gRPC di Firestore non è sicuro. Con più worker
+# gunicorn (WEB_CONCURRENCY) i core vengono divisi tra i loro pool.
+# CPU_POOL_SIZE=0 disattiva il pool: le funzioni girano nel pool di
+# thread del datastore, come prima.
+
+def _default_pool_size() -> int:
+    workers = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+    return max((os.cpu_count() or 1) // workers, 1)
+
+
+CPU_POOL_SIZE: int = int(os.getenv("CPU_POOL_SIZE", str(_default_pool_size())))
+
+_cpu_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_cpu_executor() -> Optional[ProcessPoolExecutor]:
+    global _cpu_executor
+    if _cpu_executor is None and CPU_POOL_SIZE > 0:
+        _cpu_executor = ProcessPoolExecutor(
+            max_workers=CPU_POOL_SIZE,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _cpu_executor
+
+
+async def run_cpu(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Esegue una funzione CPU-bound (pura) nel pool di processi e ne attende
+    il risultato senza bloccare l'event loop.
+    """
+    executor = get_cpu_executor()
+    if executor is None:
+        return await run_db(func, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+def _import_services() -> int:
+    # Nel processo figlio: importa i moduli (numpy, pydantic, modelli)
+    import settlement_service  # noqa: F401
+    import team_service  # noqa: F401
+
+    return os.getpid()
+
+
+async def warm_up_cpu_pool() -> None:
+    """
+    Avvia i processi del pool e importa i service, così la prima richiesta
+    non paga l'avvio di un interprete.
+    """
+    executor = get_cpu_executor()
+    if executor is None:
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(
+        loop.run_in_executor(executor, _import_services) for _ in range(CPU_POOL_SIZE)
+    ))
+
+
+def shutdown_cpu_executor() -> None:
+    global _cpu_executor
+    if _cpu_executor is not None:
+        _cpu_executor.shutdown(wait=True, cancel_futures=True)
+        _cpu_executor = None
@@ -1,41 +1,89 @@
 import os
 import json
-from typing import Optional
+import threading
+import time
+from typing import Any, Dict, Optional
 
-import firebase_admin
-from firebase_admin import credentials, auth as firebase_auth, firestore
+from metrics import instrument_client
 
 
 # ============================================================
-# 1. Inizializzazione credenziali Firebase
+# 0. Scelta del backend di storage
 # ============================================================
+# STORAGE_BACKEND=firestore (default) usa Firebase.
+# STORAGE_BACKEND=memory|sqlite usa il backend locale di local_store.py,
+# senza bisogno di un progetto Firebase (benchmark, test, piccoli gruppi).
 
-firebase_creds_json: Optional[str] = os.getenv("FIREBASE_CREDENTIALS_JSON")
+STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "firestore").lower()
+SQLITE_PATH: str = os.getenv("SQLITE_PATH", "penaltyhub.db")
 
-if firebase_creds_json:
-    # Produzione: credenziali da variabile d'ambiente
-    cred_dict = json.loads(firebase_creds_json)
-    cred = credentials.Certificate(cred_dict)
-else:
-    # Sviluppo locale: file JSON
-    cred = credentials.Certificate("serviceaccountkey.json")
+if STORAGE_BACKEND not in ("firestore", "memory", "sqlite"):
+    raise RuntimeError(f"STORAGE_BACKEND non valido: {STORAGE_BACKEND}")
 
 
-# ============================================================
-# 2. Inizializza l'app Firebase
-# ============================================================
+# Tempi di avvio in millisecondi (esposti da /health)
+STARTUP_TIMINGS: Dict[str, Any] = {}
 
-if not firebase_admin._apps:
-    firebase_app = firebase_admin.initialize_app(cred)
-else:
-    firebase_app = firebase_admin.get_app()
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
 
 
 # ============================================================
-# 3. Client Firestore
+# 1-3. Firebase: inizializzazione pigra al primo utilizzo
 # ============================================================
+# Import di firebase_admin, lettura delle credenziali, initialize_app e
+# creazione del client Firestore avvengono alla prima chiamata di
+# get_db()/get_firebase_auth(), non all'import del modulo: uvicorn può
+# rispondere a /health subito e i test non pagano l'avvio di Firebase.
+
+_init_lock = threading.RLock()
+_firebase_app: Any = None
+_db: Any = None
+_local_auth: Any = None
+
+
+def _load_credentials():
+    from firebase_admin import credentials
+
+    firebase_creds_json: Optional[str] = os.getenv("FIREBASE_CREDENTIALS_JSON")
+
+    if firebase_creds_json:
+        # Produzione: credenziali da variabile d'ambiente
+        cred_dict = json.loads(firebase_creds_json)
+        return credentials.Certificate(cred_dict)
+    # Sviluppo locale: file JSON
+    return credentials.Certificate("serviceaccountkey.json")
+
+
+def get_firebase_app():
+    global _firebase_app
+    if _firebase_app is None:
+        with _init_lock:
+            if _firebase_app is None:
+                started = time.perf_counter()
+                import firebase_admin
+
+                if not firebase_admin._apps:
+                    _firebase_app = firebase_admin.initialize_app(_load_credentials())
+                else:
+                    _firebase_app = firebase_admin.get_app()
+                STARTUP_TIMINGS["firebase_init_ms"] = _elapsed_ms(started)
+    return _firebase_app
+
+
+def get_db():
+    global _db
+    if _db is None:
+        with _init_lock:
+            if _db is None:
+                app = get_firebase_app()
+                started = time.perf_counter()
+                from firebase_admin import firestore
 
-db = firestore.client(app=firebase_app)
+                _db = firestore.client(app=app)
+                STARTUP_TIMINGS["firestore_client_ms"] = _elapsed_ms(started)
+    return _db
 
 
 # ============================================================
@@ -43,4 +91,64 @@ db = firestore.client(app=firebase_app)
 # ============================================================
 
 def get_firebase_auth():
-    return firebase_auth
\ No newline at end of file
+    if STORAGE_BACKEND != "firestore":
+        return _local_auth
+    # Le funzioni del modulo auth usano l'app di default: va inizializzata prima
+    get_firebase_app()
+    from firebase_admin import auth
+
+    return auth
+
+
+class _LazyProxy:
+    """
+    Segnaposto per `db` e `firebase_auth`: crea l'oggetto vero al primo
+    accesso a un attributo, così `from config import db` resta valido.
+    """
+
+    __slots__ = ("_factory",)
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._factory(), name)
+
+    def __repr__(self) -> str:
+        return f"<lazy {self._factory.__name__}()>"
+
+
+if STORAGE_BACKEND == "firestore":
+    db = _LazyProxy(get_db)
+    firebase_auth = _LazyProxy(get_firebase_auth)
+else:
+    from local_store import LocalAuth, LocalClient
+
+    # Backend locale: in memoria o su file SQLite (creazione immediata)
+    _db = LocalClient(SQLITE_PATH if STORAGE_BACKEND == "sqlite" else None)
+    _local_auth = LocalAuth(_db)
+    db = _db
+    firebase_auth = _local_auth
+
+# Con METRICS_ENABLED=1 le operazioni passano dal wrapper che misura i tempi
+db = instrument_client(db)
+
+
+# ============================================================
+# 5. Warm-up opzionale (lifespan di FastAPI)
+# ============================================================
+
+def warm_up() -> None:
+    """
+    Inizializza Firebase e apre il canale gRPC (con il token OAuth) tramite
+    una lettura minima, così la prima richiesta vera non paga l'handshake.
+    """
+    started = time.perf_counter()
+    try:
+        client = get_db()
+        get_firebase_auth()
+        if STORAGE_BACKEND == "firestore":
+            client.collection("_warmup").document("ping").get()
+    except Exception as e:
+        STARTUP_TIMINGS["warmup_error"] = str(e)
+    STARTUP_TIMINGS["warmup_ms"] = _elapsed_ms(started)
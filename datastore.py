@@ -0,0 +1,114 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, Tuple
+
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import transactional
+
+from local_store import LocalClient
+from metrics import unwrap
+
+
+# ============================================================
+# 1. Pool di thread per le chiamate bloccanti al datastore
+# ============================================================
+# Il client Firestore è sincrono: ogni get()/set()/stream() blocca il
+# thread chiamante. Le route di main.py sono async, quindi le chiamate ai
+# service vengono eseguite in un pool dedicato e limitato, lasciando libero
+# l'event loop di uvicorn.
+
+DB_THREADPOOL_SIZE: int = int(os.getenv("DB_THREADPOOL_SIZE", "32"))
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(
+            max_workers=DB_THREADPOOL_SIZE,
+            thread_name_prefix="datastore",
+        )
+    return _db_executor
+
+
+async def run_db(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Esegue una funzione di service (sincrona) nel pool del datastore
+    e ne attende il risultato senza bloccare l'event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(), partial(func, *args, **kwargs)
+    )
+
+
+def shutdown_db_executor() -> None:
+    global _db_executor
+    if _db_executor is not None:
+        _db_executor.shutdown(wait=True)
+        _db_executor = None
+
+
+# ============================================================
+# 2. Transazioni indipendenti dal backend
+# ============================================================
+
+def run_transaction(db_client: Any, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Esegue func(transaction, *args, **kwargs) in una transazione del client,
+    ripetendola in caso di conflitto (Firestore) o tenendo il lock del
+    backend locale per tutta la durata.
+    """
+    transaction = db_client.transaction()
+    client = unwrap(db_client)
+    if isinstance(client, LocalClient):
+        with client._lock:
+            result = func(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return transactional(func)(transaction, *args, **kwargs)
+
+
+# ============================================================
+# 3. Update con precondizione sullo stato noto
+# ============================================================
+# Un update() di Firestore non restituisce il documento. Chi conosce già
+# il documento con il suo update_time (letto o scritto in precedenza da
+# questo processo) può scrivere con la precondizione last_update_time: se
+# il commit riesce nessun altro ha modificato il documento nel frattempo,
+# quindi lo stato dopo la scrittura è lo stato noto più gli aggiornamenti.
+# Un solo round trip; se la precondizione fallisce si rilegge e si riprova.
+
+# (dati del documento, update_time)
+KnownState = Tuple[dict, Any]
+
+VERSIONED_UPDATE_ATTEMPTS = 5
+
+
+def update_known(
+    db_client: Any, doc_ref: Any, updates: dict, known: Optional[KnownState] = None,
+) -> Optional[KnownState]:
+    """
+    Applica updates (campi di primo livello, senza trasformazioni) e
+    restituisce lo stato esatto dopo la scrittura con il nuovo update_time,
+    o None se il documento non esiste.
+    """
+    for _ in range(VERSIONED_UPDATE_ATTEMPTS):
+        if known is None:
+            snapshot = doc_ref.get()
+            if not snapshot.exists:
+                return None
+            known = (snapshot.to_dict(), snapshot.update_time)
+        data, update_time = known
+        try:
+            result = doc_ref.update(updates, option=db_client.write_option(last_update_time=update_time))
+        except FailedPrecondition:
+            known = None  # modificato da altri: si rilegge
+            continue
+        except NotFound:
+            return None
+        return {**data, **updates}, result.update_time
+    raise RuntimeError(f"Troppe scritture concorrenti su {doc_ref.id}")
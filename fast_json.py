@@ -0,0 +1,75 @@
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # serve solo con FAST_JSON=1
+    orjson = None
+
+
+# ============================================================
+# Serializzazione veloce delle risposte (opt-in con FAST_JSON=1)
+# ============================================================
+# I service restituiscono già modelli Pydantic validati. Con response_model
+# FastAPI li rivalida e poi li serializza con l'encoder della libreria
+# standard. In modalità veloce gli endpoint restituiscono direttamente una
+# ORJSONResponse: nessuna seconda validazione, solo il filtro dei campi del
+# response_model, e la codifica la fa orjson.
+
+FAST_JSON: bool = os.getenv("FAST_JSON", "0") == "1"
+
+if FAST_JSON and orjson is None:
+    raise RuntimeError("FAST_JSON=1 richiede il pacchetto orjson")
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Tipo non serializzabile: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+@lru_cache(maxsize=None)
+def _response_fields(response_model: Type[BaseModel]) -> Tuple[Tuple[str, ...], Dict[str, Any]]:
+    defaults = {}
+    for name, field in response_model.model_fields.items():
+        if not field.is_required():
+            defaults[name] = field.get_default(call_default_factory=True)
+    return tuple(response_model.model_fields), defaults
+
+
+def _as_response_model(content: Any, response_model: Type[BaseModel]) -> Any:
+    # Output fidato: solo filtro dei campi del response_model e default,
+    # senza rivalidare (model_dump con include gira nel core Rust di Pydantic)
+    if content is None or isinstance(content, response_model):
+        return content
+    names, defaults = _response_fields(response_model)
+    if isinstance(content, BaseModel):
+        data = content.model_dump(include=set(names))
+    elif isinstance(content, dict):
+        data = {k: content[k] for k in names if k in content}
+    else:
+        return content
+    if len(data) < len(names):
+        data = {**defaults, **data}
+    return data
+
+
+def respond(content: Any, response_model: Optional[Type[BaseModel]] = None) -> Any:
+    """
+    Con FAST_JSON disattivo restituisce content invariato (percorso standard
+    di FastAPI). Altrimenti lo serializza subito con orjson.
+    """
+    if not FAST_JSON:
+        return content
+    if response_model is not None:
+        content = _as_response_model(content, response_model)
+    return ORJSONResponse(content)
@@ -0,0 +1,74 @@
+import os
+import secrets
+
+
+# ============================================================
+# Modalità di produzione multi-worker
+# ============================================================
+#     gunicorn main:app -c gunicorn.conf.py
+#
+# Un processo uvicorn usa un solo core: gunicorn avvia WEB_CONCURRENCY
+# worker (default: uno per CPU) e li riavvia se terminano. L'app NON viene
+# precaricata nel master: ogni worker importa main.py dopo il fork, quindi
+# Firebase, il client Firestore e il canale gRPC nascono nel worker che li
+# usa (un canale gRPC aperto prima del fork non è utilizzabile nei figli).
+#
+# Stato per worker: cache, single-flight, classifiche e indice degli handle
+# sono in memoria in ogni processo. Una scrittura invalida solo le cache del
+# worker che la esegue, quindi con più worker le cache di profili e
+# statistiche sono disattivate (USER_CACHE_TTL=0 se non è impostato; un TTL
+# esplicito accetta letture vecchie fino a quel numero di secondi). Le cache
+# dello stato noto per gli update con precondizione restano attive: uno
+# stato vecchio fa solo fallire la precondizione e rileggere il documento.
+# L'indice degli handle si aggiorna ogni HANDLE_INDEX_REFRESH_INTERVAL
+# secondi; le classifiche applicano solo le scritture del proprio worker,
+# quindi con più worker vengono ricostruite ogni LEADERBOARD_REBUILD_INTERVAL
+# secondi (default 60 qui, 0 = mai). Le dirette ricevono gli aggiornamenti
+# degli altri worker dal listener on_snapshot.
+#
+# Solo Firestore è condiviso tra processi: con il backend "memory" ogni
+# worker avrebbe un database suo e con "sqlite" il lock delle transazioni
+# vale solo dentro un processo. Con i backend locali si avvia un solo worker
+# (BENCH_LOCAL_WORKERS=1 lo permette ai benchmark senza dati condivisi).
+
+_SHARED_BACKEND = (
+    os.getenv("STORAGE_BACKEND", "firestore").lower() == "firestore"
+    or os.getenv("BENCH_LOCAL_WORKERS") == "1"
+)
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or (os.cpu_count() or 1)
+if not _SHARED_BACKEND:
+    workers = 1
+preload_app = False
+
+# Con il backend locale senza SESSION_SECRET un worker riavviato genererebbe
+# una chiave nuova e i token già emessi non varrebbero più
+if not _SHARED_BACKEND:
+    os.environ.setdefault("SESSION_SECRET", secrets.token_urlsafe(32))
+
+
+def on_starting(server):
+    # Nel master prima del fork, con il numero di worker definitivo
+    # (anche "-w N" da riga di comando)
+    count = server.cfg.workers
+    if not _SHARED_BACKEND and count > 1:
+        raise SystemExit("Con STORAGE_BACKEND locale si può avviare un solo worker")
+    # I pool di processi dei worker (compute.py) si dividono i core
+    os.environ["WEB_CONCURRENCY"] = str(count)
+    # Le classifiche e le cache degli altri worker non vedono le scritture di questo
+    if count > 1:
+        os.environ.setdefault("LEADERBOARD_REBUILD_INTERVAL", "60")
+        os.environ.setdefault("USER_CACHE_TTL", "0")
+
+
+# Le dirette (SSE) restano aperte a lungo: il timeout riguarda solo i
+# worker bloccati, non le singole richieste
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
@@ -0,0 +1,238 @@
+import os
+import sys
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+from config import db
+from models import UserSearchResult
+
+
+# ============================================================
+# 1. Directory degli handle nickname#tag
+# ============================================================
+# handles/{nickname normalizzato#tag} punta all'account: uid, dati del
+# profilo mostrati al login ed email dell'account auth. Il login con
+# nickname#tag è quindi un solo get, e l'unicità degli handle non dipende
+# da maiuscole/minuscole. Un handle abbandonato (cambio di nickname o tag)
+# non viene cancellato ma marcato active=False: resta riservato e chi
+# aggiorna l'indice di ricerca a partire da updated_at vede la rimozione.
+
+def nickname_auth_email(nickname: str, tag: str) -> str:
+    # Email sintetica degli account registrati con nickname#tag
+    return f"{nickname}_{tag}@penaltyhub.local"
+
+
+def normalize_nickname(nickname: str) -> str:
+    return nickname.strip().casefold()
+
+
+def normalize_handle(nickname: str, tag: str) -> str:
+    return f"{normalize_nickname(nickname)}#{tag}"
+
+
+def handle_ref(handle: str) -> Any:
+    return db.collection("handles").document(quote(handle, safe=""))
+
+
+def handle_doc(
+    uid: str,
+    nickname: str,
+    tag: str,
+    email: Optional[str],
+    auth_email: str,
+    created_at: str,
+    now: datetime,
+) -> dict:
+    return {
+        "handle": normalize_handle(nickname, tag),
+        "uid": uid,
+        "nickname": nickname,
+        "tag": tag,
+        "email": email,
+        "auth_email": auth_email,
+        "created_at": created_at,
+        "updated_at": now.isoformat(),
+        "active": True,
+    }
+
+
+def create_handle(writer: Any, doc: dict) -> None:
+    # create(): se l'handle esiste già (anche disattivato) il commit fallisce
+    writer.create(handle_ref(doc["handle"]), doc)
+
+
+def retire_handle(writer: Any, handle: str, now: datetime) -> None:
+    writer.update(handle_ref(handle), {"active": False, "updated_at": now.isoformat()})
+
+
+def get_handle(nickname: str, tag: str) -> Optional[dict]:
+    """Handle attivo o None: un solo get."""
+    doc = handle_ref(normalize_handle(nickname, tag)).get()
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    return data if data.get("active") else None
+
+
+# ============================================================
+# 2. Indice in memoria per la ricerca per prefisso
+# ============================================================
+# Lista ordinata degli handle normalizzati: i risultati per un prefisso
+# sono una fetta contigua, trovata con un bisect. L'indice si aggiorna
+# subito con le scritture di questo processo e periodicamente leggendo
+# gli handle con updated_at successivo all'ultimo aggiornamento (gli
+# altri worker). La sovrapposizione copre gli orologi non allineati.
+
+HANDLE_INDEX_REFRESH_INTERVAL = float(os.getenv("HANDLE_INDEX_REFRESH_INTERVAL", "30"))
+HANDLE_PAGE_SIZE = 1000
+_REFRESH_OVERLAP = timedelta(seconds=30)
+
+
+class HandleIndex:
+    def __init__(self):
+        self._keys: List[str] = []
+        self._entries: Dict[str, UserSearchResult] = {}
+        self._watermark: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._watermark is not None
+
+    def _apply(self, doc: dict) -> None:
+        # Da chiamare con il lock
+        handle = doc["handle"]
+        present = handle in self._entries
+        if doc.get("active"):
+            self._entries[handle] = UserSearchResult(uid=doc["uid"], nickname=doc["nickname"], tag=doc["tag"])
+            if not present:
+                insort(self._keys, handle)
+        elif present:
+            del self._entries[handle]
+            del self._keys[bisect_left(self._keys, handle)]
+
+    def apply(self, docs: Iterable[dict]) -> None:
+        with self._lock:
+            for doc in docs:
+                self._apply(doc)
+
+    def search(self, prefix: str, limit: int = 10) -> List[UserSearchResult]:
+        prefix = normalize_nickname(prefix)
+        results = []
+        with self._lock:
+            position = bisect_left(self._keys, prefix)
+            for handle in self._keys[position:position + limit]:
+                if not handle.startswith(prefix):
+                    break
+                results.append(self._entries[handle])
+        return results
+
+    def _stream_changes(self, since: Optional[str]) -> Iterable[dict]:
+        query = db.collection("handles")
+        if since is not None:
+            query = query.where("updated_at", ">", since)
+        query = query.order_by("updated_at").order_by("handle")
+        cursor = None
+        while True:
+            page = query if cursor is None else query.start_after(cursor)
+            docs = [doc.to_dict() for doc in page.limit(HANDLE_PAGE_SIZE).stream()]
+            yield from docs
+            if len(docs) < HANDLE_PAGE_SIZE:
+                return
+            cursor = {"updated_at": docs[-1]["updated_at"], "handle": docs[-1]["handle"]}
+
+    def refresh(self) -> int:
+        """
+        Applica gli handle modificati dall'ultimo aggiornamento (tutti alla
+        prima chiamata), a pagine. Restituisce il numero di documenti letti.
+        """
+        since = None
+        if self._watermark:
+            since = (datetime.fromisoformat(self._watermark) - _REFRESH_OVERLAP).isoformat()
+        started = datetime.utcnow().isoformat()
+        changes = 0
+        latest = self._watermark or ""
+        batch: List[dict] = []
+        for doc in self._stream_changes(since):
+            batch.append(doc)
+            latest = max(latest, doc.get("updated_at") or "")
+            if len(batch) == HANDLE_PAGE_SIZE:
+                self.apply(batch)
+                changes += len(batch)
+                batch = []
+        self.apply(batch)
+        changes += len(batch)
+        with self._lock:
+            # Senza documenti il punto di partenza è l'inizio di questa lettura
+            self._watermark = latest or started
+        return changes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"handles": len(self._keys), "watermark": self._watermark}
+
+
+handle_index = HandleIndex()
+
+
+# ============================================================
+# 3. Migrazione degli utenti esistenti
+# ============================================================
+
+def backfill_handles() -> Dict[str, int]:
+    """
+    Crea gli handle mancanti degli utenti registrati prima della directory
+    (un commit ogni 500). Gli account con nickname ricevono l'email
+    sintetica usata alla registrazione.
+    """
+    now = datetime.utcnow()
+    created, skipped = 0, 0
+    # Per handle normalizzato: due utenti che differiscono solo per le
+    # maiuscole non possono finire nello stesso commit
+    pending: Dict[str, Tuple[Any, dict]] = {}
+
+    def _flush() -> int:
+        refs = [ref for ref, _ in pending.values()]
+        existing = {doc.id for doc in db.get_all(refs) if doc.exists}
+        batch = db.batch()
+        written = 0
+        for ref, doc in pending.values():
+            if ref.id not in existing:
+                batch.create(ref, doc)
+                written += 1
+        if written:
+            batch.commit()
+        pending.clear()
+        return written
+
+    for user in db.collection("users").stream():
+        profile = user.to_dict()
+        nickname, tag = profile.get("nickname"), profile.get("tag")
+        if not nickname or not tag:
+            skipped += 1
+            continue
+        email = profile.get("email")
+        doc = handle_doc(
+            profile["uid"], nickname, tag, email,
+            email or nickname_auth_email(nickname, tag),
+            profile.get("created_at") or now.isoformat(), now,
+        )
+        if doc["handle"] in pending:
+            skipped += 1
+            continue
+        pending[doc["handle"]] = (handle_ref(doc["handle"]), doc)
+        if len(pending) == 500:
+            created += _flush()
+    if pending:
+        created += _flush()
+    return {"created": created, "skipped": skipped}
+
+
+if __name__ == "__main__":
+    # python handle_service.py backfill
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("Uso: python handle_service.py backfill")
+    print(backfill_handles())
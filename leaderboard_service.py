@@ -0,0 +1,196 @@
+import os
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import db
+from models import LeaderboardEntry, LeaderboardResponse, UserRankResponse
+
+
+# ============================================================
+# Classifiche in memoria con rank in O(log n)
+# ============================================================
+# Per ogni metrica una lista ordinata di chiavi (-valore, uid): la top N è
+# una fetta della lista, il rank di un giocatore è un bisect sul suo
+# valore (a pari merito stesso rank). Le scritture di user_stats applicano
+# gli stessi delta anche qui, quindi le classifiche restano aggiornate
+# senza rileggere Firestore. All'avvio vengono ricostruite leggendo
+# user_stats a pagine; con più processi LEADERBOARD_REBUILD_INTERVAL le
+# riallinea periodicamente con le scritture degli altri worker
+# (gunicorn.conf.py lo porta a 60 secondi se non è impostato).
+
+LEADERBOARD_METRICS = ("wins", "goals_scored", "clean_sheets", "win_rate")
+# Sotto questa soglia di partite il win rate non entra in classifica
+LEADERBOARD_MIN_MATCHES = int(os.getenv("LEADERBOARD_MIN_MATCHES", "5"))
+LEADERBOARD_REBUILD_INTERVAL = float(os.getenv("LEADERBOARD_REBUILD_INTERVAL", "0"))
+LEADERBOARD_PAGE_SIZE = 1000
+
+# Contatori di user_stats da cui dipendono le metriche
+_COUNTERS = ("total_matches", "wins", "goals_scored", "clean_sheets")
+
+Counters = Tuple[float, float, float, float]
+_ZERO: Counters = (0, 0, 0, 0)
+
+
+def _counters(data: dict) -> Counters:
+    return tuple(data.get(field) or 0 for field in _COUNTERS)
+
+
+def _metric_values(counters: Counters) -> Dict[str, float]:
+    """Valori delle metriche in cui il giocatore è in classifica."""
+    total_matches, wins, goals_scored, clean_sheets = counters
+    if total_matches <= 0:
+        return {}
+    values = {"wins": wins, "goals_scored": goals_scored, "clean_sheets": clean_sheets}
+    if total_matches >= LEADERBOARD_MIN_MATCHES:
+        values["win_rate"] = round(wins / total_matches * 100, 4)
+    return values
+
+
+class Leaderboard:
+    def __init__(self):
+        self._counters: Dict[str, Counters] = {}
+        self._index: Dict[str, List[Tuple[float, str]]] = {m: [] for m in LEADERBOARD_METRICS}
+        self._ready = False
+        # uid modificati durante una ricostruzione: riletti alla fine
+        self._dirty: Optional[Set[str]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def _replace(self, uid: str, counters: Counters) -> None:
+        # Da chiamare con il lock: sposta le chiavi del giocatore in ogni indice
+        old = _metric_values(self._counters.get(uid, _ZERO))
+        new = _metric_values(counters)
+        for metric in LEADERBOARD_METRICS:
+            if old.get(metric) == new.get(metric):
+                continue
+            keys = self._index[metric]
+            if metric in old:
+                position = bisect_left(keys, (-old[metric], uid))
+                del keys[position]
+            if metric in new:
+                insort(keys, (-new[metric], uid))
+        if new:
+            self._counters[uid] = counters
+        else:
+            self._counters.pop(uid, None)
+
+    def apply_deltas(self, uid: str, deltas: Dict[str, float]) -> None:
+        """Somma gli stessi incrementi appena scritti su user_stats/{uid}."""
+        with self._lock:
+            if self._dirty is not None:
+                self._dirty.add(uid)
+            current = self._counters.get(uid, _ZERO)
+            updated = tuple(value + (deltas.get(field) or 0) for field, value in zip(_COUNTERS, current))
+            self._replace(uid, updated)
+
+    def set_stats(self, uid: str, data: dict) -> None:
+        with self._lock:
+            self._replace(uid, _counters(data))
+
+    def apply_many(self, deltas: Dict[str, Dict[str, float]]) -> None:
+        for uid, d in deltas.items():
+            self.apply_deltas(uid, d)
+
+    # --------------------------------------------------------
+    # Letture
+    # --------------------------------------------------------
+
+    def _check_metric(self, metric: str) -> None:
+        if metric not in self._index:
+            raise ValueError(f"Metrica non valida: {metric} (valide: {', '.join(LEADERBOARD_METRICS)})")
+
+    def top(self, metric: str, limit: int = 10, offset: int = 0) -> LeaderboardResponse:
+        self._check_metric(metric)
+        with self._lock:
+            keys = self._index[metric]
+            entries = []
+            rank, previous = 0, None
+            for position, (key, uid) in enumerate(keys[offset:offset + limit], start=offset):
+                if key != previous:
+                    # A pari merito il rank è quello del primo con lo stesso valore
+                    rank = position + 1 if previous is not None else bisect_left(keys, (key,)) + 1
+                    previous = key
+                entries.append(LeaderboardEntry(rank=rank, uid=uid, value=-key))
+            return LeaderboardResponse(metric=metric, total=len(keys), entries=entries)
+
+    def rank(self, uid: str, metric: str) -> Optional[UserRankResponse]:
+        self._check_metric(metric)
+        with self._lock:
+            value = _metric_values(self._counters.get(uid, _ZERO)).get(metric)
+            if value is None:
+                return None
+            keys = self._index[metric]
+            return UserRankResponse(
+                uid=uid,
+                metric=metric,
+                rank=bisect_left(keys, (-value,)) + 1,
+                value=value,
+                total=len(keys),
+            )
+
+    # --------------------------------------------------------
+    # Ricostruzione da Firestore
+    # --------------------------------------------------------
+
+    def _stream_user_stats(self) -> Iterable[Tuple[str, dict]]:
+        # A pagine ordinate per uid: nessuno stream aperto per tutta la collection
+        query = db.collection("user_stats").order_by("uid")
+        last_uid = None
+        while True:
+            page = query if last_uid is None else query.start_after({"uid": last_uid})
+            docs = list(page.limit(LEADERBOARD_PAGE_SIZE).stream())
+            for doc in docs:
+                yield doc.id, doc.to_dict()
+            if len(docs) < LEADERBOARD_PAGE_SIZE:
+                return
+            last_uid = docs[-1].get("uid")
+
+    def rebuild(self) -> int:
+        """
+        Ricostruisce tutte le classifiche da user_stats. In memoria restano
+        solo i quattro contatori per giocatore; gli indici si ordinano una
+        volta alla fine. Restituisce il numero di giocatori in classifica.
+        """
+        with self._lock:
+            self._dirty = set()
+        try:
+            counters: Dict[str, Counters] = {}
+            for uid, data in self._stream_user_stats():
+                values = _counters(data)
+                if values[0] > 0:
+                    counters[uid] = values
+            index: Dict[str, List[Tuple[float, str]]] = {m: [] for m in LEADERBOARD_METRICS}
+            for uid, values in counters.items():
+                for metric, value in _metric_values(values).items():
+                    index[metric].append((-value, uid))
+            for keys in index.values():
+                keys.sort()
+
+            with self._lock:
+                self._counters = counters
+                self._index = index
+                self._ready = True
+                dirty, self._dirty = self._dirty, set()
+            # Chi è stato aggiornato durante la lettura può essere contato
+            # due volte o per niente: si rilegge il suo documento
+            while dirty:
+                refs = [db.collection("user_stats").document(uid) for uid in dirty]
+                for doc in db.get_all(refs):
+                    self.set_stats(doc.id, doc.to_dict() if doc.exists else {})
+                with self._lock:
+                    dirty, self._dirty = self._dirty, set()
+        finally:
+            with self._lock:
+                self._dirty = None
+        return len(counters)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {metric: len(keys) for metric, keys in self._index.items()}
+
+
+leaderboard = Leaderboard()
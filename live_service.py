@@ -0,0 +1,196 @@
+import asyncio
+import os
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+from config import db, STORAGE_BACKEND
+from datastore import run_db
+from models import Match
+
+
+# ============================================================
+# Punteggi in diretta: fan-out push (Server-Sent Events)
+# ============================================================
+# Ogni partita seguita ha un canale con la lista delle code dei client
+# collegati. Un aggiornamento viene serializzato una sola volta e copiato
+# in tutte le code: 1.000 spettatori costano una scrittura, non 1.000
+# letture ogni pochi secondi.
+#
+# Gli aggiornamenti arrivano da update_match_score_and_status (stesso
+# processo) e, con Firestore, da un solo listener on_snapshot per partita:
+# così anche le modifiche fatte da altri worker/istanze raggiungono i client.
+# I duplicati (stesso stato da entrambe le fonti) vengono scartati.
+# Avvio e chiusura del listener sono chiamate bloccanti (la prima
+# inizializza anche Firebase): dal loop asyncio passano per run_db().
+
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "16"))
+LIVE_KEEPALIVE = float(os.getenv("LIVE_KEEPALIVE", "15"))
+LIVE_FIRESTORE_LISTENER = os.getenv(
+    "LIVE_FIRESTORE_LISTENER", "1" if STORAGE_BACKEND == "firestore" else "0"
+) == "1"
+
+_Subscriber = Tuple[asyncio.AbstractEventLoop, "asyncio.Queue[Optional[str]]"]
+
+
+def _sse_frame(match: Match) -> str:
+    return f"id: {match.updated_at}\nevent: score\ndata: {match.model_dump_json()}\n\n"
+
+
+def _offer(queue: "asyncio.Queue[Optional[str]]", frame: Optional[str]) -> None:
+    # Client lento: conta solo l'ultimo punteggio, si scarta il più vecchio
+    if queue.full():
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+    queue.put_nowait(frame)
+
+
+class _Channel:
+    def __init__(self) -> None:
+        self.subscribers: Set[_Subscriber] = set()
+        self.last: Optional[str] = None
+        self.watch: Any = None
+
+
+class LiveScoreHub:
+    """
+    Registro dei client collegati per partita. publish() è thread-safe:
+    viene chiamata dal pool del datastore e dai thread del listener Firestore.
+    """
+
+    def __init__(self) -> None:
+        self._channels: Dict[str, _Channel] = {}
+        self._lock = threading.Lock()
+        self._stopping: Set["asyncio.Task[None]"] = set()
+
+    async def subscribe(self, match_id: str, current: Optional[Match] = None) -> "asyncio.Queue[Optional[str]]":
+        """
+        Registra un client. La coda riceve subito l'ultimo stato noto, poi
+        un frame SSE per ogni aggiornamento e None quando la partita è finita.
+        """
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        start_watch = False
+        with self._lock:
+            channel = self._channels.get(match_id)
+            if channel is None:
+                channel = self._channels[match_id] = _Channel()
+                start_watch = LIVE_FIRESTORE_LISTENER
+            if channel.last is None and current is not None:
+                channel.last = _sse_frame(current)
+            channel.subscribers.add((loop, queue))
+            if channel.last is not None:
+                queue.put_nowait(channel.last)
+        if start_watch:
+            try:
+                await run_db(self._start_watch, match_id, channel)
+            except BaseException:
+                self.unsubscribe(match_id, queue)
+                raise
+        return queue
+
+    def has_state(self, match_id: str) -> bool:
+        with self._lock:
+            channel = self._channels.get(match_id)
+            return channel is not None and channel.last is not None
+
+    def unsubscribe(self, match_id: str, queue: "asyncio.Queue[Optional[str]]") -> None:
+        """
+        Rimuove un client (da chiamare nel loop asyncio). L'ultimo client di
+        una partita chiude il listener nel pool del datastore, senza
+        attenderlo: il client può essere già stato cancellato.
+        """
+        with self._lock:
+            channel = self._channels.get(match_id)
+            if channel is None:
+                return
+            channel.subscribers = {s for s in channel.subscribers if s[1] is not queue}
+            if channel.subscribers:
+                return
+            del self._channels[match_id]
+            if channel.watch is None:
+                return
+        task = asyncio.ensure_future(run_db(self._stop_watch, channel))
+        self._stopping.add(task)
+        task.add_done_callback(self._stopping.discard)
+
+    def publish(self, match: Match) -> None:
+        with self._lock:
+            channel = self._channels.get(match.match_id)
+            if channel is None:
+                return
+            frame = _sse_frame(match)
+            if frame == channel.last:
+                return
+            channel.last = frame
+            subscribers = list(channel.subscribers)
+            finished = match.status == "finished"
+            if finished:
+                # Partita chiusa: i client ricevono l'ultimo stato e la fine stream
+                del self._channels[match.match_id]
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_offer, queue, frame)
+            if finished:
+                loop.call_soon_threadsafe(_offer, queue, None)
+        if finished and channel.watch is not None:
+            # publish() può girare nel thread consumer del listener stesso:
+            # unsubscribe() lo attende con join(), quindi va chiamata altrove
+            threading.Thread(
+                target=self._stop_watch, args=(channel,), name="live-watch-stop", daemon=True,
+            ).start()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "matches": len(self._channels),
+                "subscribers": sum(len(c.subscribers) for c in self._channels.values()),
+                "listeners": sum(1 for c in self._channels.values() if c.watch is not None),
+            }
+
+    def _start_watch(self, match_id: str, channel: _Channel) -> None:
+        def _on_snapshot(docs, changes, read_time) -> None:
+            for doc in docs:
+                if doc.exists:
+                    self.publish(Match(**doc.to_dict()))
+
+        watch = db.collection("matches").document(match_id).on_snapshot(_on_snapshot)
+        with self._lock:
+            # Se nel frattempo se ne sono andati tutti, il listener non serve
+            if self._channels.get(match_id) is channel:
+                channel.watch = watch
+                return
+        watch.unsubscribe()
+
+    def _stop_watch(self, channel: _Channel) -> None:
+        with self._lock:
+            watch, channel.watch = channel.watch, None
+        if watch is not None:
+            watch.unsubscribe()
+
+
+live_scores = LiveScoreHub()
+
+
+async def stream_match_events(match_id: str, current: Optional[Match] = None):
+    """
+    Generatore SSE per StreamingResponse. Invia un commento di keep-alive
+    se non ci sono aggiornamenti, così le disconnessioni vengono rilevate.
+    Una partita già finita riceve solo lo stato finale.
+    """
+    if current is not None and current.status == "finished":
+        yield _sse_frame(current)
+        return
+    queue = await live_scores.subscribe(match_id, current)
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(queue.get(), LIVE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if frame is None:
+                return
+            yield frame
+    finally:
+        live_scores.unsubscribe(match_id, queue)
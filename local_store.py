@@ -0,0 +1,636 @@
+import copy
+import json
+import uuid
+import sqlite3
+import hashlib
+import secrets
+import threading
+from datetime import datetime, timedelta
+from functools import cmp_to_key
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore_v1.transforms import (
+    ArrayRemove,
+    ArrayUnion,
+    DELETE_FIELD,
+    Increment,
+    SERVER_TIMESTAMP,
+)
+
+
+# ============================================================
+# Backend locale (memoria / SQLite) al posto di Firestore
+# ============================================================
+# LocalClient implementa il sottoinsieme dell'API del client Firestore
+# usato dai service (collection/document/get/set/update/where/stream,
+# batch e transazioni), così users, user_stats, matches e match_stats
+# restano accessibili con lo stesso codice qualunque sia il backend.
+# Selezionato in config.py tramite STORAGE_BACKEND=memory|sqlite.
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+DOCUMENT_ID = "__name__"
+
+
+# ============================================================
+# 1. Storage: dizionario in memoria o tabella SQLite
+# ============================================================
+
+class _MemoryStorage:
+    def __init__(self):
+        self._collections: Dict[str, Dict[str, dict]] = {}
+
+    def get(self, collection: str, doc_id: str) -> Optional[dict]:
+        return self._collections.get(collection, {}).get(doc_id)
+
+    def put(self, collection: str, doc_id: str, data: dict) -> None:
+        self._collections.setdefault(collection, {})[doc_id] = data
+
+    def delete(self, collection: str, doc_id: str) -> None:
+        self._collections.get(collection, {}).pop(doc_id, None)
+
+    def scan(self, collection: str) -> List[Tuple[str, dict]]:
+        return list(self._collections.get(collection, {}).items())
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+
+class _SqliteStorage:
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " collection TEXT NOT NULL,"
+            " doc_id TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (collection, doc_id))"
+        )
+        self._conn.commit()
+
+    def get(self, collection: str, doc_id: str) -> Optional[dict]:
+        row = self._conn.execute(
+            "SELECT data FROM documents WHERE collection = ? AND doc_id = ?",
+            (collection, doc_id),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, collection: str, doc_id: str, data: dict) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (collection, doc_id, data) VALUES (?, ?, ?)",
+            (collection, doc_id, json.dumps(data, default=_json_default)),
+        )
+
+    def delete(self, collection: str, doc_id: str) -> None:
+        self._conn.execute(
+            "DELETE FROM documents WHERE collection = ? AND doc_id = ?",
+            (collection, doc_id),
+        )
+
+    def scan(self, collection: str) -> List[Tuple[str, dict]]:
+        rows = self._conn.execute(
+            "SELECT doc_id, data FROM documents WHERE collection = ?",
+            (collection,),
+        ).fetchall()
+        return [(doc_id, json.loads(data)) for doc_id, data in rows]
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+
+# ============================================================
+# 2. Applicazione dei valori speciali (Increment, SERVER_TIMESTAMP, ...)
+# ============================================================
+
+def _resolve_value(current: Any, value: Any) -> Any:
+    if value is SERVER_TIMESTAMP:
+        return datetime.utcnow()
+    if isinstance(value, Increment):
+        base = current if isinstance(current, (int, float)) else 0
+        return base + value.value
+    if isinstance(value, ArrayUnion):
+        base = list(current) if isinstance(current, list) else []
+        return base + [v for v in value.values if v not in base]
+    if isinstance(value, ArrayRemove):
+        base = list(current) if isinstance(current, list) else []
+        return [v for v in base if v not in value.values]
+    return copy.deepcopy(value)
+
+
+def _apply_field(doc: dict, field_path: str, value: Any) -> None:
+    parts = field_path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    if value is DELETE_FIELD:
+        target.pop(parts[-1], None)
+    else:
+        target[parts[-1]] = _resolve_value(target.get(parts[-1]), value)
+
+
+def _merge(doc: dict, data: dict) -> None:
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(doc.get(key), dict):
+            _merge(doc[key], value)
+        elif value is DELETE_FIELD:
+            doc.pop(key, None)
+        else:
+            doc[key] = _resolve_value(doc.get(key), value)
+
+
+def _lookup(doc: dict, doc_id: str, field_path: str) -> Tuple[bool, Any]:
+    if field_path == DOCUMENT_ID:
+        return True, doc_id
+    target: Any = doc
+    for part in field_path.split("."):
+        if not isinstance(target, dict) or part not in target:
+            return False, None
+        target = target[part]
+    return True, target
+
+
+# ============================================================
+# 3. Snapshot e riferimenti a documenti
+# ============================================================
+
+class LocalDocumentSnapshot:
+    def __init__(
+        self, reference: "LocalDocumentReference", data: Optional[dict], update_time: Optional[datetime] = None
+    ):
+        self.reference = reference
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str) -> Any:
+        found, value = _lookup(self._data or {}, self.id, field_path)
+        if not found:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class LocalDocumentReference:
+    def __init__(self, client: "LocalClient", collection_path: str, doc_id: str):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection_path}/{self.id}"
+
+    @property
+    def parent(self) -> "LocalCollectionReference":
+        return LocalCollectionReference(self._client, self._collection_path)
+
+    def collection(self, name: str) -> "LocalCollectionReference":
+        return LocalCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, transaction: Optional["LocalTransaction"] = None, **kwargs) -> LocalDocumentSnapshot:
+        self._client._count_round_trip("get")
+        return self._read()
+
+    def _read(self) -> LocalDocumentSnapshot:
+        with self._client._lock:
+            key = (self._collection_path, self.id)
+            data = self._client._storage.get(*key)
+            update_time = self._client._update_time(key) if data is not None else None
+            return LocalDocumentSnapshot(self, copy.deepcopy(data), update_time)
+
+    def set(self, document_data: dict, merge: bool = False) -> "LocalWriteResult":
+        batch = self._client.batch()
+        batch.set(self, document_data, merge=merge)
+        return batch.commit()[0]
+
+    def create(self, document_data: dict) -> "LocalWriteResult":
+        batch = self._client.batch()
+        batch.create(self, document_data)
+        return batch.commit()[0]
+
+    def update(self, field_updates: dict, option: Optional["LocalWriteOption"] = None) -> "LocalWriteResult":
+        batch = self._client.batch()
+        batch.update(self, field_updates, option=option)
+        return batch.commit()[0]
+
+    def delete(self) -> "LocalWriteResult":
+        batch = self._client.batch()
+        batch.delete(self)
+        return batch.commit()[0]
+
+
+# ============================================================
+# 4. Query e collection
+# ============================================================
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and b is not None and a < b,
+    "<=": lambda a, b: a is not None and b is not None and a <= b,
+    ">": lambda a, b: a is not None and b is not None and a > b,
+    ">=": lambda a, b: a is not None and b is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(v in a for v in b),
+}
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    # Stesso ordinamento per tipo di Firestore: null < bool < numeri < stringhe
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.isoformat())
+    return (4, str(value))
+
+
+class LocalQuery:
+    def __init__(
+        self,
+        client: "LocalClient",
+        collection_path: str,
+        filters: Tuple = (),
+        orders: Tuple = (),
+        limit_count: Optional[int] = None,
+        cursor: Optional[Tuple[Any, ...]] = None,
+    ):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes) -> "LocalQuery":
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit_count": self._limit,
+            "cursor": self._cursor,
+        }
+        state.update(changes)
+        return LocalQuery(self._client, self._collection_path, **state)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None,
+              value: Any = None, *, filter: Any = None) -> "LocalQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "LocalQuery":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "LocalQuery":
+        return self._copy(limit_count=count)
+
+    def start_after(self, document_fields_or_snapshot: Any) -> "LocalQuery":
+        if isinstance(document_fields_or_snapshot, LocalDocumentSnapshot):
+            snapshot = document_fields_or_snapshot
+            values = tuple(
+                snapshot.id if field == DOCUMENT_ID else (snapshot.to_dict() or {}).get(field)
+                for field, _ in self._orders
+            )
+        else:
+            values = tuple(document_fields_or_snapshot.get(field) for field, _ in self._orders)
+        return self._copy(cursor=values)
+
+    def _matches(self, doc_id: str, data: dict) -> bool:
+        for field_path, op_string, value in self._filters:
+            found, current = _lookup(data, doc_id, field_path)
+            if not found:
+                return False
+            if not _OPERATORS[op_string](current, value):
+                return False
+        return True
+
+    def _order_values(self, doc_id: str, data: dict) -> Optional[Tuple[Any, ...]]:
+        values = []
+        for field_path, _ in self._orders:
+            found, value = _lookup(data, doc_id, field_path)
+            if not found:
+                return None
+            values.append(value)
+        return tuple(values)
+
+    def _compare(self, left: Tuple[Any, ...], right: Tuple[Any, ...]) -> int:
+        for (_, direction), a, b in zip(self._orders, left, right):
+            ka, kb = _sort_key(a), _sort_key(b)
+            if ka == kb:
+                continue
+            result = -1 if ka < kb else 1
+            return -result if direction == DESCENDING else result
+        return 0
+
+    def stream(self, transaction: Optional["LocalTransaction"] = None, **kwargs) -> Iterator[LocalDocumentSnapshot]:
+        self._client._count_round_trip("query")
+        with self._client._lock:
+            rows = self._client._storage.scan(self._collection_path)
+        selected = []
+        for doc_id, data in rows:
+            if not self._matches(doc_id, data):
+                continue
+            order_values = self._order_values(doc_id, data)
+            if order_values is None:
+                continue
+            selected.append((order_values, doc_id, data))
+
+        # A parità di campi ordina per id del documento, come Firestore
+        selected.sort(key=lambda item: item[1])
+        selected.sort(key=cmp_to_key(lambda a, b: self._compare(a[0], b[0])))
+
+        if self._cursor is not None:
+            selected = [item for item in selected if self._compare(item[0], self._cursor) > 0]
+        if self._limit is not None:
+            selected = selected[: self._limit]
+
+        with self._client._lock:
+            update_times = [self._client._update_time((self._collection_path, item[1])) for item in selected]
+        for (_, doc_id, data), update_time in zip(selected, update_times):
+            ref = LocalDocumentReference(self._client, self._collection_path, doc_id)
+            yield LocalDocumentSnapshot(ref, copy.deepcopy(data), update_time)
+
+    def get(self, transaction: Optional["LocalTransaction"] = None, **kwargs) -> List[LocalDocumentSnapshot]:
+        return list(self.stream(transaction=transaction))
+
+
+class LocalCollectionReference(LocalQuery):
+    def __init__(self, client: "LocalClient", path: str):
+        super().__init__(client, path)
+
+    @property
+    def id(self) -> str:
+        return self._collection_path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> LocalDocumentReference:
+        return LocalDocumentReference(
+            self._client, self._collection_path, document_id or uuid.uuid4().hex[:20]
+        )
+
+    def add(self, document_data: dict) -> Tuple[None, LocalDocumentReference]:
+        ref = self.document()
+        ref.set(document_data)
+        return None, ref
+
+
+# ============================================================
+# 5. Batch e transazioni
+# ============================================================
+
+class LocalWriteOption:
+    """Precondizione last_update_time (client.write_option) per update()."""
+
+    def __init__(self, last_update_time: datetime):
+        self.last_update_time = last_update_time
+
+
+class LocalWriteResult:
+    def __init__(self, update_time: datetime):
+        self.update_time = update_time
+
+
+class LocalWriteBatch:
+    def __init__(self, client: "LocalClient"):
+        self._client = client
+        self._writes: List[Tuple[str, LocalDocumentReference, Optional[dict], bool, Optional[LocalWriteOption]]] = []
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def set(self, reference: LocalDocumentReference, document_data: dict, merge: bool = False) -> "LocalWriteBatch":
+        self._writes.append(("set", reference, document_data, merge, None))
+        return self
+
+    def create(self, reference: LocalDocumentReference, document_data: dict) -> "LocalWriteBatch":
+        self._writes.append(("create", reference, document_data, False, None))
+        return self
+
+    def update(
+        self, reference: LocalDocumentReference, field_updates: dict, option: Optional[LocalWriteOption] = None,
+    ) -> "LocalWriteBatch":
+        self._writes.append(("update", reference, field_updates, False, option))
+        return self
+
+    def delete(self, reference: LocalDocumentReference) -> "LocalWriteBatch":
+        self._writes.append(("delete", reference, None, False, None))
+        return self
+
+    def commit(self) -> list:
+        self._client._count_round_trip("commit")
+        storage = self._client._storage
+        with self._client._lock:
+            # Prima si calcolano tutti i nuovi stati, poi si applicano:
+            # se una precondizione fallisce non viene scritto nulla.
+            pending: Dict[Tuple[str, str], Optional[dict]] = {}
+            for kind, ref, data, merge, option in self._writes:
+                key = (ref._collection_path, ref.id)
+                current = pending[key] if key in pending else storage.get(*key)
+                if option is not None and (
+                    current is None or key in pending
+                    or self._client._update_time(key) != option.last_update_time
+                ):
+                    raise FailedPrecondition(f"Document modified since last_update_time: {ref.path}")
+                if kind == "create":
+                    if current is not None:
+                        raise AlreadyExists(f"Document already exists: {ref.path}")
+                    new_doc: Optional[dict] = {}
+                    _merge(new_doc, data)
+                elif kind == "set":
+                    new_doc = copy.deepcopy(current) if (merge and current) else {}
+                    _merge(new_doc, data)
+                elif kind == "update":
+                    if current is None:
+                        raise NotFound(f"No document to update: {ref.path}")
+                    new_doc = copy.deepcopy(current)
+                    for field_path, value in data.items():
+                        _apply_field(new_doc, field_path, value)
+                else:
+                    new_doc = None
+                pending[key] = new_doc
+
+            update_time = self._client._next_update_time()
+            for (collection, doc_id), data in pending.items():
+                if data is None:
+                    storage.delete(collection, doc_id)
+                    self._client._update_times.pop((collection, doc_id), None)
+                else:
+                    storage.put(collection, doc_id, data)
+                    self._client._update_times[(collection, doc_id)] = update_time
+            if hasattr(storage, "commit"):
+                storage.commit()
+        results = [LocalWriteResult(update_time) for _ in self._writes]
+        self._writes = []
+        return results
+
+
+class LocalTransaction(LocalWriteBatch):
+    """
+    Transazione locale: il lock del client viene tenuto per tutta la
+    durata della funzione, quindi letture e scritture sono serializzabili.
+    """
+
+    def get(self, ref_or_query: Any, **kwargs) -> Any:
+        if isinstance(ref_or_query, LocalDocumentReference):
+            return iter([ref_or_query.get()])
+        return ref_or_query.stream()
+
+
+# ============================================================
+# 6. Client
+# ============================================================
+
+class LocalClient:
+    def __init__(self, sqlite_path: Optional[str] = None):
+        self._storage = _SqliteStorage(sqlite_path) if sqlite_path else _MemoryStorage()
+        self._lock = threading.RLock()
+        # update_time dei documenti (solo in memoria: dopo un riavvio i
+        # documenti letti ricevono un nuovo update_time alla prima lettura)
+        self._update_times: Dict[Tuple[str, str], datetime] = {}
+        self._last_update_time = datetime.utcnow()
+        # Chiamate che con Firestore sarebbero un round trip di rete (benchmark)
+        self._round_trips: Dict[str, int] = {}
+        self._round_trips_lock = threading.Lock()
+
+    def _next_update_time(self) -> datetime:
+        # Strettamente crescente anche con più commit nello stesso microsecondo
+        self._last_update_time = max(datetime.utcnow(), self._last_update_time + timedelta(microseconds=1))
+        return self._last_update_time
+
+    def _update_time(self, key: Tuple[str, str]) -> datetime:
+        # Da chiamare con il lock, per documenti esistenti
+        if key not in self._update_times:
+            self._update_times[key] = self._next_update_time()
+        return self._update_times[key]
+
+    def write_option(self, last_update_time: datetime) -> LocalWriteOption:
+        return LocalWriteOption(last_update_time)
+
+    def _count_round_trip(self, kind: str) -> None:
+        with self._round_trips_lock:
+            self._round_trips[kind] = self._round_trips.get(kind, 0) + 1
+
+    def round_trips(self) -> Dict[str, int]:
+        """
+        Conteggio per tipo (get, get_all, query, commit, begin_transaction)
+        delle chiamate che su Firestore richiederebbero un round trip.
+        """
+        with self._round_trips_lock:
+            return dict(self._round_trips)
+
+    def reset_round_trips(self) -> None:
+        with self._round_trips_lock:
+            self._round_trips.clear()
+
+    def collection(self, name: str) -> LocalCollectionReference:
+        return LocalCollectionReference(self, name)
+
+    def document(self, path: str) -> LocalDocumentReference:
+        collection_path, doc_id = path.rsplit("/", 1)
+        return LocalDocumentReference(self, collection_path, doc_id)
+
+    def get_all(self, references: List[LocalDocumentReference], **kwargs) -> Iterator[LocalDocumentSnapshot]:
+        self._count_round_trip("get_all")
+        with self._lock:
+            snapshots = [ref._read() for ref in references]
+        return iter(snapshots)
+
+    def batch(self) -> LocalWriteBatch:
+        return LocalWriteBatch(self)
+
+    def transaction(self, **kwargs) -> LocalTransaction:
+        self._count_round_trip("begin_transaction")
+        return LocalTransaction(self)
+
+
+# ============================================================
+# 7. Auth locale (sostituisce firebase_admin.auth)
+# ============================================================
+
+class LocalUserRecord:
+    def __init__(self, data: dict):
+        self.uid: str = data["uid"]
+        self.email: Optional[str] = data.get("email")
+        self.display_name: Optional[str] = data.get("display_name")
+
+
+def _hash_password(password: str, salt: Optional[bytes] = None) -> str:
+    salt = salt or secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, 100_000)
+    return f"{salt.hex()}${digest.hex()}"
+
+
+class LocalAuth:
+    """
+    Gestione utenti senza Firebase Auth: gli account sono salvati nella
+    collection interna `_auth_users` dello stesso LocalClient.
+    """
+
+    def __init__(self, client: LocalClient):
+        self._users = client.collection("_auth_users")
+
+    def create_user(self, email: Optional[str] = None, password: Optional[str] = None,
+                    display_name: Optional[str] = None, **kwargs) -> LocalUserRecord:
+        if email and list(self._users.where("email", "==", email).limit(1).stream()):
+            raise ValueError(f"Email già registrata: {email}")
+        uid = uuid.uuid4().hex[:28]
+        data = {
+            "uid": uid,
+            "email": email,
+            "display_name": display_name,
+            "password_hash": _hash_password(password) if password else None,
+        }
+        self._users.document(uid).set(data)
+        return LocalUserRecord(data)
+
+    def get_user(self, uid: str) -> LocalUserRecord:
+        doc = self._users.document(uid).get()
+        if not doc.exists:
+            raise ValueError(f"Nessun utente con uid {uid}")
+        return LocalUserRecord(doc.to_dict())
+
+    def get_user_by_email(self, email: str) -> LocalUserRecord:
+        docs = list(self._users.where("email", "==", email).limit(1).stream())
+        if not docs:
+            raise ValueError(f"Nessun utente con email {email}")
+        return LocalUserRecord(docs[0].to_dict())
+
+    def verify_password(self, email: str, password: str) -> LocalUserRecord:
+        """Equivalente locale di signInWithPassword di Firebase Auth."""
+        docs = list(self._users.where("email", "==", email).limit(1).stream())
+        data = docs[0].to_dict() if docs else None
+        if not data or not data.get("password_hash"):
+            raise ValueError("Credenziali non valide")
+        salt, _ = data["password_hash"].split("$", 1)
+        if not secrets.compare_digest(_hash_password(password, bytes.fromhex(salt)), data["password_hash"]):
+            raise ValueError("Credenziali non valide")
+        return LocalUserRecord(data)
+
+    def delete_user(self, uid: str) -> None:
+        self._users.document(uid).delete()
+
+    def create_custom_token(self, uid: str, developer_claims: Optional[dict] = None) -> bytes:
+        return secrets.token_urlsafe(32).encode()
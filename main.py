@@ -1,26 +1,64 @@
-from fastapi import FastAPI, HTTPException, Depends
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import os
+import asyncio
+import secrets
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from typing import Optional
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import List, Optional
 from pathlib import Path
+from contextlib import asynccontextmanager
+from datetime import datetime
 
 from models import (
     RegisterWithEmailRequest,
     RegisterWithNicknameRequest,
+    RegisterBatchRequest,
+    RegisterBatchResponse,
     LoginWithEmailRequest,
     LoginWithNicknameRequest,
     UserResponse,
     UpdateUserRequest,
+    UserSearchResponse,
+    UserStats,
     MatchCreateRequest,
     MatchResponse,
+    MatchScoreUpdateRequest,
+    MatchSettlementRequest,
+    MatchSettlementResponse,
+    MatchStats,
+    MatchLogEvent,
+    MatchLogEventBatch,
+    MatchLogPage,
+    EventSettleRequest,
+    EventBatchSettleRequest,
+    EventSettlement,
+    EventFinalizeRequest,
+    EventFinalization,
+    TeamBalanceRequest,
+    TeamBalanceResponse,
+    BetCreateRequest,
+    BetResponse,
+    BetBatchRequest,
+    BetBatchResponse,
+    BetSettlementResponse,
+    LeaderboardResponse,
+    UserRankResponse,
+    BulkImportResponse,
 )
 
 from auth_service import (
     register_with_email,  # <--- CAMBIATO
     register_with_nickname,  # <--- CAMBIATO
+    register_batch,
     login_with_email,
     login_with_nickname,
+    AuthNotConfigured,
+    check_auth_config,
 )
 
 from user_service import (
@@ -32,17 +70,191 @@ from user_service import (
 from match_service import (
     create_match,
     get_match_by_id,
-    get_matches_by_status,
+    list_matches,
+    decode_match_cursor,
+    settle_match,
+    update_match_score_and_status,
+    get_match_stats,
+    MATCH_PAGE_SIZE,
+)
+
+from match_log_service import (
+    append_match_events,
+    list_match_events,
+    compact_match_events,
+    compact_pending_matches,
+    MATCH_EVENTS_COMPACT_INTERVAL,
+)
+
+from live_service import live_scores, stream_match_events
+
+from settlement_service import (
+    get_event,
+    get_events,
+    settle_event,
+    settle_events,
+)
+
+from stats_service import finalize_event
+
+from team_service import build_balance, load_skills
+
+from leaderboard_service import leaderboard, LEADERBOARD_METRICS, LEADERBOARD_REBUILD_INTERVAL
+
+from handle_service import handle_index, HANDLE_INDEX_REFRESH_INTERVAL
+
+from bulk_service import (
+    BULK_COLLECTIONS,
+    BULK_MAX_RETRIES,
+    BULK_PAGE_SIZE,
+    BULK_PARALLELISM,
+    NdjsonImporter,
+    export_page,
+    to_ndjson,
+)
+
+from bet_service import (
+    place_bet,
+    place_bets,
+    list_bets_by_user,
+    list_bets_by_match,
+    settle_finished_match_bets,
+    shutdown_settlement_executor,
 )
 
+from static_files import build_manifest, static_response, IMMUTABLE_PREFIX
+
+from fast_json import respond
+from session import verify_session_token
+
+from config import STARTUP_TIMINGS, STORAGE_BACKEND, warm_up
+from datastore import run_db, shutdown_db_executor
+from compute import run_cpu, shutdown_cpu_executor, warm_up_cpu_pool
+from metrics import (
+    METRICS_ENABLED,
+    METRICS_TOKEN,
+    MetricsMiddleware,
+    register_collector,
+    render_metrics,
+    sample_lines,
+)
+from cache import all_cache_stats
+from singleflight import all_flight_stats
+
 # ====
 # Inizializzazione FastAPI
 # ====
 
+# Warm-up di Firebase in background all'avvio (FIREBASE_WARMUP=0 per disattivarlo)
+FIREBASE_WARMUP = os.getenv("FIREBASE_WARMUP", "1") == "1"
+
+STARTUP_TIMINGS["import_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+
+# Attesa massima tra i tentativi della prima costruzione degli indici in memoria
+STARTUP_RETRY_MAX = float(os.getenv("STARTUP_RETRY_MAX", "60"))
+
+
+def _retry_delay(attempt: int) -> float:
+    # 1, 2, 4, ... secondi fino a STARTUP_RETRY_MAX
+    return min(2 ** attempt, STARTUP_RETRY_MAX)
+
+
+async def _maintain_leaderboard():
+    # Finché la prima costruzione non riesce si riprova con backoff,
+    # qualunque sia LEADERBOARD_REBUILD_INTERVAL
+    built = False
+    failures = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            players = await run_db(leaderboard.rebuild)
+            STARTUP_TIMINGS.setdefault("leaderboard_ms", round((time.perf_counter() - started) * 1000, 1))
+            STARTUP_TIMINGS.setdefault("leaderboard_players", players)
+            STARTUP_TIMINGS.pop("leaderboard_error", None)
+            built = True
+        except Exception as e:
+            STARTUP_TIMINGS["leaderboard_error"] = str(e)
+            if not built:
+                await asyncio.sleep(_retry_delay(failures))
+                failures += 1
+                continue
+        if LEADERBOARD_REBUILD_INTERVAL <= 0:
+            return
+        await asyncio.sleep(LEADERBOARD_REBUILD_INTERVAL)
+
+
+async def _refresh_handle_index():
+    # Prima lettura completa, poi solo gli handle modificati da altri worker.
+    # Finché la prima lettura non riesce si riprova con backoff.
+    loaded = False
+    failures = 0
+    while True:
+        try:
+            await run_db(handle_index.refresh)
+            loaded = True
+        except Exception:
+            if not loaded:
+                await asyncio.sleep(_retry_delay(failures))
+                failures += 1
+                continue
+            # dopo la prima lettura si riprova al giro successivo
+        if HANDLE_INDEX_REFRESH_INTERVAL <= 0:
+            return
+        await asyncio.sleep(HANDLE_INDEX_REFRESH_INTERVAL)
+
+
+async def _compact_match_events():
+    # Somma periodicamente gli eventi nuovi nei contatori di match_stats
+    while True:
+        await asyncio.sleep(MATCH_EVENTS_COMPACT_INTERVAL)
+        try:
+            await run_db(compact_pending_matches)
+        except Exception:
+            pass  # si riprova al giro successivo
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Con Firestore senza FIREBASE_WEB_API_KEY o SESSION_SECRET non si parte
+    check_auth_config()
+    warmup = None
+    if FIREBASE_WARMUP and STORAGE_BACKEND == "firestore":
+        # Non blocca l'avvio: /health risponde subito, le prime richieste
+        # trovano il client e il canale gRPC già pronti
+        warmup = asyncio.create_task(run_db(warm_up))
+    # Classifiche ricostruite in background: fino ad allora /leaderboard risponde 503
+    leaderboard_task = asyncio.create_task(_maintain_leaderboard())
+    # Indice per /users/search: 503 fino alla prima lettura degli handle
+    handles_task = asyncio.create_task(_refresh_handle_index())
+    # Processi per il lavoro CPU-bound avviati in background
+    cpu_warmup = asyncio.create_task(warm_up_cpu_pool())
+    compactor = None
+    if MATCH_EVENTS_COMPACT_INTERVAL > 0:
+        compactor = asyncio.create_task(_compact_match_events())
+    STARTUP_TIMINGS["ready_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+    yield
+    leaderboard_task.cancel()
+    handles_task.cancel()
+    if compactor is not None:
+        compactor.cancel()
+    if warmup is not None:
+        await warmup
+    try:
+        await cpu_warmup
+    except Exception:
+        pass  # un pool guasto lo segnalano le richieste che lo usano
+    # Attende i regolamenti delle scommesse in corso, poi chiude il pool
+    # di thread usato per le chiamate a Firestore
+    shutdown_settlement_executor()
+    shutdown_cpu_executor()
+    shutdown_db_executor()
+
+
 app = FastAPI(
     title="PenaltyHub API",
     description="Backend per l'app di scommesse e calcio",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # ====
@@ -57,6 +269,10 @@ app.add_middleware(
     allow_headers=["*"],  # Permette tutti gli header
 )
 
+# Latenza, richieste in corso ed errori per route (solo con METRICS_ENABLED=1)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # ====
 # API Status endpoint (spostato da "/" a "/api")
 # ====
@@ -69,6 +285,42 @@ def api_status():
         "version": "1.0.0"
     }
 
+# ====
+# SESSIONE
+# ====
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def get_current_uid(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+) -> str:
+    """
+    Dependency per le route autenticate: verifica in locale il token di
+    sessione emesso al login (nessuna chiamata a Firebase) e restituisce l'uid.
+    """
+    if credentials is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Token di sessione mancante",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        return verify_session_token(credentials.credentials)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+# Uid autorizzati agli endpoint /admin, separati da virgola
+ADMIN_UIDS = {uid.strip() for uid in os.getenv("ADMIN_UIDS", "").split(",") if uid.strip()}
+
+
+def require_admin(current_uid: str = Depends(get_current_uid)) -> str:
+    if current_uid not in ADMIN_UIDS:
+        raise HTTPException(status_code=403, detail="Riservato agli amministratori")
+    return current_uid
+
+
 # ====
 # AUTH ENDPOINTS
 # ====
@@ -80,8 +332,8 @@ async def register_email(req: RegisterWithEmailRequest):
     Genera automaticamente nickname#tag se non forniti.
     """
     try:
-        user_data = register_with_email(req)  # <--- CAMBIATO
-        return user_data
+        user_data = await run_db(register_with_email, req)
+        return respond(user_data, UserResponse)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -92,8 +344,20 @@ async def register_nickname(req: RegisterWithNicknameRequest):
     Registrazione con nickname#tag + password (senza email).
     """
     try:
-        user_data = register_with_nickname(req)  # <--- CAMBIATO
-        return user_data
+        user_data = await run_db(register_with_nickname, req)
+        return respond(user_data, UserResponse)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/auth/register/batch", response_model=RegisterBatchResponse)
+async def register_roster(req: RegisterBatchRequest):
+    """
+    Registrazione in blocco (es. rosa di un club) con nickname#tag + password.
+    Gli utenti non registrabili vengono riportati in `errors`.
+    """
+    try:
+        return respond(await run_db(register_batch, req), RegisterBatchResponse)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -104,8 +368,10 @@ async def login_email(req: LoginWithEmailRequest):
     Login con email + password.
     """
     try:
-        user_data = login_with_email(req)  # <--- CAMBIATO
-        return user_data
+        user_data = await run_db(login_with_email, req)
+        return respond(user_data, UserResponse)
+    except AuthNotConfigured as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
@@ -116,10 +382,12 @@ async def login_nickname(req: LoginWithNicknameRequest):
     Login con nickname#tag + password.
     """
     try:
-        user_data = login_with_nickname(req)  # <--- CAMBIATO
+        user_data = await run_db(login_with_nickname, req)
         if not user_data:
             raise HTTPException(status_code=401, detail="Invalid credentials")
-        return user_data
+        return respond(user_data, UserResponse)
+    except AuthNotConfigured as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
@@ -128,42 +396,60 @@ async def login_nickname(req: LoginWithNicknameRequest):
 # USER ENDPOINTS
 # ====
 
+@app.get("/users/search", response_model=UserSearchResponse)
+async def search_users(
+    prefix: str = Query(..., min_length=1, max_length=30),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Giocatori il cui nickname inizia con il prefisso (senza distinzione
+    tra maiuscole e minuscole), dall'indice in memoria degli handle.
+    Va registrata prima di /users/{uid}.
+    """
+    if not handle_index.ready:
+        raise HTTPException(status_code=503, detail="Indice dei giocatori in costruzione")
+    return respond(UserSearchResponse(results=handle_index.search(prefix, limit)), UserSearchResponse)
+
+
 @app.get("/users/{uid}", response_model=UserResponse)
 async def get_user(uid: str):
     """
     Ottieni i dati di un utente tramite UID.
     """
     try:
-        user_data = get_user_by_uid(uid)
+        user_data = await run_db(get_user_by_uid, uid)
         if not user_data:
             raise HTTPException(status_code=404, detail="User not found")
-        return user_data
+        return respond(user_data, UserResponse)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.put("/users/{uid}", response_model=UserResponse)
-async def update_user(uid: str, req: UpdateUserRequest):
+async def update_user(uid: str, req: UpdateUserRequest, current_uid: str = Depends(get_current_uid)):
     """
-    Aggiorna il profilo di un utente.
+    Aggiorna il profilo di un utente. Richiede il token di sessione
+    dello stesso utente.
     """
+    if current_uid != uid:
+        raise HTTPException(status_code=403, detail="Puoi modificare solo il tuo profilo")
     try:
-        updated_user = update_user_profile(uid, req.dict(exclude_unset=True))
-        return updated_user
+        updated_user = await run_db(update_user_profile, uid, req)
+        return respond(updated_user, UserResponse)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@app.get("/users/{uid}/stats")
+@app.get("/users/{uid}/stats", response_model=UserStats)
 async def get_stats(uid: str):
     """
-    Ottieni le statistiche di un utente.
+    Ottieni le statistiche aggregate di un utente (partite ed eventi).
     """
     try:
-        stats = get_user_stats(uid)
+        stats = await run_db(get_user_stats, uid)
         if not stats:
             raise HTTPException(status_code=404, detail="Stats not found")
-        return stats
+        return respond(stats, UserStats)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -178,13 +464,8 @@ async def create_new_match(req: MatchCreateRequest):
     Crea una nuova partita.
     """
     try:
-        match_data = create_match(
-            home_team=req.home_team,
-            away_team=req.away_team,
-            start_time=req.start_time,
-            league=req.league
-        )
-        return match_data
+        match_data = await run_db(create_match, req)
+        return respond(match_data, MatchResponse)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -195,34 +476,527 @@ async def get_match(match_id: str):
     Ottieni i dettagli di una partita tramite ID.
     """
     try:
-        match_data = get_match_by_id(match_id)
+        match_data = await run_db(get_match_by_id, match_id)
+        if not match_data:
+            raise HTTPException(status_code=404, detail="Match not found")
+        return respond(match_data, MatchResponse)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.put("/matches/{match_id}/score", response_model=MatchResponse)
+async def update_score(
+    match_id: str, req: MatchScoreUpdateRequest, admin_uid: str = Depends(require_admin)
+):
+    """
+    Aggiorna punteggio (ed eventualmente stato) di una partita.
+    I client collegati a /matches/{match_id}/live ricevono subito la modifica.
+    Riservato agli amministratori: la chiusura regola tutte le scommesse.
+    """
+    try:
+        end_time = datetime.utcnow() if req.status == "finished" else None
+        match_data = await run_db(
+            update_match_score_and_status,
+            match_id,
+            req.home_score,
+            req.away_score,
+            req.status,
+            end_time,
+        )
         if not match_data:
             raise HTTPException(status_code=404, detail="Match not found")
-        return match_data
+        return respond(match_data, MatchResponse)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/matches/{match_id}/live")
+async def follow_match(match_id: str):
+    """
+    Segue una partita in diretta con Server-Sent Events: un evento `score`
+    con lo stato attuale e uno per ogni aggiornamento, fino alla fine della
+    partita. Tutti gli spettatori condividono un solo listener per partita.
+    """
+    current = None
+    if not live_scores.has_state(match_id):
+        # Primo spettatore: una lettura per lo stato iniziale
+        current = await run_db(get_match_by_id, match_id)
+        if not current:
+            raise HTTPException(status_code=404, detail="Match not found")
+    return StreamingResponse(
+        stream_match_events(match_id, current),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/matches/{match_id}/events", response_model=List[MatchLogEvent])
+async def record_match_events(
+    match_id: str, req: MatchLogEventBatch, admin_uid: str = Depends(require_admin)
+):
+    """
+    Registra uno o più eventi della partita (gol, tiri, cartellini, tunnel,
+    possesso). Ogni evento riceve un id crescente nel tempo.
+    Riservato agli amministratori.
+    """
+    try:
+        events = await run_db(append_match_events, match_id, req.events)
+        if events is None:
+            raise HTTPException(status_code=404, detail="Match not found")
+        return respond(events)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/matches/{match_id}/events", response_model=MatchLogPage)
+async def get_match_events(
+    match_id: str,
+    since: str = Query(""),
+    limit: int = Query(200, ge=1, le=500),
+):
+    """
+    Eventi della partita con id > since, in ordine. Per restare
+    aggiornati basta ripassare `cursor` come `since`.
+    """
+    try:
+        return respond(await run_db(list_match_events, match_id, since, limit), MatchLogPage)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/matches/{match_id}/stats", response_model=MatchStats)
+async def get_stats_of_match(match_id: str):
+    """
+    Statistiche compattate della partita. Gli eventi con id >
+    compacted_id non sono ancora nei contatori: si leggono da
+    /matches/{match_id}/events?since=compacted_id.
+    """
+    try:
+        stats = await run_db(get_match_stats, match_id)
+        if not stats:
+            raise HTTPException(status_code=404, detail="Match not found")
+        return respond(stats, MatchStats)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/matches/{match_id}/events/compact", response_model=MatchStats)
+async def compact_events_now(match_id: str, admin_uid: str = Depends(require_admin)):
+    """
+    Compatta subito gli eventi della partita (di solito lo fa il job periodico).
+    Riservato agli amministratori.
+    """
+    try:
+        await run_db(compact_match_events, match_id)
+        stats = await run_db(get_match_stats, match_id)
+        if not stats:
+            raise HTTPException(status_code=404, detail="Match not found")
+        return respond(stats, MatchStats)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/matches/{match_id}/settle", response_model=MatchSettlementResponse)
+async def settle_finished_match(
+    match_id: str, req: MatchSettlementRequest, admin_uid: str = Depends(require_admin)
+):
+    """
+    Aggiorna le statistiche di tutti i giocatori di una partita finita.
+    Idempotente: ripetere la chiamata non conta la partita due volte.
+    Riservato agli amministratori.
+    """
+    try:
+        result = await run_db(settle_match, match_id, req.players)
+        if not result:
+            raise HTTPException(status_code=404, detail="Match not found")
+        return respond(result, MatchSettlementResponse)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/matches")
-async def list_matches(status: Optional[str] = None):
+async def get_matches(
+    status: Optional[str] = None,
+    league: Optional[str] = None,
+    start_from: Optional[str] = None,
+    start_to: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    start_after: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
     """
-    Lista tutte le partite, opzionalmente filtrate per status.
-    Status possibili: scheduled, live, finished
+    Lista le partite ordinate per start_time, con paginazione a cursore.
+    Filtri opzionali: status (scheduled, live, finished), league e
+    intervallo [start_from, start_to) su start_time (ISO 8601).
+    Passare `next_cursor` come `start_after` per la pagina successiva.
+    Con format=ndjson restituisce tutte le partite in streaming, una per riga.
     """
+    filters = {
+        "status": status,
+        "league": league,
+        "start_from": start_from,
+        "start_to": start_to,
+    }
+    if format == "ndjson":
+        if start_after:
+            try:
+                decode_match_cursor(start_after)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        return StreamingResponse(
+            _stream_matches_ndjson(filters, start_after),
+            media_type="application/x-ndjson",
+        )
     try:
-        matches = get_matches_by_status(status)
-        return {"matches": matches}
+        matches, next_cursor = await run_db(
+            list_matches, limit=limit, start_after=start_after, **filters
+        )
+        return respond({"matches": matches, "next_cursor": next_cursor})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+async def _stream_matches_ndjson(filters: dict, cursor: Optional[str]):
+    # Una pagina alla volta dal pool del datastore, inviata riga per riga
+    while True:
+        page, cursor = await run_db(
+            list_matches, limit=MATCH_PAGE_SIZE, start_after=cursor, **filters
+        )
+        for match in page:
+            yield match.model_dump_json() + "\n"
+        if cursor is None:
+            return
+
+
+# ====
+# EVENT ENDPOINTS
+# ====
+
+@app.post("/events/{event_id}/settle", response_model=EventSettlement)
+async def settle_single_event(event_id: str, req: EventSettleRequest):
+    """
+    Calcola quote, multe e importi finali dei partecipanti di un evento.
+    L'evento può essere inviato nel body o letto dalla collection `events`.
+    """
+    try:
+        event = req.event or await run_db(get_event, event_id)
+        if not event:
+            raise HTTPException(status_code=404, detail="Event not found")
+        if event.id != event_id:
+            raise ValueError("L'id dell'evento non corrisponde all'URL")
+        return respond(await run_cpu(settle_event, event, req.global_rules), EventSettlement)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/events/settle/batch", response_model=List[EventSettlement])
+async def settle_events_batch(req: EventBatchSettleRequest):
+    """
+    Calcolo in blocco (es. riconciliazione di fine stagione): eventi nel
+    body e/o id di eventi salvati, con le stesse regole globali.
+    """
+    try:
+        events = req.events + (await run_db(get_events, req.event_ids) if req.event_ids else [])
+        return respond(await run_cpu(settle_events, events, req.global_rules))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/events/{event_id}/finalize", response_model=EventFinalization)
+async def finalize_closed_event(
+    event_id: str, req: EventFinalizeRequest, admin_uid: str = Depends(require_admin)
+):
+    """
+    Chiude un evento: calcola gli importi e aggiorna le statistiche
+    aggregate dei partecipanti registrati. Idempotente. Riservato agli
+    amministratori: incrementa le statistiche di tutti i partecipanti.
+    """
+    try:
+        result = await run_db(finalize_event, event_id, req.event, req.global_rules)
+        if not result:
+            raise HTTPException(status_code=404, detail="Event not found")
+        return respond(result, EventFinalization)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ====
+# BET ENDPOINTS
+# ====
+
+@app.post("/bets", response_model=BetResponse)
+async def create_bet(req: BetCreateRequest, current_uid: str = Depends(get_current_uid)):
+    """
+    Piazza una scommessa su una partita non ancora finita.
+    Tipi: 1X2 ("1", "X", "2"), over_under ("over_2.5", "under_2.5"),
+    both_teams_score ("yes", "no").
+    """
+    if req.uid != current_uid:
+        raise HTTPException(status_code=403, detail="Puoi scommettere solo per il tuo utente")
+    try:
+        return respond(await run_db(place_bet, req), BetResponse)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/bets/batch", response_model=BetBatchResponse)
+async def create_bets_batch(req: BetBatchRequest, current_uid: str = Depends(get_current_uid)):
+    """
+    Piazza fino a 500 scommesse con un solo commit (tutte o nessuna).
+    """
+    if any(bet.uid != current_uid for bet in req.bets):
+        raise HTTPException(status_code=403, detail="Puoi scommettere solo per il tuo utente")
+    try:
+        bets = await run_db(place_bets, req.bets)
+        return respond(BetBatchResponse(bets=bets), BetBatchResponse)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/users/{uid}/bets")
+async def get_user_bets(
+    uid: str,
+    status: Optional[str] = Query(None, pattern="^(pending|won|lost|void)$"),
+    limit: int = Query(50, ge=1, le=200),
+    start_after: Optional[str] = None,
+    current_uid: str = Depends(get_current_uid),
+):
+    """
+    Scommesse di un utente, dalla più recente, con paginazione a cursore.
+    Richiede il token di sessione dello stesso utente.
+    """
+    if current_uid != uid:
+        raise HTTPException(status_code=403, detail="Puoi vedere solo le tue scommesse")
+    try:
+        bets, next_cursor = await run_db(
+            list_bets_by_user, uid, status=status, limit=limit, start_after=start_after
+        )
+        return respond({"bets": bets, "next_cursor": next_cursor})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/matches/{match_id}/bets")
+async def get_match_bets(
+    match_id: str,
+    status: Optional[str] = Query(None, pattern="^(pending|won|lost|void)$"),
+    limit: int = Query(50, ge=1, le=200),
+    start_after: Optional[str] = None,
+):
+    """
+    Scommesse su una partita, dalla più recente, con paginazione a cursore.
+    """
+    try:
+        bets, next_cursor = await run_db(
+            list_bets_by_match, match_id, status=status, limit=limit, start_after=start_after
+        )
+        return respond({"bets": bets, "next_cursor": next_cursor})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/matches/{match_id}/bets/settle", response_model=BetSettlementResponse)
+async def settle_match_bets_now(match_id: str, admin_uid: str = Depends(require_admin)):
+    """
+    Regola subito le scommesse ancora in sospeso di una partita finita.
+    Normalmente lo fa un job in background alla chiusura della partita;
+    ripetere la chiamata è sicuro. Riservato agli amministratori.
+    """
+    try:
+        result = await run_db(settle_finished_match_bets, match_id)
+        if not result:
+            raise HTTPException(status_code=404, detail="Match not found")
+        return respond(result, BetSettlementResponse)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ====
+# LEADERBOARD ENDPOINTS
+# ====
+
+_METRIC_PATTERN = "^(" + "|".join(LEADERBOARD_METRICS) + ")$"
+
+
+def _require_leaderboard() -> None:
+    if not leaderboard.ready:
+        raise HTTPException(status_code=503, detail="Classifica in costruzione, riprova tra poco")
+
+
+@app.get("/leaderboard", response_model=LeaderboardResponse)
+async def get_leaderboard(
+    metric: str = Query("wins", pattern=_METRIC_PATTERN),
+    limit: int = Query(10, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Classifica dei giocatori per wins, goals_scored, clean_sheets o
+    win_rate, servita dall'indice in memoria (nessuna lettura su Firestore).
+    """
+    _require_leaderboard()
+    return respond(leaderboard.top(metric, limit, offset), LeaderboardResponse)
+
+
+@app.get("/users/{uid}/rank", response_model=UserRankResponse)
+async def get_user_rank(uid: str, metric: str = Query("wins", pattern=_METRIC_PATTERN)):
+    """
+    Posizione di un giocatore in una classifica (a pari merito stesso rank).
+    """
+    _require_leaderboard()
+    rank = leaderboard.rank(uid, metric)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="Giocatore non in classifica")
+    return respond(rank, UserRankResponse)
+
+
+# ====
+# TEAM ENDPOINTS
+# ====
+
+@app.post("/teams/balance", response_model=TeamBalanceResponse)
+async def balance(req: TeamBalanceRequest):
+    """
+    Divide i giocatori in due squadre equilibrate per skill (calcolata dalle
+    statistiche salvate) e ruoli. Restituisce più divisioni quasi ottime.
+    """
+    try:
+        skills = await run_db(load_skills, req)
+        return respond(await run_cpu(build_balance, req, skills), TeamBalanceResponse)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ====
+# ADMIN ENDPOINTS (export/import NDJSON)
+# ====
+
+def _require_bulk_collection(collection: str) -> None:
+    if collection not in BULK_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Collection non supportata: {collection}")
+
+
+@app.get("/admin/export/{collection}")
+async def admin_export(collection: str, admin_uid: str = Depends(require_admin)):
+    """
+    Tutti i documenti di users, user_stats, matches o match_stats in
+    NDJSON, letti a pagine con cursore: memoria costante.
+    """
+    _require_bulk_collection(collection)
+    return StreamingResponse(_stream_export(collection), media_type="application/x-ndjson")
+
+
+async def _stream_export(collection: str):
+    cursor = None
+    while True:
+        page, cursor = await run_db(export_page, collection, cursor)
+        for row in page:
+            yield to_ndjson(row)
+        if cursor is None:
+            return
+
+
+@app.post("/admin/import/{collection}", response_model=BulkImportResponse)
+async def admin_import(
+    collection: str,
+    request: Request,
+    parallelism: int = Query(BULK_PARALLELISM, ge=1, le=64),
+    retries: int = Query(BULK_MAX_RETRIES, ge=1, le=20),
+    admin_uid: str = Depends(require_admin),
+):
+    """
+    Importa un body NDJSON (una riga per documento) letto in streaming.
+    Le righe sono validate con i modelli dell'API e scritte con set():
+    rieseguire lo stesso import è sicuro. Restituisce conteggi, errori e
+    righe al secondo.
+    """
+    _require_bulk_collection(collection)
+    importer = await run_db(NdjsonImporter, collection, parallelism, retries)
+    lines: List[bytes] = []
+    pending = b""
+    try:
+        async for chunk in request.stream():
+            *complete, pending = (pending + chunk).split(b"\n")
+            lines.extend(complete)
+            if len(lines) >= BULK_PAGE_SIZE:
+                await run_db(importer.feed, lines)
+                lines = []
+        lines.append(pending)
+        await run_db(importer.feed, lines)
+    except Exception as e:
+        await run_db(importer.close)
+        raise HTTPException(status_code=400, detail=str(e))
+    return respond(await run_db(importer.close), BulkImportResponse)
+
+
 # ====
 # Health Check
 # ====
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "message": "Backend is healthy"}
+    return {"status": "ok", "message": "Backend is healthy", "startup": STARTUP_TIMINGS}
+
+
+@app.get("/health/cache")
+def cache_stats():
+    """
+    Contatori hit/miss delle cache in-process e delle letture coalescenti.
+    """
+    return {
+        "caches": all_cache_stats(),
+        "singleflight": all_flight_stats(),
+        "live": live_scores.stats(),
+        "leaderboard": leaderboard.stats(),
+        "handles": handle_index.stats(),
+    }
+
+
+if METRICS_ENABLED:
+
+    register_collector(lambda: sample_lines(
+        "live_score_connections", "Canali, spettatori e listener delle partite in diretta.",
+        "gauge", "kind", live_scores.stats(),
+    ))
+    register_collector(lambda: sample_lines(
+        "leaderboard_players", "Giocatori presenti in ogni classifica in memoria.",
+        "gauge", "metric", leaderboard.stats(),
+    ))
+
+    def require_metrics_access(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+    ) -> None:
+        if (
+            METRICS_TOKEN
+            and credentials is not None
+            and secrets.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode())
+        ):
+            return
+        require_admin(get_current_uid(credentials))
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics(_: None = Depends(require_metrics_access)):
+        """
+        Metriche in formato Prometheus: route HTTP, operazioni sul
+        datastore per collection, cache in-process. Richiede METRICS_TOKEN
+        o un amministratore.
+        """
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 # ====
@@ -233,22 +1007,25 @@ dist_path = Path(__file__).parent / "dist"
 
 if dist_path.exists() and (dist_path / "index.html").exists():
 
-    app.mount("/assets", StaticFiles(directory=str(dist_path / "assets"), html=True), name="assets")
+    # Manifest in memoria di dist/ (varianti compresse, ETag, cache header)
+    static_manifest = build_manifest(dist_path)
 
-    @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
+    @app.api_route("/{full_path:path}", methods=["GET", "HEAD"])
+    async def serve_spa(full_path: str, request: Request):
 
-        if full_path in ["health", "api", "docs", "openapi.json", "redoc"]:
+        if full_path in ["health", "api", "docs", "openapi.json", "redoc", "metrics"]:
             raise HTTPException(status_code=404)
 
-        if full_path.startswith("auth") or full_path.startswith("users") or full_path.startswith("matches"):
+        if full_path.startswith(("auth", "users", "matches", "events", "teams", "bets", "leaderboard", "admin")):
             raise HTTPException(status_code=404)
 
-        file_path = dist_path / full_path
-        if file_path.is_file():
-            return FileResponse(file_path)
+        entry = static_manifest.get(full_path)
+        if entry is None:
+            if full_path.startswith(IMMUTABLE_PREFIX):
+                raise HTTPException(status_code=404)
+            entry = static_manifest["index.html"]
 
-        return FileResponse(dist_path / "index.html")
+        return static_response(request, entry)
 else:
 
     @app.get("/")
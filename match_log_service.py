@@ -0,0 +1,187 @@
+import os
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config import db
+from datastore import run_transaction
+from models import MatchLogEvent, MatchLogEventCreate, MatchLogPage
+
+
+# ============================================================
+# Log degli eventi di partita (append-only)
+# ============================================================
+# Ogni evento (gol, tiro, cartellino, tunnel...) è un documento a sé in
+# match_stats/{match_id}/events/{id}: nessun array che cresce fino al
+# limite di 1 MiB. L'id è il timestamp in microsecondi seguito da un
+# suffisso casuale, quindi due scrittori non collidono e l'ordine
+# lessicografico degli id è l'ordine degli eventi senza un contatore
+# condiviso: le append leggono il documento padre ma lo scrivono solo per
+# alzare needs_compaction, una volta per ciclo di compattazione.
+# I client leggono solo gli eventi con id > since. Il compattatore somma
+# periodicamente gli eventi nuovi nei contatori di match_stats (tiri,
+# calci d'angolo, possesso) e avanza compacted_id, fermandosi agli eventi
+# più vecchi di MATCH_EVENTS_SETTLE_SECONDS: un'append con un id già
+# generato può finire il commit poco dopo (o arrivare da un worker con
+# l'orologio un po' indietro) e non deve restare dietro il cursore.
+
+MATCH_EVENTS_COMPACT_INTERVAL = float(os.getenv("MATCH_EVENTS_COMPACT_INTERVAL", "30"))
+MATCH_EVENTS_SETTLE_SECONDS = float(os.getenv("MATCH_EVENTS_SETTLE_SECONDS", "5"))
+MATCH_EVENTS_PAGE_SIZE = 500
+
+# Tipi che contano come tiro nei contatori shots_home/shots_away
+_SHOT_TYPES = ("shot", "goal")
+
+
+def _stats_ref(match_id: str) -> Any:
+    return db.collection("match_stats").document(match_id)
+
+
+def _events_ref(match_id: str) -> Any:
+    return _stats_ref(match_id).collection("events")
+
+
+def _id_prefix(micros: int) -> str:
+    # Tutti gli id generati prima dell'istante micros sono < di questo prefisso
+    return f"{micros:016d}"
+
+
+def _event_id(micros: int, index: int) -> str:
+    # Timestamp, posizione nel batch, suffisso casuale contro le collisioni
+    return f"{_id_prefix(micros)}-{index:03d}-{secrets.token_hex(4)}"
+
+
+def _validate_event(event: MatchLogEventCreate) -> None:
+    if event.type == "possession":
+        home = event.data.get("home")
+        if not isinstance(home, (int, float)) or not 0 <= home <= 100:
+            raise ValueError("Evento possession: data.home deve essere una percentuale (0-100)")
+
+
+def _append_transaction(
+    transaction: Any, match_id: str, events: List[MatchLogEventCreate]
+) -> Optional[List[MatchLogEvent]]:
+    stats_ref = _stats_ref(match_id)
+    snapshot = stats_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+
+    micros = time.time_ns() // 1000
+    created_at = datetime.fromtimestamp(micros / 1e6, tz=timezone.utc).replace(tzinfo=None).isoformat()
+    appended = []
+    for index, event in enumerate(events):
+        entry = MatchLogEvent(
+            id=_event_id(micros, index), match_id=match_id, created_at=created_at, **event.model_dump()
+        )
+        transaction.create(_events_ref(match_id).document(entry.id), entry.model_dump())
+        appended.append(entry)
+    # La lettura del padre non blocca le altre append; la scrittura sì,
+    # quindi si fa solo quando il flag non è già alzato.
+    if not (snapshot.to_dict() or {}).get("needs_compaction"):
+        transaction.update(stats_ref, {"needs_compaction": True})
+    return appended
+
+
+def append_match_events(match_id: str, events: List[MatchLogEventCreate]) -> Optional[List[MatchLogEvent]]:
+    """
+    Aggiunge uno o più eventi in un solo commit, con id crescenti nel
+    batch. None se la partita non esiste.
+    """
+    for event in events:
+        _validate_event(event)
+    return run_transaction(db, _append_transaction, match_id, events)
+
+
+def list_match_events(match_id: str, since: str = "", limit: int = 200) -> MatchLogPage:
+    """
+    Eventi con id > since in ordine. Una sola query, senza leggere il
+    documento della partita: una partita inesistente restituisce una pagina vuota.
+    """
+    query = _events_ref(match_id).where("id", ">", since).order_by("id").limit(limit + 1)
+    events = [MatchLogEvent(**doc.to_dict()) for doc in query.stream()]
+    has_more = len(events) > limit
+    events = events[:limit]
+    return MatchLogPage(
+        match_id=match_id,
+        events=events,
+        cursor=events[-1].id if events else since,
+        has_more=has_more,
+    )
+
+
+# ============================================================
+# Compattazione nei contatori di match_stats
+# ============================================================
+
+def _fold(stats: Dict[str, Any], events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    counters = dict(stats.get("counters") or {})
+    updates: Dict[str, Any] = {}
+    for event in events:
+        kind, team = event.get("type"), event.get("team")
+        if kind == "note":
+            continue
+        if kind == "possession":
+            home = float(event.get("data", {}).get("home", 0))
+            updates["possession_home"] = home
+            updates["possession_away"] = round(100 - home, 2)
+            continue
+        key = f"{kind}_{team}" if team else kind
+        counters[key] = counters.get(key, 0) + 1
+        if team and kind in _SHOT_TYPES:
+            field = f"shots_{team}"
+            updates[field] = (updates.get(field, stats.get(field)) or 0) + 1
+        elif team and kind == "corner":
+            field = f"corners_{team}"
+            updates[field] = (updates.get(field, stats.get(field)) or 0) + 1
+    updates["counters"] = counters
+    return updates
+
+
+def _compact_transaction(transaction: Any, match_id: str) -> int:
+    stats_ref = _stats_ref(match_id)
+    snapshot = stats_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return 0
+    stats = snapshot.to_dict() or {}
+    compacted_id = stats.get("compacted_id") or ""
+    settled = _id_prefix(int((time.time() - MATCH_EVENTS_SETTLE_SECONDS) * 1e6))
+
+    query = (
+        _events_ref(match_id)
+        .where("id", ">", compacted_id)
+        .order_by("id")
+        .limit(MATCH_EVENTS_PAGE_SIZE + 1)
+    )
+    pending = [doc.to_dict() for doc in transaction.get(query)]
+    events = [event for event in pending[:MATCH_EVENTS_PAGE_SIZE] if event["id"] < settled]
+    updates = _fold(stats, events) if events else {}
+    if events:
+        updates["compacted_id"] = events[-1]["id"]
+    # Il flag resta alzato solo se c'è ancora qualcosa da compattare
+    # (eventi troppo recenti o oltre la pagina): una coda vuota lo azzera.
+    updates["needs_compaction"] = len(events) < len(pending)
+    transaction.update(stats_ref, updates)
+    return len(events)
+
+
+def compact_match_events(match_id: str) -> int:
+    """
+    Somma nei contatori tutti gli eventi non ancora compattati e più vecchi
+    di MATCH_EVENTS_SETTLE_SECONDS, una transazione ogni
+    MATCH_EVENTS_PAGE_SIZE eventi. Rieseguirla è sicuro: compacted_id viene
+    letto e avanzato nella stessa transazione.
+    """
+    total = 0
+    while True:
+        folded = run_transaction(db, _compact_transaction, match_id)
+        total += folded
+        if folded < MATCH_EVENTS_PAGE_SIZE:
+            return total
+
+
+def compact_pending_matches() -> Dict[str, int]:
+    """Compatta tutte le partite con eventi nuovi (flag needs_compaction)."""
+    query = db.collection("match_stats").where("needs_compaction", "==", True)
+    match_ids = [doc.id for doc in query.stream()]
+    return {match_id: compact_match_events(match_id) for match_id in match_ids}
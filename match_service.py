@@ -1,8 +1,35 @@
 
+import os
+import json
+import base64
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+from google.api_core.exceptions import AlreadyExists
+from cache import create_cache
+from singleflight import create_flight
 from config import db
-from models import MatchCreateRequest, Match, MatchStats
+from datastore import update_known
+from models import (
+    MatchCreateRequest,
+    Match,
+    MatchStats,
+    MatchSettlementResponse,
+    PlayerMatchResult,
+)
+from leaderboard_service import leaderboard
+from live_service import live_scores
+from bet_service import schedule_bet_settlement
+from user_service import invalidate_user_stats, match_result_deltas, stats_increment_fields
+
+# Letture concorrenti della stessa partita (es. diretta) condividono un solo get()
+_match_reads = create_flight("matches")
+
+# Ultimo stato noto (dati, update_time) delle partite lette o scritte da
+# questo processo: gli aggiornamenti del punteggio lo usano come
+# precondizione (datastore.update_known) e costano un solo commit. Non
+# viene mai servito alle letture, quindi non può restituire dati vecchi.
+MATCH_STATE_CACHE_SIZE = int(os.getenv("MATCH_STATE_CACHE_SIZE", "4096"))
+_match_state = create_cache("match_state", MATCH_STATE_CACHE_SIZE, ttl=3600)
 
 def create_match(payload: MatchCreateRequest) -> Match:
     now = datetime.utcnow()
@@ -18,40 +45,108 @@ def create_match(payload: MatchCreateRequest) -> Match:
         "home_score": 0,
         "away_score": 0,
         "players": payload.players,
-        "created_at": now,
-        "updated_at": now,
+        "league": payload.league,
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
     }
-    doc_ref.set(match_data)
+    result = doc_ref.set(match_data)
+    _match_state.set(match_id, (match_data, result.update_time))
+    # Gli eventi vanno nella sottocollection match_stats/{match_id}/events
     stats_data = {
         "match_id": match_id,
-        "events": [],
         "possession_home": None,
         "possession_away": None,
         "shots_home": None,
         "shots_away": None,
         "corners_home": None,
         "corners_away": None,
+        "counters": {},
+        "compacted_id": "",
+        "needs_compaction": False,
     }
     db.collection("match_stats").document(match_id).set(stats_data)
     return Match(**match_data)
 
-def get_match(match_id: str) -> Optional[Match]:
+def _read_match(match_id: str) -> Optional[Match]:
     doc = db.collection("matches").document(match_id).get()
     if not doc.exists:
+        _match_state.invalidate(match_id)
         return None
     data = doc.to_dict()
+    _match_state.set(match_id, (data, doc.update_time))
     return Match(**data)
 
+def get_match(match_id: str) -> Optional[Match]:
+    match = _match_reads.do(match_id, lambda: _read_match(match_id))
+    # Il risultato è condiviso tra le richieste coalescenti: ognuna ha la sua copia
+    return match.model_copy() if match is not None else None
+
 get_match_by_id = get_match
 
-def get_matches_by_status(status: str) -> List[Match]:
-    query = db.collection("matches").where("status", "==", status)
-    docs = query.stream()
-    matches = []
-    for doc in docs:
-        data = doc.to_dict()
-        matches.append(Match(**data))
-    return matches
+MATCH_PAGE_SIZE = 500
+
+
+def encode_match_cursor(match: Match) -> str:
+    raw = json.dumps([match.start_time, match.match_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_match_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        start_time, match_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Cursore non valido")
+    return {"start_time": start_time, "match_id": match_id}
+
+
+def list_matches(
+    status: Optional[str] = None,
+    league: Optional[str] = None,
+    start_from: Optional[str] = None,
+    start_to: Optional[str] = None,
+    limit: int = 50,
+    start_after: Optional[str] = None,
+) -> Tuple[List[Match], Optional[str]]:
+    """
+    Una pagina di partite ordinate per start_time (poi match_id).
+    Restituisce anche il cursore della pagina successiva, o None.
+    """
+    query = db.collection("matches")
+    if status:
+        query = query.where("status", "==", status)
+    if league:
+        query = query.where("league", "==", league)
+    if start_from:
+        query = query.where("start_time", ">=", start_from)
+    if start_to:
+        query = query.where("start_time", "<", start_to)
+    query = query.order_by("start_time").order_by("match_id")
+    if start_after:
+        query = query.start_after(decode_match_cursor(start_after))
+
+    # Un documento in più dice se esiste una pagina successiva
+    matches = [Match(**doc.to_dict()) for doc in query.limit(limit + 1).stream()]
+    if len(matches) > limit:
+        matches = matches[:limit]
+        return matches, encode_match_cursor(matches[-1])
+    return matches, None
+
+
+def iter_matches(**filters: Any) -> Iterator[Match]:
+    """
+    Tutte le partite che rispettano i filtri, lette a pagine: in memoria
+    c'è al massimo una pagina alla volta.
+    """
+    cursor = None
+    while True:
+        page, cursor = list_matches(limit=MATCH_PAGE_SIZE, start_after=cursor, **filters)
+        yield from page
+        if cursor is None:
+            return
+
+
+def get_matches_by_status(status: Optional[str] = None) -> List[Match]:
+    return list(iter_matches(status=status))
 
 def update_match_score_and_status(
     match_id: str,
@@ -60,21 +155,90 @@ def update_match_score_and_status(
     status: Optional[str] = None,
     end_time: Optional[datetime] = None,
 ) -> Optional[Match]:
-    doc_ref = db.collection("matches").document(match_id)
-    doc = doc_ref.get()
-    if not doc.exists:
-        return None
     updates = {
         "home_score": home_score,
         "away_score": away_score,
-        "updated_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow().isoformat(),
     }
     if status:
         updates["status"] = status
     if end_time:
-        updates["end_time"] = end_time
-    doc_ref.update(updates)
-    return get_match(match_id)
+        updates["end_time"] = end_time.isoformat()
+    # Con lo stato noto un solo commit, con precondizione last_update_time:
+    # lo stato restituito (e inviato alle dirette) è quello dopo la
+    # scrittura anche se altri worker o istanze hanno modificato la partita
+    # (in quel caso la precondizione fallisce e la partita viene riletta).
+    try:
+        state = update_known(db, db.collection("matches").document(match_id), updates, _match_state.get(match_id))
+    finally:
+        _match_reads.forget(match_id)
+    if state is None:
+        _match_state.invalidate(match_id)
+        return None
+    _match_state.set(match_id, state)
+    match = Match(**state[0])
+    # Fan-out ai client collegati a /matches/{match_id}/live
+    live_scores.publish(match)
+    # Regolamento delle scommesse in background, senza bloccare la richiesta
+    if status == "finished":
+        schedule_bet_settlement(match_id, home_score, away_score)
+    return match
+
+def player_match_deltas(player: PlayerMatchResult, home_score: int, away_score: int) -> Dict[str, int]:
+    if player.team == "home":
+        scored, conceded = home_score, away_score
+    elif player.team == "away":
+        scored, conceded = away_score, home_score
+    else:
+        raise ValueError(f"Squadra non valida per {player.uid}: {player.team}")
+    result = "win" if scored > conceded else "loss" if scored < conceded else "draw"
+    return match_result_deltas(player.goals, conceded, result)
+
+def settle_match(match_id: str, players: List[PlayerMatchResult]) -> Optional[MatchSettlementResponse]:
+    """
+    Aggiorna le statistiche di tutti i giocatori di una partita finita con
+    un unico commit di incrementi atomici. Il documento
+    match_settlements/{match_id} viene creato nello stesso commit: un
+    secondo tentativo fallisce con AlreadyExists e non conta nulla due volte.
+    """
+    match = get_match(match_id)
+    if match is None:
+        return None
+    if match.status != "finished":
+        raise ValueError(f"La partita {match_id} non è ancora finita")
+
+    uids = [p.uid for p in players]
+    if len(set(uids)) != len(uids):
+        raise ValueError("Giocatori duplicati nella richiesta")
+
+    deltas = {
+        player.uid: player_match_deltas(player, match.home_score, match.away_score)
+        for player in players
+    }
+    batch = db.batch()
+    batch.create(
+        db.collection("match_settlements").document(match_id),
+        {
+            "match_id": match_id,
+            "players": uids,
+            "results": [p.model_dump() for p in players],
+            "home_score": match.home_score,
+            "away_score": match.away_score,
+            "settled_at": datetime.utcnow().isoformat(),
+        },
+    )
+    for uid, d in deltas.items():
+        batch.set(db.collection("user_stats").document(uid), stats_increment_fields(uid, d), merge=True)
+
+    try:
+        batch.commit()
+    except AlreadyExists:
+        return MatchSettlementResponse(match_id=match_id, settled=False, players=0)
+    finally:
+        for uid in uids:
+            invalidate_user_stats(uid)
+    leaderboard.apply_many(deltas)
+    return MatchSettlementResponse(match_id=match_id, settled=True, players=len(players))
 
 def get_match_stats(match_id: str) -> Optional[MatchStats]:
     doc = db.collection("match_stats").document(match_id).get()
@@ -0,0 +1,432 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from cache import all_cache_stats
+from singleflight import all_flight_stats
+
+
+# ============================================================
+# Metriche Prometheus (formato testuale, senza dipendenze)
+# ============================================================
+# METRICS_ENABLED=1 attiva il middleware HTTP, il wrapper del datastore e
+# l'endpoint /metrics. Con il flag spento nessuno dei due viene installato:
+# le richieste e le chiamate a Firestore non pagano nulla. /metrics non è
+# pubblico: lo scraper si autentica con "Authorization: Bearer METRICS_TOKEN",
+# senza METRICS_TOKEN serve il token di sessione di un amministratore.
+
+METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # etichette -> [conteggi per bucket (non cumulativi) + overflow, somma]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._values.items())
+        lines = self._header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+_metrics: List[_Metric] = []
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def _register(metric: _Metric) -> Any:
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector: Callable[[], List[str]]) -> None:
+    """Funzione chiamata a ogni scrape che restituisce righe già formattate."""
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.collect())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def sample_lines(name: str, documentation: str, kind: str, labelname: str,
+                 values: Dict[str, float]) -> List[str]:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for label, value in sorted(values.items()):
+        lines.append(f"{name}{_format_labels((labelname,), (label,))} {_format_value(value)}")
+    return lines
+
+
+def _cache_lines() -> List[str]:
+    stats = all_cache_stats()
+    lines = []
+    for name, kind, key, documentation in (
+        ("cache_hits_total", "counter", "hits", "Letture servite dalla cache."),
+        ("cache_misses_total", "counter", "misses", "Letture non servite dalla cache."),
+        ("cache_hit_ratio", "gauge", "hit_ratio", "Rapporto hit/(hit+miss)."),
+        ("cache_entries", "gauge", "size", "Elementi in cache."),
+    ):
+        lines.extend(sample_lines(name, documentation, kind, "cache", {n: s[key] for n, s in stats.items()}))
+    return lines
+
+
+register_collector(_cache_lines)
+
+
+def _flight_lines() -> List[str]:
+    stats = all_flight_stats()
+    lines = []
+    for name, kind, key, documentation in (
+        ("singleflight_calls_total", "counter", "calls", "Letture richieste."),
+        ("singleflight_executions_total", "counter", "executions", "Letture eseguite sul datastore."),
+        ("singleflight_coalesced_total", "counter", "coalesced", "Letture unite a una già in corso."),
+        ("singleflight_ttl_hits_total", "counter", "ttl_hits", "Letture servite dal risultato recente (SINGLEFLIGHT_TTL)."),
+    ):
+        lines.extend(sample_lines(name, documentation, kind, "group", {n: s[key] for n, s in stats.items()}))
+    return lines
+
+
+register_collector(_flight_lines)
+
+
+# ============================================================
+# Metriche HTTP (middleware ASGI)
+# ============================================================
+
+HTTP_REQUESTS = _register(Counter(
+    "http_requests_total", "Richieste HTTP completate.", ("method", "route", "status")))
+HTTP_ERRORS = _register(Counter(
+    "http_request_errors_total", "Richieste con errore 5xx o eccezione non gestita.", ("method", "route")))
+HTTP_LATENCY = _register(Histogram(
+    "http_request_duration_seconds", "Tempo fino all'invio degli header di risposta.", ("method", "route")))
+HTTP_IN_FLIGHT = _register(Gauge(
+    "http_requests_in_flight", "Richieste HTTP in corso.", ("method",)))
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (senza BaseHTTPMiddleware). La route è il template
+    del percorso (/users/{uid}), non l'URL: la cardinalità resta limitata.
+    La latenza si misura all'invio degli header, così gli stream lunghi
+    (NDJSON, SSE) non falsano l'istogramma.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        started = time.perf_counter()
+        status = {"code": 500, "observed": False}
+
+        def _route() -> str:
+            route = scope.get("route")
+            return getattr(route, "path", None) or "<unmatched>"
+
+        async def _send(message: dict) -> None:
+            if message["type"] == "http.response.start" and not status["observed"]:
+                status["code"] = message["status"]
+                status["observed"] = True
+                HTTP_LATENCY.observe(time.perf_counter() - started, method, _route())
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method)
+        try:
+            await self.app(scope, receive, _send)
+        except Exception:
+            HTTP_ERRORS.inc(method, _route())
+            raise
+        else:
+            if status["code"] >= 500:
+                HTTP_ERRORS.inc(method, _route())
+        finally:
+            HTTP_IN_FLIGHT.dec(method)
+            HTTP_REQUESTS.inc(method, _route(), str(status["code"]))
+
+
+# ============================================================
+# Metriche del datastore (wrapper sottile del client)
+# ============================================================
+# I wrapper inoltrano ogni attributo all'oggetto vero e misurano solo le
+# chiamate che fanno una RPC. I riferimenti passati a batch, transazioni e
+# get_all vengono "scartati" prima di arrivare al client vero.
+
+DB_LATENCY = _register(Histogram(
+    "datastore_operation_duration_seconds", "Durata delle operazioni sul datastore.",
+    ("collection", "op")))
+DB_ERRORS = _register(Counter(
+    "datastore_operation_errors_total", "Operazioni sul datastore fallite.", ("collection", "op")))
+
+
+def _observe(collection: str, op: str, started: float, failed: bool) -> None:
+    DB_LATENCY.observe(time.perf_counter() - started, collection, op)
+    if failed:
+        DB_ERRORS.inc(collection, op)
+
+
+def _timed(collection: str, op: str, func: Callable, *args: Any, **kwargs: Any) -> Any:
+    started = time.perf_counter()
+    failed = True
+    try:
+        result = func(*args, **kwargs)
+        failed = False
+        return result
+    finally:
+        _observe(collection, op, started, failed)
+
+
+def unwrap(obj: Any) -> Any:
+    return obj._target if isinstance(obj, _Instrumented) else obj
+
+
+def _unwrap_kwargs(kwargs: dict) -> dict:
+    if "transaction" in kwargs:
+        kwargs["transaction"] = unwrap(kwargs["transaction"])
+    return kwargs
+
+
+class _Instrumented:
+    __slots__ = ("_target", "_collection")
+
+    def __init__(self, target: Any, collection: str = ""):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_collection", collection)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target, name)
+
+    def __repr__(self) -> str:
+        return f"<instrumented {self._target!r}>"
+
+
+class InstrumentedQuery(_Instrumented):
+    __slots__ = ()
+
+    def _wrap(self, query: Any) -> "InstrumentedQuery":
+        return InstrumentedQuery(query, self._collection)
+
+    def where(self, *args: Any, **kwargs: Any) -> "InstrumentedQuery":
+        return self._wrap(self._target.where(*args, **kwargs))
+
+    def order_by(self, *args: Any, **kwargs: Any) -> "InstrumentedQuery":
+        return self._wrap(self._target.order_by(*args, **kwargs))
+
+    def limit(self, *args: Any, **kwargs: Any) -> "InstrumentedQuery":
+        return self._wrap(self._target.limit(*args, **kwargs))
+
+    def start_after(self, *args: Any, **kwargs: Any) -> "InstrumentedQuery":
+        return self._wrap(self._target.start_after(*args, **kwargs))
+
+    def stream(self, *args: Any, **kwargs: Any) -> Iterator[Any]:
+        # Lo stream si misura fino all'ultimo documento letto
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield from self._target.stream(*args, **_unwrap_kwargs(kwargs))
+            failed = False
+        finally:
+            _observe(self._collection, "query", started, failed)
+
+    def get(self, *args: Any, **kwargs: Any) -> Any:
+        return _timed(self._collection, "query", self._target.get, *args, **_unwrap_kwargs(kwargs))
+
+
+class InstrumentedCollection(InstrumentedQuery):
+    __slots__ = ()
+
+    def document(self, *args: Any, **kwargs: Any) -> "InstrumentedDocument":
+        return InstrumentedDocument(self._target.document(*args, **kwargs), self._collection)
+
+    def add(self, *args: Any, **kwargs: Any) -> Any:
+        return _timed(self._collection, "create", self._target.add, *args, **kwargs)
+
+
+class InstrumentedDocument(_Instrumented):
+    __slots__ = ()
+
+    def collection(self, name: str) -> InstrumentedCollection:
+        # Sottocollezioni etichettate solo col nome: niente id nei label
+        return InstrumentedCollection(self._target.collection(name), name)
+
+    def get(self, *args: Any, **kwargs: Any) -> Any:
+        return _timed(self._collection, "get", self._target.get, *args, **_unwrap_kwargs(kwargs))
+
+    def set(self, *args: Any, **kwargs: Any) -> Any:
+        return _timed(self._collection, "set", self._target.set, *args, **kwargs)
+
+    def create(self, *args: Any, **kwargs: Any) -> Any:
+        return _timed(self._collection, "create", self._target.create, *args, **kwargs)
+
+    def update(self, *args: Any, **kwargs: Any) -> Any:
+        return _timed(self._collection, "update", self._target.update, *args, **kwargs)
+
+    def delete(self, *args: Any, **kwargs: Any) -> Any:
+        return _timed(self._collection, "delete", self._target.delete, *args, **kwargs)
+
+
+class InstrumentedBatch(_Instrumented):
+    """Batch o transazione: il commit è etichettato con le collection scritte."""
+
+    __slots__ = ("_collections",)
+
+    def __init__(self, target: Any):
+        super().__init__(target, "")
+        object.__setattr__(self, "_collections", set())
+
+    def __len__(self) -> int:
+        return len(self._target)
+
+    def _write(self, method: str, reference: Any, *args: Any, **kwargs: Any) -> "InstrumentedBatch":
+        if isinstance(reference, _Instrumented):
+            self._collections.add(reference._collection)
+        getattr(self._target, method)(unwrap(reference), *args, **kwargs)
+        return self
+
+    def set(self, reference: Any, *args: Any, **kwargs: Any) -> "InstrumentedBatch":
+        return self._write("set", reference, *args, **kwargs)
+
+    def create(self, reference: Any, *args: Any, **kwargs: Any) -> "InstrumentedBatch":
+        return self._write("create", reference, *args, **kwargs)
+
+    def update(self, reference: Any, *args: Any, **kwargs: Any) -> "InstrumentedBatch":
+        return self._write("update", reference, *args, **kwargs)
+
+    def delete(self, reference: Any, *args: Any, **kwargs: Any) -> "InstrumentedBatch":
+        return self._write("delete", reference, *args, **kwargs)
+
+    def get(self, ref_or_query: Any, *args: Any, **kwargs: Any) -> Any:
+        # Letture dentro una transazione
+        op = "get" if isinstance(ref_or_query, InstrumentedDocument) else "query"
+        collection = getattr(ref_or_query, "_collection", "")
+        return _timed(collection, op, self._target.get, unwrap(ref_or_query), *args, **kwargs)
+
+    def commit(self, *args: Any, **kwargs: Any) -> Any:
+        collection = ",".join(sorted(self._collections))
+        self._collections.clear()
+        return _timed(collection, "commit", self._target.commit, *args, **kwargs)
+
+
+class InstrumentedClient(_Instrumented):
+    __slots__ = ()
+
+    def collection(self, name: str) -> InstrumentedCollection:
+        return InstrumentedCollection(self._target.collection(name), name)
+
+    def document(self, path: str) -> InstrumentedDocument:
+        parts = path.strip("/").split("/")
+        return InstrumentedDocument(self._target.document(path), parts[-2] if len(parts) > 1 else "")
+
+    def get_all(self, references: Any, *args: Any, **kwargs: Any) -> Iterator[Any]:
+        references = list(references)
+        collection = references[0]._collection if references and isinstance(references[0], _Instrumented) else ""
+        # Con Firestore i documenti arrivano in streaming: si misura fino all'ultimo
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield from self._target.get_all([unwrap(r) for r in references], *args, **_unwrap_kwargs(kwargs))
+            failed = False
+        finally:
+            _observe(collection, "get_all", started, failed)
+
+    def batch(self) -> InstrumentedBatch:
+        return InstrumentedBatch(self._target.batch())
+
+    def transaction(self, **kwargs: Any) -> InstrumentedBatch:
+        return InstrumentedBatch(self._target.transaction(**kwargs))
+
+
+def instrument_client(client: Any) -> Any:
+    return InstrumentedClient(client) if METRICS_ENABLED else client
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, computed_field
+from pydantic.alias_generators import to_camel
+from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
 
 # ====
@@ -10,13 +11,18 @@ class RegisterWithEmailRequest(BaseModel):
     email: EmailStr
     password: str = Field(..., min_length=6)
     nickname: Optional[str] = None
-    tag: Optional[str] = None
+    tag: Optional[str] = Field(None, pattern=r"^[0-9]{4}$")
 
 class RegisterWithNicknameRequest(BaseModel):
     nickname: str = Field(..., min_length=3, max_length=20)
-    tag: str = Field(..., min_length=4, max_length=4)
+    tag: str = Field(..., pattern=r"^[0-9]{4}$")  # 4 cifre, es. "0042"
     password: str = Field(..., min_length=6)
 
+class RegisterBatchUser(RegisterWithNicknameRequest):
+    # Il formato del tag è controllato da register_batch per ogni voce:
+    # un tag sbagliato finisce in errors invece di rifiutare tutto il blocco
+    tag: str = Field(..., min_length=4, max_length=4)
+
 class LoginWithEmailRequest(BaseModel):
     email: EmailStr
     password: str
@@ -33,14 +39,39 @@ class UserResponse(BaseModel):
     tag: str
     status: str = "active"
     created_at: str
+    # Solo nelle risposte di login/registrazione: da inviare come
+    # "Authorization: Bearer <token>" alle route autenticate
+    session_token: Optional[str] = None
+    session_expires_at: Optional[int] = None
+
+class RegisterBatchRequest(BaseModel):
+    users: List[RegisterBatchUser] = Field(..., min_length=1, max_length=500)
+
+class RegisterBatchError(BaseModel):
+    index: int
+    nickname: str
+    tag: str
+    detail: str
+
+class RegisterBatchResponse(BaseModel):
+    users: List[UserResponse] = []
+    errors: List[RegisterBatchError] = []
 
 # ====
 # USER MODELS
 # ====
 
+class UserSearchResult(BaseModel):
+    uid: str
+    nickname: str
+    tag: str
+
+class UserSearchResponse(BaseModel):
+    results: List[UserSearchResult]
+
 class UpdateUserRequest(BaseModel):
     nickname: Optional[str] = None
-    tag: Optional[str] = None
+    tag: Optional[str] = Field(None, pattern=r"^[0-9]{4}$")
     status: Optional[str] = None
 
 class UserStats(BaseModel):
@@ -52,8 +83,62 @@ class UserStats(BaseModel):
     goals_scored: int = 0
     goals_conceded: int = 0
     clean_sheets: int = 0
+    # Aggregati degli eventi chiusi (stessi di logic.ts::getWeightedStats)
+    total_paid: float = 0
+    total_fines: float = 0
+    mvp_count: int = 0
+    lvp_count: int = 0
     last_match_at: Optional[datetime] = None
 
+    @computed_field
+    @property
+    def win_rate(self) -> float:
+        return (self.wins / self.total_matches) * 100 if self.total_matches else 0.0
+
+    @computed_field
+    @property
+    def weighted_fine_average(self) -> float:
+        return self.total_fines / self.total_matches if self.total_matches else 0.0
+
+    @computed_field
+    @property
+    def reliability_score(self) -> float:
+        if not self.total_matches:
+            return 100.0
+        return 100 - min(100.0, (self.total_fines / (self.total_matches * 5)) * 100)
+
+    @computed_field
+    @property
+    def title(self) -> str:
+        if self.mvp_count > 5:
+            return "Il Fuoriclasse"
+        if self.lvp_count > 5:
+            return "Il Bidone d'Oro"
+        if self.goals_scored > 20:
+            return "Il Bomber"
+        if self.total_fines > 100:
+            return "Il Bancomat"
+        if self.total_matches > 10 and self.total_fines == 0:
+            return "Il Professionista"
+        return "Novizio"
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    uid: str
+    value: float
+
+class LeaderboardResponse(BaseModel):
+    metric: str
+    total: int  # giocatori in classifica per questa metrica
+    entries: List[LeaderboardEntry]
+
+class UserRankResponse(BaseModel):
+    uid: str
+    metric: str
+    rank: int
+    value: float
+    total: int
+
 # ====
 # MATCH MODELS
 # ====
@@ -86,29 +171,193 @@ class Match(BaseModel):
     home_score: int = 0
     away_score: int = 0
     players: Optional[List[str]] = None
+    league: Optional[str] = None
     created_at: str
     updated_at: str
 
+class MatchScoreUpdateRequest(BaseModel):
+    home_score: int = Field(..., ge=0)
+    away_score: int = Field(..., ge=0)
+    status: Optional[str] = Field(None, pattern="^(scheduled|live|finished)$")
+
+class PlayerMatchResult(BaseModel):
+    uid: str
+    team: str  # home, away
+    goals: int = Field(0, ge=0)
+
+class MatchSettlementRequest(BaseModel):
+    # 1 scrittura per giocatore + 1 marker di idempotenza, max 500 per commit
+    players: List[PlayerMatchResult] = Field(..., min_length=1, max_length=499)
+
+class MatchSettlementResponse(BaseModel):
+    match_id: str
+    settled: bool  # False se la partita era già stata liquidata
+    players: int
+
 class MatchStats(BaseModel):
     match_id: str
-    events: List[Dict[str, Any]] = []
+    events: List[Dict[str, Any]] = []  # solo documenti creati prima del log degli eventi
     possession_home: Optional[float] = None
     possession_away: Optional[float] = None
     shots_home: Optional[int] = None
     shots_away: Optional[int] = None
     corners_home: Optional[int] = None
     corners_away: Optional[int] = None
+    # Contatori per tipo e squadra (es. "goal_home", "nutmeg_away") ricavati dal log
+    counters: Dict[str, int] = {}
+    compacted_id: str = ""  # ultimo evento di match_stats/{match_id}/events già sommato nei contatori
+
+class MatchLogEventCreate(BaseModel):
+    type: str = Field(..., pattern="^(goal|shot|corner|yellow_card|red_card|nutmeg|possession|note)$")
+    team: Optional[str] = Field(None, pattern="^(home|away)$")
+    minute: Optional[int] = Field(None, ge=0, le=200)
+    player_uid: Optional[str] = None
+    # possession: {"home": 55.0}; note: {"text": "..."}
+    data: Dict[str, Any] = {}
+
+class MatchLogEventBatch(BaseModel):
+    events: List[MatchLogEventCreate] = Field(..., min_length=1, max_length=100)
+
+class MatchLogEvent(MatchLogEventCreate):
+    id: str  # timestamp + suffisso casuale, crescente nel tempo
+    match_id: str
+    created_at: str
+
+class MatchLogPage(BaseModel):
+    match_id: str
+    events: List[MatchLogEvent]
+    cursor: str  # passare come `since` alla richiesta successiva
+    has_more: bool
 
 # ====
-# BET MODELS (opzionale, per future implementazioni)
+# EVENT MODELS (stessi campi di types.ts, accettati anche in camelCase)
+# ====
+
+class _CamelModel(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+class Rule(_CamelModel):
+    id: str
+    variable: str  # arrival_time, goal_count, is_mvp, yellow_cards, forgot_kit, ...
+    operator: str  # >, <, ==, >=, !=
+    value: Union[str, float] = ""
+    action: str  # add_fixed, multiply_quota, percent_total, contribute_to_fund, half_field_penalty
+    action_value: float = 0
+    description: str = ""
+
+class Infraction(_CamelModel):
+    rule_id: str
+    quantity: float = 1
+    calculated_amount: float = 0
+
+class Participant(_CamelModel):
+    id: str
+    user_id: Optional[str] = None
+    name: str
+    arrival_time: str = ""
+    goals: int = 0
+    nutmegs: int = 0
+    post_hits: int = 0
+    yellow_cards: int = 0
+    own_goals: int = 0
+    forgot_kit: bool = False
+    is_mvp: bool = False
+    base_quota: float = 0
+    total_fine: float = 0
+    final_amount: float = 0
+    infractions: List[Infraction] = []
+    team: Optional[str] = None  # A, B
+
+class Vote(_CamelModel):
+    voter_id: str
+    mvp_id: str
+    lvp_id: str
+
+class MatchEvent(_CamelModel):
+    # I campi non usati dal backend vengono conservati così come arrivano
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True, extra="allow")
+
+    id: str
+    total_cost: float = 0
+    participants: List[Participant] = []
+    event_rules: List[Rule] = []
+    disabled_global_rule_ids: List[str] = []
+    fine_allocation: str = "split"  # split, fund
+    status: Optional[str] = None  # open, closed, registration, voting
+    votes: List[Vote] = []
+    score_a: Optional[int] = None
+    score_b: Optional[int] = None
+
+class EventSettleRequest(BaseModel):
+    event: Optional[MatchEvent] = None  # se assente viene letto da events/{id}
+    global_rules: List[Rule] = []
+
+class EventBatchSettleRequest(BaseModel):
+    events: List[MatchEvent] = Field([], max_length=2000)
+    event_ids: List[str] = Field([], max_length=2000)
+    global_rules: List[Rule] = []
+
+class EventFinalizeRequest(BaseModel):
+    event: Optional[MatchEvent] = None  # se assente viene letto da events/{id}
+    global_rules: List[Rule] = []
+
+class ParticipantSettlement(BaseModel):
+    id: str
+    name: str
+    base_quota: float
+    total_fine: float
+    final_amount: float
+
+class EventSettlement(BaseModel):
+    event_id: str
+    total_cost: float
+    total_fines: float
+    participants: List[ParticipantSettlement]
+
+class EventFinalization(BaseModel):
+    event_id: str
+    finalized: bool  # False se l'evento era già stato chiuso
+    settlement: EventSettlement
+
+# ====
+# TEAM MODELS
+# ====
+
+class BalancePlayer(BaseModel):
+    id: str
+    name: str
+    uid: Optional[str] = None  # se presente la skill si calcola da user_stats
+    roles: List[str] = []  # Portiere, Difensore, Centrocampista, Attaccante, Universale
+    skill: Optional[float] = None  # sovrascrive la skill calcolata
+
+class TeamBalanceRequest(BaseModel):
+    players: List[BalancePlayer] = Field(..., min_length=2, max_length=40)
+    splits: int = Field(3, ge=1, le=10)
+    time_budget_ms: int = Field(20, ge=1, le=1000)
+    role_constraints: bool = True
+
+class TeamSplit(BaseModel):
+    team_a: List[str]
+    team_b: List[str]
+    skill_a: float
+    skill_b: float
+    skill_gap: float
+    role_imbalance: int
+
+class TeamBalanceResponse(BaseModel):
+    skills: Dict[str, float]
+    splits: List[TeamSplit]
+
+# ====
+# BET MODELS
 # ====
 
 class BetCreateRequest(BaseModel):
     match_id: str
     uid: str
-    bet_type: str  # es. "1X2", "over_under", "both_teams_score"
-    prediction: str
-    stake: float
+    bet_type: str = Field(..., pattern="^(1X2|over_under|both_teams_score)$")
+    prediction: str  # 1X2: "1", "X", "2"; over_under: "over_2.5"; both_teams_score: "yes"/"no"
+    stake: float = Field(..., gt=0)
 
 class BetResponse(BaseModel):
     bet_id: str
@@ -117,5 +366,38 @@ class BetResponse(BaseModel):
     bet_type: str
     prediction: str
     stake: float
-    status: str  # pending, won, lost
-    created_at: str
\ No newline at end of file
+    status: str  # pending, won, lost, void
+    created_at: str
+    settled_at: Optional[str] = None
+
+class BetBatchRequest(BaseModel):
+    bets: List[BetCreateRequest] = Field(..., min_length=1, max_length=500)
+
+class BetBatchResponse(BaseModel):
+    bets: List[BetResponse]
+
+class BetSettlementResponse(BaseModel):
+    match_id: str
+    settled: int = 0
+    won: int = 0
+    lost: int = 0
+    void: int = 0
+
+# ====
+# BULK MODELS
+# ====
+
+class BulkImportError(BaseModel):
+    line: Optional[int] = None  # riga del file NDJSON (None se l'errore è del BulkWriter)
+    doc_id: Optional[str] = None
+    detail: str
+
+class BulkImportResponse(BaseModel):
+    collection: str
+    rows: int = 0
+    written: int = 0
+    invalid: int = 0  # righe scartate dalla validazione
+    failed: int = 0  # scritture fallite dopo i tentativi
+    errors: List[BulkImportError] = []
+    seconds: float = 0
+    rows_per_second: float = 0
@@ -0,0 +1,52 @@
+import os
+import secrets
+import time
+from functools import lru_cache
+from typing import Tuple
+
+from jose import JWTError, jwt
+
+from config import STORAGE_BACKEND
+
+
+# ============================================================
+# Token di sessione (JWT HS256 firmati e verificati in locale)
+# ============================================================
+# Il login emette un JWT di breve durata con l'uid in `sub`. Le richieste
+# autenticate lo verificano con la chiave in memoria: nessuna chiamata a
+# Firebase Auth, nessun I/O. Tutti i worker devono condividere SESSION_SECRET.
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+SESSION_ISSUER = "penaltyhub"
+_ALGORITHM = "HS256"
+
+
+@lru_cache(maxsize=1)
+def _signing_key() -> str:
+    secret = os.getenv("SESSION_SECRET")
+    if secret:
+        return secret
+    if STORAGE_BACKEND == "firestore":
+        raise RuntimeError("SESSION_SECRET non impostata: serve per firmare i token di sessione")
+    # Backend locale (sviluppo, benchmark): chiave casuale valida solo per questo processo
+    return secrets.token_urlsafe(32)
+
+
+def create_session_token(uid: str) -> Tuple[str, int]:
+    """Restituisce il token e la sua scadenza (epoch in secondi)."""
+    now = int(time.time())
+    expires_at = now + SESSION_TTL
+    claims = {"sub": uid, "iat": now, "exp": expires_at, "iss": SESSION_ISSUER}
+    return jwt.encode(claims, _signing_key(), algorithm=_ALGORITHM), expires_at
+
+
+def verify_session_token(token: str) -> str:
+    """Restituisce l'uid del token o solleva ValueError (firma, scadenza, issuer)."""
+    try:
+        claims = jwt.decode(token, _signing_key(), algorithms=[_ALGORITHM], issuer=SESSION_ISSUER)
+    except JWTError as e:
+        raise ValueError(f"Token di sessione non valido: {e}")
+    uid = claims.get("sub")
+    if not uid:
+        raise ValueError("Token di sessione senza uid")
+    return uid
@@ -0,0 +1,223 @@
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import db
+from models import (
+    EventSettlement,
+    MatchEvent,
+    ParticipantSettlement,
+    Rule,
+)
+
+
+# ============================================================
+# Calcolo di multe e quote (porting di logic.ts::calculateFinalAmounts)
+# ============================================================
+# I partecipanti di tutti gli eventi vengono messi in array NumPy contigui
+# (un evento = una fetta). Ogni regola globale viene valutata una sola volta
+# su tutti i partecipanti; le regole dell'evento solo sulla sua fetta.
+# La ripartizione finale usa np.bincount per evento.
+
+HEAVY_DELAY_THRESHOLD = 20 * 60 + 15  # 'ritardo_pesante': oltre le 20:15
+
+
+def _js_number(value: str) -> float:
+    # Stessa conversione di Number() in JavaScript
+    text = str(value).strip()
+    if text == "":
+        return 0.0
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+
+def time_to_minutes(time: str) -> float:
+    parts = str(time).split(":")
+    if len(parts) < 2:
+        return math.nan
+    return _js_number(parts[0]) * 60 + _js_number(parts[1])
+
+
+class _Columns:
+    """Attributi dei partecipanti come array (o fette di array) NumPy."""
+
+    def __init__(self, arrival, yellow, nutmegs, forgot_kit, is_mvp, cost, fines, multiplier):
+        self.arrival = arrival
+        self.yellow = yellow
+        self.nutmegs = nutmegs
+        self.forgot_kit = forgot_kit
+        self.is_mvp = is_mvp
+        self.cost = cost
+        self.fines = fines
+        self.multiplier = multiplier
+
+    def slice(self, start: int, stop: int) -> "_Columns":
+        s = slice(start, stop)
+        return _Columns(
+            self.arrival[s], self.yellow[s], self.nutmegs[s], self.forgot_kit[s],
+            self.is_mvp[s], self.cost[s], self.fines[s], self.multiplier[s],
+        )
+
+
+def _rule_trigger(rule: Rule, cols: _Columns) -> Tuple[np.ndarray, np.ndarray]:
+    factor = np.ones_like(cols.arrival)
+    if rule.variable == "arrival_time":
+        if rule.operator != ">":
+            return np.zeros(cols.arrival.shape, dtype=bool), factor
+        threshold = time_to_minutes(str(rule.value))
+        triggered = cols.arrival > threshold
+        return triggered, np.where(triggered, cols.arrival - threshold, 1.0)
+    if rule.variable == "ritardo_pesante":
+        return cols.arrival > HEAVY_DELAY_THRESHOLD, factor
+    if rule.variable == "forgot_kit":
+        return cols.forgot_kit & (rule.operator == "=="), factor
+    if rule.variable == "yellow_cards":
+        return cols.yellow > _js_number(str(rule.value)), factor
+    if rule.variable == "is_mvp":
+        return cols.is_mvp & (rule.operator == "=="), factor
+    if rule.variable == "nutmegs":
+        return cols.nutmegs > _js_number(str(rule.value)), factor
+    return np.zeros(cols.arrival.shape, dtype=bool), factor
+
+
+def _apply_rule(rule: Rule, cols: _Columns, active: Optional[np.ndarray] = None) -> None:
+    triggered, factor = _rule_trigger(rule, cols)
+    if active is not None:
+        triggered = triggered & active
+    if rule.action == "add_fixed":
+        cols.fines += np.where(triggered, rule.action_value * factor, 0.0)
+    elif rule.action == "multiply_quota":
+        cols.multiplier *= np.where(triggered, rule.action_value, 1.0)
+    elif rule.action == "half_field_penalty":
+        cols.fines += np.where(triggered, rule.action_value + cols.cost * 0.5, 0.0)
+
+
+def settle_events(events: List[MatchEvent], global_rules: List[Rule]) -> List[EventSettlement]:
+    """
+    Calcola quota base, multe e importo finale di ogni partecipante per
+    tutti gli eventi indicati, con le stesse regole del frontend.
+    """
+    counts = np.array([len(e.participants) for e in events], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    event_index = np.repeat(np.arange(len(events)), counts)
+    participants = [p for e in events for p in e.participants]
+
+    total_cost = np.array([e.total_cost for e in events], dtype=float)
+    base_share = np.divide(
+        total_cost, counts, out=np.zeros_like(total_cost), where=counts > 0
+    )
+    base = base_share[event_index]
+
+    cols = _Columns(
+        arrival=np.array([time_to_minutes(p.arrival_time) for p in participants], dtype=float),
+        yellow=np.array([p.yellow_cards for p in participants], dtype=float),
+        nutmegs=np.array([p.nutmegs for p in participants], dtype=float),
+        forgot_kit=np.array([p.forgot_kit for p in participants], dtype=bool),
+        is_mvp=np.array([p.is_mvp for p in participants], dtype=bool),
+        cost=total_cost[event_index],
+        fines=np.zeros(len(participants)),
+        multiplier=np.ones(len(participants)),
+    )
+
+    # 1. Infrazioni già registrate (la regola si cerca tra quelle attive)
+    fine_idx: List[int] = []
+    fine_val: List[float] = []
+    mult_idx: List[int] = []
+    mult_val: List[float] = []
+    for i, event in enumerate(events):
+        disabled = set(event.disabled_global_rule_ids)
+        rules_by_id: Dict[str, Rule] = {}
+        for rule in [r for r in global_rules if r.id not in disabled] + event.event_rules:
+            rules_by_id.setdefault(rule.id, rule)
+        for j, participant in enumerate(event.participants, start=int(offsets[i])):
+            for infraction in participant.infractions:
+                rule = rules_by_id.get(infraction.rule_id)
+                if rule is None:
+                    continue
+                if rule.action == "multiply_quota":
+                    mult_idx.append(j)
+                    mult_val.append(rule.action_value)
+                elif rule.action == "half_field_penalty":
+                    fine_idx.append(j)
+                    fine_val.append(rule.action_value + event.total_cost * 0.5)
+                else:
+                    fine_idx.append(j)
+                    fine_val.append(infraction.calculated_amount)
+    np.add.at(cols.fines, np.array(fine_idx, dtype=np.int64), np.array(fine_val, dtype=float))
+    np.multiply.at(cols.multiplier, np.array(mult_idx, dtype=np.int64), np.array(mult_val, dtype=float))
+
+    # 2. Regole globali: una passata su tutti i partecipanti
+    for rule in global_rules:
+        enabled = np.array([rule.id not in e.disabled_global_rule_ids for e in events], dtype=bool)
+        _apply_rule(rule, cols, active=enabled[event_index])
+
+    # 3. Regole dell'evento: solo sulla fetta dei suoi partecipanti
+    for i, event in enumerate(events):
+        if not event.event_rules:
+            continue
+        view = cols.slice(int(offsets[i]), int(offsets[i + 1]))
+        for rule in event.event_rules:
+            _apply_rule(rule, view)
+
+    # 4. Moltiplicatori convertiti in multa, poi ripartizione
+    fines = cols.fines + np.maximum(0.0, base * cols.multiplier - base)
+    total_fines = np.bincount(event_index, weights=fines, minlength=len(events))
+    clean = fines == 0
+    clean_count = np.bincount(event_index, weights=clean, minlength=len(events))
+    # Senza partecipanti bincount restituisce interi: out esplicito in float
+    discount = np.divide(
+        total_fines, clean_count, out=np.zeros(len(events)), where=clean_count > 0
+    )
+    split = np.array([e.fine_allocation == "split" for e in events], dtype=bool)
+    split_amount = np.maximum(0.0, base + fines - np.where(clean, discount[event_index], 0.0))
+    final = np.where(split[event_index], split_amount, base + fines)
+
+    settlements = []
+    for i, event in enumerate(events):
+        start, stop = int(offsets[i]), int(offsets[i + 1])
+        settlements.append(
+            EventSettlement(
+                event_id=event.id,
+                total_cost=event.total_cost,
+                total_fines=float(total_fines[i]),
+                participants=[
+                    ParticipantSettlement(
+                        id=p.id,
+                        name=p.name,
+                        base_quota=float(base[j]),
+                        total_fine=float(fines[j]),
+                        final_amount=float(final[j]),
+                    )
+                    for j, p in enumerate(event.participants, start=start)
+                ],
+            )
+        )
+    return settlements
+
+
+def settle_event(event: MatchEvent, global_rules: List[Rule]) -> EventSettlement:
+    return settle_events([event], global_rules)[0]
+
+
+# ============================================================
+# Eventi salvati nella collection `events`
+# ============================================================
+
+def get_event(event_id: str) -> Optional[MatchEvent]:
+    doc = db.collection("events").document(event_id).get()
+    if not doc.exists:
+        return None
+    return MatchEvent(**doc.to_dict())
+
+
+def get_events(event_ids: List[str]) -> List[MatchEvent]:
+    refs = [db.collection("events").document(event_id) for event_id in event_ids]
+    events = []
+    for doc in db.get_all(refs):
+        if not doc.exists:
+            raise ValueError(f"Evento non trovato: {doc.id}")
+        events.append(MatchEvent(**doc.to_dict()))
+    return events
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+# ============================================================
+# Single-flight: letture identiche e concorrenti condividono una chiamata
+# ============================================================
+# Il primo thread che chiede una chiave esegue la lettura; quelli che
+# arrivano mentre è in corso aspettano e ricevono lo stesso risultato
+# (o la stessa eccezione). Con SINGLEFLIGHT_TTL > 0 il risultato resta
+# valido ancora per qualche centinaio di millisecondi. forget() va
+# chiamata dopo ogni scrittura della chiave: chi arriva dopo non riceve
+# il risultato di una lettura partita prima della scrittura.
+
+# Secondi (es. 0.25); 0 = solo coalescenza delle letture in corso
+SINGLEFLIGHT_TTL = float(os.getenv("SINGLEFLIGHT_TTL", "0"))
+# Oltre questa soglia i risultati scaduti vengono eliminati
+_PRUNE_THRESHOLD = 1024
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, name: str, ttl: float = 0.0):
+        self.name = name
+        self.ttl = ttl
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.ttl_hits = 0
+        self._in_flight: Dict[Hashable, _Call] = {}
+        self._recent: Dict[Hashable, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            recent = self._recent.get(key)
+            if recent is not None:
+                if recent[1] > time.monotonic():
+                    self.ttl_hits += 1
+                    return recent[0]
+                del self._recent[key]
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # Dopo un forget() la chiamata non è più quella registrata:
+                # il suo risultato non va conservato
+                if self._in_flight.get(key) is call:
+                    del self._in_flight[key]
+                    if call.error is None and self.ttl > 0:
+                        now = time.monotonic()
+                        if len(self._recent) >= _PRUNE_THRESHOLD:
+                            self._prune(now)
+                        self._recent[key] = (call.result, now + self.ttl)
+            call.done.set()
+        return call.result
+
+    def forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._recent.pop(key, None)
+
+    def _prune(self, now: float) -> None:
+        # Da chiamare con il lock
+        for key in [k for k, (_, expires_at) in self._recent.items() if expires_at <= now]:
+            del self._recent[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "ttl": self.ttl,
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "ttl_hits": self.ttl_hits,
+                "in_flight": len(self._in_flight),
+            }
+
+
+_registry: Dict[str, SingleFlight] = {}
+
+
+def create_flight(name: str, ttl: float = SINGLEFLIGHT_TTL) -> SingleFlight:
+    flight = SingleFlight(name, ttl=ttl)
+    _registry[name] = flight
+    return flight
+
+
+def all_flight_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: flight.stats() for name, flight in _registry.items()}
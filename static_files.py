@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import mimetypes
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # opzionale: senza il pacchetto si servono solo gzip e file .br già presenti
+    brotli = None
+
+
+# ============================================================
+# Frontend statico servito da un manifest in memoria
+# ============================================================
+# All'avvio ogni file di dist/ viene letto una volta sola: contenuto,
+# varianti compresse (file .br/.gz generati dalla build oppure compressi
+# qui), ETag forte e header di cache. Le richieste non toccano il disco,
+# non ricomprimono nulla e con If-None-Match ricevono 304 senza body.
+
+# I file in assets/ hanno l'hash nel nome (Vite): non cambiano mai
+IMMUTABLE_PREFIX = "assets/"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+_MIN_COMPRESS_SIZE = 1024
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "image/svg+xml",
+)
+# Preferenza a parità di q nell'Accept-Encoding
+_ENCODINGS = ("br", "gzip")
+_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class StaticVariant:
+    def __init__(self, body: bytes, etag: str, encoding: Optional[str] = None):
+        self.body = body
+        self.etag = etag
+        self.encoding = encoding
+
+
+class StaticFile:
+    def __init__(self, path: str, media_type: str, cache_control: str):
+        self.path = path
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.variants: Dict[Optional[str], StaticVariant] = {}
+
+
+def _media_type(path: Path) -> str:
+    media_type, _ = mimetypes.guess_type(path.name)
+    media_type = media_type or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+def _compress(body: bytes, encoding: str) -> Optional[bytes]:
+    if encoding == "gzip":
+        # mtime=0: output deterministico, quindi ETag stabili tra i riavvii
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=11)
+    return None
+
+
+def _load_file(root: Path, path: Path) -> StaticFile:
+    relative = path.relative_to(root).as_posix()
+    media_type = _media_type(path)
+    entry = StaticFile(
+        relative,
+        media_type,
+        IMMUTABLE_CACHE if relative.startswith(IMMUTABLE_PREFIX) else REVALIDATE_CACHE,
+    )
+    body = path.read_bytes()
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    entry.variants[None] = StaticVariant(body, f'"{digest}"')
+
+    compressible = media_type.startswith(_COMPRESSIBLE_TYPES) and len(body) >= _MIN_COMPRESS_SIZE
+    for encoding in _ENCODINGS:
+        precompressed = path.with_name(path.name + _SUFFIXES[encoding])
+        if precompressed.is_file():
+            encoded = precompressed.read_bytes()
+        elif compressible:
+            encoded = _compress(body, encoding)
+        else:
+            encoded = None
+        if encoded is not None and len(encoded) < len(body):
+            # Ogni rappresentazione ha il suo ETag forte
+            entry.variants[encoding] = StaticVariant(encoded, f'"{digest}-{encoding}"', encoding)
+    return entry
+
+
+def build_manifest(root: Path) -> Dict[str, StaticFile]:
+    """
+    Legge tutto dist/ e restituisce {percorso relativo: StaticFile}.
+    I file .br/.gz affiancati agli originali diventano varianti, non voci.
+    """
+    manifest: Dict[str, StaticFile] = {}
+    for path in sorted(root.rglob("*")):
+        if not path.is_file():
+            continue
+        if path.suffix in (".br", ".gz") and path.with_suffix("").is_file():
+            continue
+        entry = _load_file(root, path)
+        manifest[entry.path] = entry
+    return manifest
+
+
+def _accepted_encodings(header: str) -> List[str]:
+    accepted: Dict[str, float] = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    wildcard = accepted.get("*", 0.0)
+    scored = [(accepted.get(e, wildcard), -i, e) for i, e in enumerate(_ENCODINGS)]
+    return [e for q, _, e in sorted(scored, reverse=True) if q > 0]
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match usa il confronto debole: W/"x" equivale a "x"
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def static_response(request: Request, entry: StaticFile) -> Response:
+    variant = entry.variants[None]
+    for encoding in _accepted_encodings(request.headers.get("accept-encoding", "")):
+        if encoding in entry.variants:
+            variant = entry.variants[encoding]
+            break
+
+    headers = {
+        "ETag": variant.etag,
+        "Cache-Control": entry.cache_control,
+    }
+    if len(entry.variants) > 1:
+        headers["Vary"] = "Accept-Encoding"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, variant.etag):
+        return Response(status_code=304, headers=headers)
+
+    if variant.encoding:
+        headers["Content-Encoding"] = variant.encoding
+    body = b"" if request.method == "HEAD" else variant.body
+    headers["Content-Length"] = str(len(variant.body))
+    return Response(body, media_type=entry.media_type, headers=headers)
@@ -0,0 +1,205 @@
+import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from google.api_core.exceptions import AlreadyExists
+
+from config import db
+from leaderboard_service import leaderboard
+from match_service import player_match_deltas
+from models import (
+    EventFinalization,
+    MatchEvent,
+    PlayerMatchResult,
+    Rule,
+)
+from settlement_service import get_event, settle_event
+from user_service import invalidate_user_stats, stats_increment_fields
+
+
+# ============================================================
+# Aggregati per giocatore (user_stats) aggiornati a ogni evento chiuso
+# ============================================================
+# Sostituisce il ricalcolo di logic.ts::getWeightedStats: quando un evento
+# viene chiuso i contributi di ogni partecipante registrato vengono sommati
+# con incrementi atomici; /users/{uid}/stats legge un solo documento.
+
+AGGREGATE_FIELDS = (
+    "total_matches",
+    "wins",
+    "losses",
+    "draws",
+    "goals_scored",
+    "goals_conceded",
+    "clean_sheets",
+    "total_paid",
+    "total_fines",
+    "mvp_count",
+    "lvp_count",
+)
+
+_WRITES_PER_COMMIT = 500
+
+
+def _event_deltas(event: MatchEvent) -> Dict[str, Dict[str, float]]:
+    """
+    Contributo di un evento alle statistiche di ogni partecipante con
+    user_id (gli ospiti senza account vengono ignorati). Usa gli importi
+    già calcolati sui partecipanti. Uno stesso user_id su due partecipanti
+    conterebbe due presenze nella stessa partita: l'evento viene rifiutato.
+    """
+    mvp_votes: Dict[str, int] = defaultdict(int)
+    lvp_votes: Dict[str, int] = defaultdict(int)
+    for vote in event.votes:
+        mvp_votes[vote.mvp_id] += 1
+        lvp_votes[vote.lvp_id] += 1
+
+    has_score = event.score_a is not None and event.score_b is not None
+    deltas: Dict[str, Dict[str, float]] = {}
+    for p in event.participants:
+        if not p.user_id:
+            continue
+        if p.user_id in deltas:
+            raise ValueError(f"Utente {p.user_id} presente più volte tra i partecipanti")
+        # I voti possono riferirsi al nome (come nel frontend), all'id o all'uid
+        keys = {p.name, p.id, p.user_id}
+        mvp = sum(mvp_votes[k] for k in keys)
+        lvp = sum(lvp_votes[k] for k in keys)
+        d: Dict[str, float] = {
+            "total_matches": 1,
+            "goals_scored": p.goals,
+            "total_paid": p.final_amount,
+            "total_fines": p.total_fine,
+            "mvp_count": 1 if mvp > lvp and mvp > 0 else 0,
+            "lvp_count": 1 if lvp > mvp and lvp > 0 else 0,
+        }
+        if has_score and p.team in ("A", "B"):
+            scored, conceded = (
+                (event.score_a, event.score_b) if p.team == "A" else (event.score_b, event.score_a)
+            )
+            d["goals_conceded"] = conceded
+            d["clean_sheets"] = 1 if conceded == 0 else 0
+            d["wins"] = 1 if scored > conceded else 0
+            d["losses"] = 1 if scored < conceded else 0
+            d["draws"] = 1 if scored == conceded else 0
+        deltas[p.user_id] = d
+    return deltas
+
+
+def finalize_event(
+    event_id: str, event: Optional[MatchEvent], global_rules: List[Rule]
+) -> Optional[EventFinalization]:
+    """
+    Chiude un evento: calcola gli importi, salva l'evento e somma i
+    contributi alle statistiche dei giocatori in un unico commit.
+    Il documento event_finalizations/{event_id} rende l'operazione idempotente.
+    """
+    event = event or get_event(event_id)
+    if event is None:
+        return None
+    if event.id != event_id:
+        raise ValueError("L'id dell'evento non corrisponde all'URL")
+
+    settlement = settle_event(event, global_rules)
+    for participant, amounts in zip(event.participants, settlement.participants):
+        participant.base_quota = amounts.base_quota
+        participant.total_fine = amounts.total_fine
+        participant.final_amount = amounts.final_amount
+
+    deltas = _event_deltas(event)
+    if len(deltas) + 2 > _WRITES_PER_COMMIT:
+        raise ValueError("Troppi partecipanti per un singolo commit")
+
+    stored = event.model_dump(by_alias=True)
+    stored.update({"status": "closed", "finalized": True})
+
+    batch = db.batch()
+    batch.create(
+        db.collection("event_finalizations").document(event_id),
+        {
+            "event_id": event_id,
+            "players": list(deltas),
+            "finalized_at": datetime.utcnow().isoformat(),
+        },
+    )
+    batch.set(db.collection("events").document(event_id), stored)
+    for uid, d in deltas.items():
+        batch.set(
+            db.collection("user_stats").document(uid),
+            stats_increment_fields(uid, d),
+            merge=True,
+        )
+
+    try:
+        batch.commit()
+    except AlreadyExists:
+        return EventFinalization(event_id=event_id, finalized=False, settlement=settlement)
+    finally:
+        for uid in deltas:
+            invalidate_user_stats(uid)
+    leaderboard.apply_many(deltas)
+    return EventFinalization(event_id=event_id, finalized=True, settlement=settlement)
+
+
+# ============================================================
+# Ricostruzione completa dallo storico
+# ============================================================
+
+def rebuild_player_aggregates() -> Dict[str, int]:
+    """
+    Ricalcola da zero gli aggregati di user_stats in un solo passaggio in
+    streaming su eventi chiusi e partite liquidate. In memoria restano solo
+    i totali per giocatore, non lo storico. I giocatori senza storico
+    trovato (es. statistiche importate) non vengono toccati. Alla fine la
+    classifica viene ricaricata da user_stats.
+    """
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(AGGREGATE_FIELDS, 0))
+    events = 0
+    for doc in db.collection("events").where("finalized", "==", True).stream():
+        for uid, d in _event_deltas(MatchEvent(**doc.to_dict())).items():
+            for field, value in d.items():
+                totals[uid][field] += value
+        events += 1
+
+    matches = 0
+    for doc in db.collection("match_settlements").stream():
+        data = doc.to_dict()
+        for result in data.get("results", []):
+            player = PlayerMatchResult(**result)
+            d = player_match_deltas(player, data["home_score"], data["away_score"])
+            for field, value in d.items():
+                totals[player.uid][field] += value
+        matches += 1
+
+    batch = db.batch()
+    written: List[str] = []
+
+    def _write(uid: str, fields: Dict[str, float]) -> None:
+        batch.set(db.collection("user_stats").document(uid), {"uid": uid, **fields}, merge=True)
+        written.append(uid)
+        if len(written) == _WRITES_PER_COMMIT:
+            _flush()
+
+    def _flush() -> None:
+        nonlocal batch
+        batch.commit()
+        for uid in written:
+            invalidate_user_stats(uid)
+        batch = db.batch()
+        written.clear()
+
+    for uid, fields in totals.items():
+        _write(uid, fields)
+    if written:
+        _flush()
+    leaderboard.rebuild()
+
+    return {"events": events, "matches": matches, "players": len(totals)}
+
+
+if __name__ == "__main__":
+    # python stats_service.py rebuild
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("Uso: python stats_service.py rebuild")
+    print(rebuild_player_aggregates())
@@ -0,0 +1,161 @@
+import base64
+import random
+from typing import Any, List, Optional
+from urllib.parse import quote
+
+from config import db
+from datastore import run_transaction
+from handle_service import normalize_nickname
+
+
+# ============================================================
+# Allocazione dei tag nickname#tag
+# ============================================================
+# Per ogni nickname normalizzato (come gli handle: "Mario" e "mario" sono lo
+# stesso nickname) esiste un documento `nickname_tags/{nickname}` con una
+# bitmap dei 10.000 tag possibili (bit a 1 = tag occupato). Il tag viene
+# scelto e prenotato in memoria dentro una transazione: un solo documento
+# letto e scritto, qualunque sia il numero di tag già usati, e due
+# registrazioni concorrenti non possono ottenere lo stesso handle.
+
+TAG_SPACE = 10000
+_BITMAP_BYTES = TAG_SPACE // 8
+_RANDOM_PROBES = 32
+
+
+def reservation_ref(nickname: str):
+    return db.collection("nickname_tags").document(quote(normalize_nickname(nickname), safe=""))
+
+
+def reset_reservation(writer: Any, nickname: str) -> None:
+    """
+    Cancella la bitmap del nickname (es. dopo un import di utenti): la
+    prossima prenotazione la ricostruisce dagli utenti esistenti.
+    """
+    writer.delete(reservation_ref(nickname))
+
+
+def _decode_bitmap(data: Optional[dict]) -> bytearray:
+    if not data or not data.get("used"):
+        return bytearray(_BITMAP_BYTES)
+    return bytearray(base64.b64decode(data["used"]))
+
+
+def _encode_bitmap(bitmap: bytearray) -> str:
+    return base64.b64encode(bytes(bitmap)).decode("ascii")
+
+
+def _is_used(bitmap: bytearray, index: int) -> bool:
+    return bool(bitmap[index >> 3] & (1 << (index & 7)))
+
+
+def _set_used(bitmap: bytearray, index: int, used: bool) -> None:
+    if used:
+        bitmap[index >> 3] |= 1 << (index & 7)
+    else:
+        bitmap[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+
+def is_valid_tag(tag: str) -> bool:
+    return len(tag) == 4 and all("0" <= c <= "9" for c in tag)
+
+
+def _tag_index(tag: str) -> int:
+    if not is_valid_tag(tag):
+        raise ValueError(f"Tag non valido: '{tag}' (servono 4 cifre)")
+    return int(tag)
+
+
+def _pick_free_index(bitmap: bytearray) -> int:
+    for _ in range(_RANDOM_PROBES):
+        candidate = random.randrange(TAG_SPACE)
+        if not _is_used(bitmap, candidate):
+            return candidate
+    free = [i for i in range(TAG_SPACE) if not _is_used(bitmap, i)]
+    if not free:
+        raise RuntimeError("Impossibile generare un tag univoco per il nickname")
+    return random.choice(free)
+
+
+def _load_bitmap(transaction: Any, nickname: str) -> bytearray:
+    snapshot = reservation_ref(nickname).get(transaction=transaction)
+    if snapshot.exists:
+        return _decode_bitmap(snapshot.to_dict())
+
+    # Primo utilizzo del nickname: la bitmap parte dagli handle già esistenti
+    # con qualunque maiuscola, compresi quelli dismessi che restano riservati
+    key = normalize_nickname(nickname)
+    bitmap = bytearray(_BITMAP_BYTES)
+    existing = (
+        db.collection("handles")
+        .where("handle", ">=", f"{key}#0000")
+        .where("handle", "<=", f"{key}#9999")
+    )
+    for doc in transaction.get(existing):
+        tag = (doc.to_dict() or {}).get("tag")
+        if tag and is_valid_tag(tag):
+            _set_used(bitmap, int(tag), True)
+    return bitmap
+
+
+def reserve_tag(transaction: Any, nickname: str, tag: Optional[str] = None) -> str:
+    """
+    Prenota un tag per il nickname all'interno di una transazione già aperta.
+    Se tag è indicato prenota esattamente quello, altrimenti ne sceglie uno
+    libero a caso. Va chiamata prima di ogni altra scrittura della transazione.
+    """
+    bitmap = _load_bitmap(transaction, nickname)
+    if tag is not None:
+        index = _tag_index(tag)
+        if _is_used(bitmap, index):
+            raise ValueError(f"Il nickname '{nickname}#{tag}' è già in uso")
+    else:
+        index = _pick_free_index(bitmap)
+    _set_used(bitmap, index, True)
+    transaction.set(
+        reservation_ref(nickname),
+        {"nickname": normalize_nickname(nickname), "used": _encode_bitmap(bitmap)},
+    )
+    return f"{index:04d}"
+
+
+def allocate_tag(nickname: str, tag: Optional[str] = None) -> str:
+    return run_transaction(db, reserve_tag, nickname, tag)
+
+
+def reserve_tags(transaction: Any, nickname: str, tags: List[str]) -> List[str]:
+    """
+    Prenota in un colpo solo più tag dello stesso nickname (registrazioni
+    in blocco). Restituisce i tag che erano già occupati e non sono stati presi.
+    """
+    bitmap = _load_bitmap(transaction, nickname)
+    taken = []
+    for tag in tags:
+        index = _tag_index(tag)
+        if _is_used(bitmap, index):
+            taken.append(tag)
+        else:
+            _set_used(bitmap, index, True)
+    if len(taken) < len(tags):
+        transaction.set(
+            reservation_ref(nickname),
+            {"nickname": normalize_nickname(nickname), "used": _encode_bitmap(bitmap)},
+        )
+    return taken
+
+
+def release_tags(nickname: str, tags: List[str]) -> None:
+    def _release(transaction: Any) -> None:
+        snapshot = reservation_ref(nickname).get(transaction=transaction)
+        if not snapshot.exists:
+            return
+        bitmap = _decode_bitmap(snapshot.to_dict())
+        for tag in tags:
+            _set_used(bitmap, _tag_index(tag), False)
+        transaction.update(reservation_ref(nickname), {"used": _encode_bitmap(bitmap)})
+
+    run_transaction(db, _release)
+
+
+def release_tag(nickname: str, tag: str) -> None:
+    release_tags(nickname, [tag])
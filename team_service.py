@@ -0,0 +1,235 @@
+import heapq
+import random
+import time
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from models import (
+    BalancePlayer,
+    TeamBalanceRequest,
+    TeamBalanceResponse,
+    TeamSplit,
+    UserStats,
+)
+from user_service import get_many_user_stats
+
+
+# ============================================================
+# Bilanciamento squadre (sostituisce logic.ts::suggestBalancedTeams)
+# ============================================================
+# 1. Karmarkar–Karp dà una prima partizione con somme di skill vicine.
+# 2. Le dimensioni vengono riportate a n/2 (±1) spostando i giocatori.
+# 3. Una ricerca locale a scambi minimizza la differenza di skill più una
+#    forte penalità per i ruoli sbilanciati.
+# 4. Ripartenze casuali fino a esaurire il tempo raccolgono più soluzioni.
+
+ROLE_WEIGHT = 1000.0
+FLEX_ROLE = "Universale"
+MAX_RESTARTS = 500
+
+
+def skill_from_stats(stats: Optional[UserStats]) -> float:
+    # Stessa formula dello "Skill Score" del frontend
+    skill = 50.0
+    if stats:
+        skill += stats.mvp_count * 10
+        skill -= stats.lvp_count * 5
+        skill += stats.win_rate / 2
+        skill += stats.goals_scored / 5
+        skill += stats.total_matches
+    return skill
+
+
+def _primary_role(player: BalancePlayer) -> Optional[str]:
+    for role in player.roles:
+        if role != FLEX_ROLE:
+            return role
+    return None
+
+
+class _Problem:
+    def __init__(self, skills: Sequence[float], roles: Sequence[Optional[int]], n_roles: int):
+        self.skills = list(skills)
+        self.roles = list(roles)
+        self.n = len(skills)
+        self.role_totals = [0] * n_roles
+        for r in self.roles:
+            if r is not None:
+                self.role_totals[r] += 1
+
+    def role_imbalance(self, role_diff: List[int]) -> int:
+        # Con un numero dispari di giocatori di un ruolo, 1 di scarto è inevitabile
+        return sum(max(0, abs(d) - t % 2) for d, t in zip(role_diff, self.role_totals))
+
+    def evaluate(self, sides: List[int]) -> Tuple[float, List[int]]:
+        diff = 0.0
+        role_diff = [0] * len(self.role_totals)
+        for i, side in enumerate(sides):
+            sign = 1 if side == 0 else -1
+            diff += sign * self.skills[i]
+            if self.roles[i] is not None:
+                role_diff[self.roles[i]] += sign
+        return diff, role_diff
+
+    def cost(self, diff: float, role_diff: List[int]) -> float:
+        return abs(diff) + ROLE_WEIGHT * self.role_imbalance(role_diff)
+
+
+def _karmarkar_karp(skills: Sequence[float]) -> List[int]:
+    heap = [(-s, i, [i], []) for i, s in enumerate(skills)]
+    heapq.heapify(heap)
+    counter = len(skills)
+    while len(heap) > 1:
+        a = heapq.heappop(heap)
+        b = heapq.heappop(heap)
+        # a - b: i giocatori di b passano dalla parte opposta
+        heapq.heappush(heap, (a[0] - b[0], counter, a[2] + b[3], a[3] + b[2]))
+        counter += 1
+    sides = [1] * len(skills)
+    for i in heap[0][2]:
+        sides[i] = 0
+    return sides
+
+
+def _fix_sizes(problem: _Problem, sides: List[int]) -> None:
+    while True:
+        size_a = sides.count(0)
+        size_b = problem.n - size_a
+        if abs(size_a - size_b) <= 1:
+            return
+        big = 0 if size_a > size_b else 1
+        diff, _ = problem.evaluate(sides)
+        sign = 1 if big == 0 else -1
+        # Sposta il giocatore che lascia la differenza di skill più piccola
+        best = min(
+            (i for i in range(problem.n) if sides[i] == big),
+            key=lambda i: abs(diff - 2 * sign * problem.skills[i]),
+        )
+        sides[best] = 1 - big
+
+
+def _local_search(problem: _Problem, sides: List[int], deadline: float) -> float:
+    diff, role_diff = problem.evaluate(sides)
+    cost = problem.cost(diff, role_diff)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        best: Optional[Tuple[float, int, int]] = None
+        team_a = [i for i in range(problem.n) if sides[i] == 0]
+        team_b = [j for j in range(problem.n) if sides[j] == 1]
+        for i in team_a:
+            for j in team_b:
+                new_diff = diff - 2 * problem.skills[i] + 2 * problem.skills[j]
+                ri, rj = problem.roles[i], problem.roles[j]
+                if ri != rj:
+                    if ri is not None:
+                        role_diff[ri] -= 2
+                    if rj is not None:
+                        role_diff[rj] += 2
+                    new_cost = problem.cost(new_diff, role_diff)
+                    if ri is not None:
+                        role_diff[ri] += 2
+                    if rj is not None:
+                        role_diff[rj] -= 2
+                else:
+                    new_cost = problem.cost(new_diff, role_diff)
+                if new_cost < cost - 1e-9 and (best is None or new_cost < best[0]):
+                    best = (new_cost, i, j)
+        if best is not None:
+            cost, i, j = best
+            sides[i], sides[j] = 1, 0
+            diff, role_diff = problem.evaluate(sides)
+            improved = True
+    return cost
+
+
+def _random_sides(n: int, rng: random.Random) -> List[int]:
+    sides = [0] * ((n + 1) // 2) + [1] * (n // 2)
+    rng.shuffle(sides)
+    return sides
+
+
+def _canonical(sides: List[int]) -> FrozenSet[int]:
+    # La stessa divisione con le squadre invertite conta una volta sola
+    return frozenset(i for i, side in enumerate(sides) if side == sides[0])
+
+
+def optimize_split(
+    skills: Sequence[float],
+    roles: Sequence[Optional[int]],
+    n_roles: int,
+    splits: int,
+    time_budget: float,
+    seed: Optional[int] = None,
+) -> List[Tuple[float, List[int]]]:
+    """
+    Restituisce fino a `splits` partizioni distinte (costo, lati) ordinate
+    per costo crescente, cercate entro `time_budget` secondi.
+    """
+    problem = _Problem(skills, roles, n_roles)
+    deadline = time.perf_counter() + time_budget
+    rng = random.Random(seed)
+    found: Dict[FrozenSet[int], Tuple[float, List[int]]] = {}
+
+    sides = _karmarkar_karp(skills)
+    for _ in range(MAX_RESTARTS):
+        _fix_sizes(problem, sides)
+        cost = _local_search(problem, sides, deadline)
+        key = _canonical(sides)
+        if key not in found or cost < found[key][0]:
+            found[key] = (cost, list(sides))
+        if time.perf_counter() >= deadline:
+            break
+        if len(found) >= splits and sorted(c for c, _ in found.values())[splits - 1] < 1e-9:
+            break
+        sides = _random_sides(problem.n, rng)
+
+    return sorted(found.values(), key=lambda item: item[0])[:splits]
+
+
+def load_skills(req: TeamBalanceRequest) -> List[float]:
+    """Skill dei giocatori: quella indicata o, in mancanza, dalle statistiche salvate."""
+    uids = [p.uid for p in req.players if p.uid and p.skill is None]
+    stats = get_many_user_stats(uids) if uids else {}
+    return [
+        p.skill if p.skill is not None else skill_from_stats(stats.get(p.uid) if p.uid else None)
+        for p in req.players
+    ]
+
+
+def build_balance(req: TeamBalanceRequest, skills: List[float]) -> TeamBalanceResponse:
+    """Solo calcolo, nessuna lettura: può girare nel pool di processi (compute.run_cpu)."""
+    role_names: Dict[str, int] = {}
+    roles: List[Optional[int]] = []
+    for player in req.players:
+        role = _primary_role(player) if req.role_constraints else None
+        if role is not None:
+            role = role_names.setdefault(role, len(role_names))
+        roles.append(role)
+
+    results = optimize_split(
+        skills, roles, len(role_names), req.splits, req.time_budget_ms / 1000.0
+    )
+
+    problem = _Problem(skills, roles, len(role_names))
+    splits = []
+    for _, sides in results:
+        diff, role_diff = problem.evaluate(sides)
+        skill_a = sum(s for s, side in zip(skills, sides) if side == 0)
+        splits.append(
+            TeamSplit(
+                team_a=[p.id for p, side in zip(req.players, sides) if side == 0],
+                team_b=[p.id for p, side in zip(req.players, sides) if side == 1],
+                skill_a=skill_a,
+                skill_b=skill_a - diff,
+                skill_gap=abs(diff),
+                role_imbalance=problem.role_imbalance(role_diff),
+            )
+        )
+    return TeamBalanceResponse(
+        skills={p.id: s for p, s in zip(req.players, skills)},
+        splits=splits,
+    )
+
+
+def balance_teams(req: TeamBalanceRequest) -> TeamBalanceResponse:
+    return build_balance(req, load_skills(req))
@@ -0,0 +1,57 @@
+import os
+import sys
+import uuid
+
+# Backend locale in memoria, senza Firebase né pool di processi
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["FIREBASE_WARMUP"] = "0"
+os.environ["CPU_POOL_SIZE"] = "0"
+os.environ["MATCH_EVENTS_SETTLE_SECONDS"] = "0"
+os.environ["METRICS_ENABLED"] = "1"
+os.environ["METRICS_TOKEN"] = "test-metrics-token"
+os.environ.setdefault("SESSION_SECRET", "test-secret")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from session import create_session_token
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def auth_headers(uid: str) -> dict:
+    token, _ = create_session_token(uid)
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="session")
+def admin_headers():
+    uid = "admin-" + uuid.uuid4().hex[:8]
+    main.ADMIN_UIDS.add(uid)
+    return auth_headers(uid)
+
+
+@pytest.fixture
+def user_headers():
+    return auth_headers("user-" + uuid.uuid4().hex[:8])
+
+
+@pytest.fixture
+def new_match(client):
+    def _create(**fields) -> str:
+        body = {
+            "home_team": "Casa", "away_team": "Ospiti",
+            "start_time": "2026-05-01T20:00:00", "league": "Test",
+            **fields,
+        }
+        r = client.post("/matches", json=body)
+        assert r.status_code == 200, r.text
+        return r.json()["match_id"]
+    return _create
@@ -0,0 +1,51 @@
+def test_score_update_requires_admin(client, new_match, user_headers, admin_headers):
+    match_id = new_match()
+    body = {"home_score": 3, "away_score": 0, "status": "finished"}
+
+    assert client.put(f"/matches/{match_id}/score", json=body).status_code == 401
+    assert client.put(f"/matches/{match_id}/score", json=body, headers=user_headers).status_code == 403
+
+    r = client.put(f"/matches/{match_id}/score", json=body, headers=admin_headers)
+    assert r.status_code == 200
+    assert (r.json()["home_score"], r.json()["status"]) == (3, "finished")
+
+
+def test_score_update_unknown_match_is_404(client, admin_headers):
+    r = client.put("/matches/missing/score", json={"home_score": 1, "away_score": 0}, headers=admin_headers)
+    assert r.status_code == 404
+
+
+def test_manual_bet_settlement_requires_admin(client, new_match, user_headers, admin_headers):
+    match_id = new_match()
+    client.put(f"/matches/{match_id}/score", json={"home_score": 1, "away_score": 1, "status": "finished"},
+               headers=admin_headers)
+
+    assert client.post(f"/matches/{match_id}/bets/settle").status_code == 401
+    assert client.post(f"/matches/{match_id}/bets/settle", headers=user_headers).status_code == 403
+    assert client.post(f"/matches/{match_id}/bets/settle", headers=admin_headers).status_code == 200
+
+
+def test_match_settlement_requires_admin(client, new_match, user_headers, admin_headers):
+    match_id = new_match()
+    client.put(f"/matches/{match_id}/score", json={"home_score": 2, "away_score": 1, "status": "finished"},
+               headers=admin_headers)
+    body = {"players": [{"uid": "settle-a", "team": "home", "goals": 2}, {"uid": "settle-b", "team": "away"}]}
+
+    assert client.post(f"/matches/{match_id}/settle", json=body).status_code == 401
+    assert client.post(f"/matches/{match_id}/settle", json=body, headers=user_headers).status_code == 403
+    r = client.post(f"/matches/{match_id}/settle", json=body, headers=admin_headers)
+    assert r.status_code == 200, r.text
+    assert client.post("/matches/missing/settle", json=body, headers=admin_headers).status_code == 404
+
+
+def test_match_event_log_writes_require_admin(client, new_match, user_headers, admin_headers):
+    match_id = new_match()
+    body = {"events": [{"type": "goal", "team": "home", "minute": 10}]}
+
+    assert client.post(f"/matches/{match_id}/events", json=body, headers=user_headers).status_code == 403
+    assert client.post(f"/matches/{match_id}/events/compact", headers=user_headers).status_code == 403
+    assert client.post(f"/matches/{match_id}/events", json=body, headers=admin_headers).status_code == 200
+    r = client.post(f"/matches/{match_id}/events/compact", headers=admin_headers)
+    assert r.status_code == 200
+    assert r.json()["counters"]["goal_home"] == 1
+    assert client.post("/matches/missing/events", json=body, headers=admin_headers).status_code == 404
@@ -0,0 +1,77 @@
+import uuid
+
+import pytest
+
+import bet_service
+from bet_service import bet_outcome, list_bets_by_match, place_bets, settle_match_bets
+from models import BetCreateRequest
+
+
+@pytest.mark.parametrize("bet_type, prediction, home, away, outcome", [
+    ("1X2", "1", 2, 1, "won"),
+    ("1X2", "1", 1, 1, "lost"),
+    ("1X2", "X", 0, 0, "won"),
+    ("1X2", "2", 0, 3, "won"),
+    ("1X2", "2", 3, 0, "lost"),
+    ("over_under", "over_2.5", 2, 1, "won"),
+    ("over_under", "under_2.5", 2, 1, "lost"),
+    ("over_under", "under_2.5", 1, 1, "won"),
+    ("over_under", "over_3", 2, 1, "void"),
+    ("over_under", "under_3", 2, 1, "void"),
+    ("over_under", "over_0", 0, 0, "void"),
+    ("both_teams_score", "yes", 1, 1, "won"),
+    ("both_teams_score", "yes", 2, 0, "lost"),
+    ("both_teams_score", "no", 0, 2, "won"),
+    ("both_teams_score", "no", 1, 3, "lost"),
+    # Pronostici illeggibili: rimborsati invece di bloccare il regolamento
+    ("1X2", "3", 1, 0, "void"),
+    ("over_under", "over_abc", 1, 0, "void"),
+    ("over_under", "over_-1", 1, 0, "void"),
+    ("both_teams_score", "maybe", 1, 0, "void"),
+    ("handicap", "1", 1, 0, "void"),
+])
+def test_bet_outcome(bet_type, prediction, home, away, outcome):
+    assert bet_outcome(bet_type, prediction, home, away) == outcome
+
+
+def _place(match_id: str, predictions: list) -> list:
+    uid = "bettor-" + uuid.uuid4().hex[:6]
+    return place_bets([
+        BetCreateRequest(match_id=match_id, uid=uid, bet_type=bet_type, prediction=prediction, stake=5)
+        for bet_type, prediction in predictions
+    ])
+
+
+def test_bet_cursor_round_trip_with_equal_timestamps(client, new_match):
+    match_id = new_match()
+    placed = _place(match_id, [("1X2", "1")] * 7)
+    # Stesso commit, stesso created_at: l'ordine lo decide bet_id
+    assert len({bet.created_at for bet in placed}) == 1
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = list_bets_by_match(match_id, limit=3, start_after=cursor)
+        seen += [bet.bet_id for bet in page]
+        if cursor is None:
+            break
+    assert seen == sorted((bet.bet_id for bet in placed), reverse=True)
+    assert bet_service.decode_bet_cursor(bet_service.encode_bet_cursor(placed[0])) == {
+        "created_at": placed[0].created_at, "bet_id": placed[0].bet_id,
+    }
+
+
+def test_invalid_bet_cursor_is_400(client):
+    assert client.get("/matches/any/bets", params={"start_after": "not-a-cursor"}).status_code == 400
+
+
+def test_settlement_pages_through_pending_bets_once(client, new_match, monkeypatch):
+    match_id = new_match()
+    _place(match_id, [("1X2", "1")] * 3 + [("over_under", "over_3")] * 2 + [("both_teams_score", "yes")] * 2)
+    _place(match_id, [("1X2", "X")])
+    monkeypatch.setattr(bet_service, "BET_PAGE_SIZE", 3)
+
+    result = settle_match_bets(match_id, 2, 1)
+    assert (result.settled, result.won, result.lost, result.void) == (8, 5, 1, 2)
+    statuses = sorted(bet.status for bet in list_bets_by_match(match_id, limit=50)[0])
+    assert statuses == ["lost"] + ["void"] * 2 + ["won"] * 5
+    assert settle_match_bets(match_id, 2, 1).settled == 0
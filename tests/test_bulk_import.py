@@ -0,0 +1,80 @@
+import json
+import uuid
+
+import pytest
+
+from bulk_service import import_ndjson
+from config import db
+from handle_service import get_handle, handle_index
+from leaderboard_service import leaderboard
+from tag_service import allocate_tag
+
+
+def _lines(*rows: dict) -> list:
+    return [json.dumps(row) for row in rows]
+
+
+def _user(uid: str, nickname: str, tag: str) -> dict:
+    return {"uid": uid, "nickname": nickname, "tag": tag, "created_at": "2025-09-01T10:00:00"}
+
+
+def test_import_stores_values_coerced_by_the_model(client):
+    match_id = "bulk-" + uuid.uuid4().hex[:8]
+    result = import_ndjson("matches", _lines({
+        "match_id": match_id, "home_team": "A", "away_team": "B", "start_time": "2026-01-01T20:00:00",
+        "status": "finished", "home_score": "3", "away_score": "1",
+        "created_at": "2026-01-01T19:00:00", "updated_at": "2026-01-01T22:00:00",
+    }))
+    assert (result.written, result.invalid) == (1, 0)
+
+    stored = db.collection("matches").document(match_id).get().to_dict()
+    assert stored["home_score"] == 3 and stored["away_score"] == 1
+
+
+def test_import_reports_invalid_rows(client):
+    result = import_ndjson("matches", ['{"match_id": "x"', json.dumps({"match_id": "bad/id"})])
+    assert (result.rows, result.written, result.invalid) == (2, 0, 2)
+
+
+def test_imported_users_get_handles_and_reserved_tags(client):
+    nickname = "Bulk" + uuid.uuid4().hex[:6]
+    # La bitmap del nickname esiste già prima dell'import
+    r = client.post("/auth/register/nickname", json={"nickname": nickname, "tag": "0001", "password": "secret12"})
+    assert r.status_code == 200, r.text
+
+    uid = "imp-" + uuid.uuid4().hex[:8]
+    result = import_ndjson("users", _lines(_user(uid, nickname, "0002")))
+    assert (result.written, result.invalid) == (1, 0)
+
+    assert get_handle(nickname.lower(), "0002")["uid"] == uid
+    assert [u.uid for u in handle_index.search(nickname) if u.tag == "0002"] == [uid]
+    with pytest.raises(ValueError, match="già in uso"):
+        allocate_tag(nickname, "0002")
+
+
+def test_user_import_rejects_handles_owned_by_others(client):
+    nickname = "Owned" + uuid.uuid4().hex[:6]
+    r = client.post("/auth/register/nickname", json={"nickname": nickname, "tag": "0001", "password": "secret12"})
+    owner = r.json()["uid"]
+
+    result = import_ndjson("users", _lines(_user("intruder-" + owner[:6], nickname.upper(), "0001")))
+    assert (result.written, result.invalid) == (0, 1)
+    assert get_handle(nickname, "0001")["uid"] == owner
+
+
+def test_user_import_retires_the_previous_handle(client):
+    nickname = "Renamed" + uuid.uuid4().hex[:6]
+    uid = "imp-" + uuid.uuid4().hex[:8]
+    import_ndjson("users", _lines(_user(uid, nickname, "0005")))
+    import_ndjson("users", _lines(_user(uid, nickname + "x", "0005")))
+
+    assert get_handle(nickname, "0005") is None
+    assert get_handle(nickname + "x", "0005")["uid"] == uid
+
+
+def test_stats_import_rebuilds_the_leaderboard(client):
+    uid = "stats-" + uuid.uuid4().hex[:8]
+    result = import_ndjson("user_stats", _lines({"uid": uid, "total_matches": "40", "wins": "39"}))
+    assert result.written == 1
+
+    assert leaderboard.rank(uid, "wins").value == 39
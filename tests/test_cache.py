@@ -0,0 +1,52 @@
+import importlib.util
+import os
+from types import SimpleNamespace
+
+from cache import TTLCache
+
+
+def _load_gunicorn_conf():
+    path = os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py")
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_invalidation_discards_a_load_started_before_it():
+    cache = TTLCache("test", maxsize=2, ttl=60)
+    generation = cache.generation
+    cache.invalidate("a")
+    cache.set("a", 1, generation)
+    assert cache.get("a") is None
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_zero_ttl_disables_the_cache():
+    cache = TTLCache("test", ttl=0)
+    loads = []
+    for _ in range(3):
+        assert cache.get_or_load("a", lambda: loads.append(1) or "value") == "value"
+    assert len(loads) == 3 and cache.stats()["size"] == 0
+
+
+def test_several_workers_disable_the_user_caches(monkeypatch):
+    monkeypatch.setenv("BENCH_LOCAL_WORKERS", "1")
+    for name in ("USER_CACHE_TTL", "LEADERBOARD_REBUILD_INTERVAL", "WEB_CONCURRENCY"):
+        monkeypatch.delenv(name, raising=False)
+    conf = _load_gunicorn_conf()
+
+    conf.on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=1)))
+    assert "USER_CACHE_TTL" not in os.environ
+
+    conf.on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=4)))
+    assert os.environ["USER_CACHE_TTL"] == "0"
+
+    monkeypatch.setenv("USER_CACHE_TTL", "5")
+    conf.on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=4)))
+    assert os.environ["USER_CACHE_TTL"] == "5"
@@ -0,0 +1,177 @@
+import random
+import uuid
+
+import pytest
+
+from config import db
+from leaderboard_service import leaderboard
+from models import Infraction, MatchEvent, Participant, Rule
+from settlement_service import settle_event, settle_events, time_to_minutes
+from stats_service import rebuild_player_aggregates
+
+
+def _reference_amounts(event: MatchEvent, global_rules: list) -> list:
+    """logic.ts::calculateFinalAmounts trascritta riga per riga, un partecipante alla volta."""
+    if not event.participants:
+        return []
+    active = [r for r in global_rules if r.id not in event.disabled_global_rule_ids]
+    all_rules = active + event.event_rules
+    base_share = event.total_cost / len(event.participants)
+
+    parts = []
+    for p in event.participants:
+        total_fine, multiplier = 0.0, 1.0
+        for inf in p.infractions:
+            rule = next((r for r in all_rules if r.id == inf.rule_id), None)
+            if rule is None:
+                continue
+            if rule.action == "multiply_quota":
+                multiplier *= rule.action_value
+            elif rule.action == "half_field_penalty":
+                total_fine += rule.action_value + event.total_cost * 0.5
+            else:
+                total_fine += inf.calculated_amount
+        for rule in all_rules:
+            triggered, factor = False, 1.0
+            if rule.variable == "arrival_time":
+                arrival, threshold = time_to_minutes(p.arrival_time), time_to_minutes(str(rule.value))
+                if rule.operator == ">" and arrival > threshold:
+                    triggered, factor = True, arrival - threshold
+            elif rule.variable == "ritardo_pesante":
+                triggered = time_to_minutes(p.arrival_time) > time_to_minutes("20:00") + 15
+            elif rule.variable == "forgot_kit":
+                triggered = p.forgot_kit and rule.operator == "=="
+            elif rule.variable == "yellow_cards":
+                triggered = p.yellow_cards > float(rule.value)
+            elif rule.variable == "is_mvp":
+                triggered = p.is_mvp and rule.operator == "=="
+            elif rule.variable == "nutmegs":
+                triggered = p.nutmegs > float(rule.value)
+            if triggered:
+                if rule.action == "add_fixed":
+                    total_fine += rule.action_value * factor
+                elif rule.action == "multiply_quota":
+                    multiplier *= rule.action_value
+                elif rule.action == "half_field_penalty":
+                    total_fine += rule.action_value + event.total_cost * 0.5
+        total_fine += max(0.0, base_share * multiplier - base_share)
+        parts.append(total_fine)
+
+    total_match_fines = sum(parts)
+    if event.fine_allocation == "split":
+        clean = [fine for fine in parts if fine == 0]
+        discount = total_match_fines / len(clean) if clean else 0
+        return [
+            (base_share, fine, max(0.0, base_share + fine - (discount if fine == 0 else 0)))
+            for fine in parts
+        ]
+    return [(base_share, fine, base_share + fine) for fine in parts]
+
+
+_GLOBAL_RULES = [
+    Rule(id="late", variable="arrival_time", operator=">", value="20:05", action="add_fixed", action_value=0.5),
+    Rule(id="very-late", variable="ritardo_pesante", operator=">", action="multiply_quota", action_value=1.5),
+    Rule(id="kit", variable="forgot_kit", operator="==", action="add_fixed", action_value=2),
+    Rule(id="cards", variable="yellow_cards", operator=">", value="1", action="half_field_penalty", action_value=1),
+    Rule(id="mvp", variable="is_mvp", operator="==", action="multiply_quota", action_value=0.5),
+    Rule(id="nutmegs", variable="nutmegs", operator=">", value="2", action="add_fixed", action_value=1),
+    Rule(id="manual", variable="goal_count", operator=">", value="0", action="add_fixed", action_value=3),
+]
+
+
+def _random_event(rng: random.Random, index: int) -> MatchEvent:
+    rule_ids = [r.id for r in _GLOBAL_RULES] + ["local", "unknown"]
+    participants = [
+        Participant(
+            id=f"p{i}",
+            name=f"Giocatore {i}",
+            arrival_time=rng.choice(["19:55", "20:00", "20:06", "20:14", "20:16", "21:30", "", "boh"]),
+            yellow_cards=rng.randrange(4),
+            nutmegs=rng.randrange(5),
+            forgot_kit=rng.random() < 0.2,
+            is_mvp=rng.random() < 0.1,
+            infractions=[
+                Infraction(rule_id=rng.choice(rule_ids), calculated_amount=rng.choice([0, 1.5, 4]))
+                for _ in range(rng.choice([0, 0, 0, 1, 2]))
+            ],
+        )
+        for i in range(rng.randrange(0, 13))
+    ]
+    event_rules = rng.choice([
+        [],
+        [Rule(id="local", variable="nutmegs", operator=">", value="0", action="multiply_quota", action_value=1.2)],
+        [Rule(id="late", variable="arrival_time", operator=">", value="20:00", action="add_fixed", action_value=0.25)],
+    ])
+    return MatchEvent(
+        id=f"ev-{index}",
+        total_cost=rng.choice([0, 60, 75.5, 90]),
+        participants=participants,
+        event_rules=event_rules,
+        disabled_global_rule_ids=rng.sample([r.id for r in _GLOBAL_RULES], rng.randrange(3)),
+        fine_allocation=rng.choice(["split", "fund"]),
+    )
+
+
+def _amounts(settlement) -> list:
+    return [(p.base_quota, p.total_fine, p.final_amount) for p in settlement.participants]
+
+
+def test_settlement_matches_the_frontend_formula():
+    rng = random.Random(20251018)
+    events = [_random_event(rng, i) for i in range(200)]
+    batch = settle_events(events, _GLOBAL_RULES)
+    for event, settlement in zip(events, batch):
+        expected = _reference_amounts(event, _GLOBAL_RULES)
+        assert _amounts(settlement) == pytest.approx(expected), event.id
+        assert _amounts(settle_event(event, _GLOBAL_RULES)) == pytest.approx(expected), event.id
+        assert settlement.total_fines == pytest.approx(sum(fine for _, fine, _ in expected))
+
+
+def test_split_allocation_discounts_clean_players():
+    event = MatchEvent(
+        id="ev-split", total_cost=60, fine_allocation="split",
+        participants=[
+            Participant(id="a", name="A", arrival_time="20:10"),
+            Participant(id="b", name="B", arrival_time="20:00", forgot_kit=True),
+            Participant(id="c", name="C", arrival_time="20:00"),
+            Participant(id="d", name="D", arrival_time="19:50"),
+        ],
+    )
+    # A: 5 minuti di ritardo * 0.5 = 2.5; B: kit 2; C e D si dividono 4.5
+    amounts = _amounts(settle_event(event, _GLOBAL_RULES))
+    assert amounts == pytest.approx([(15, 2.5, 17.5), (15, 2, 17), (15, 0, 12.75), (15, 0, 12.75)])
+
+    event.fine_allocation = "fund"
+    assert [final for _, _, final in _amounts(settle_event(event, _GLOBAL_RULES))] == pytest.approx([17.5, 17, 15, 15])
+
+
+def test_settle_unknown_event_is_404(client):
+    assert client.post("/events/missing/settle", json={}).status_code == 404
+
+
+def test_finalize_unknown_event_is_404(client, admin_headers):
+    assert client.post("/events/missing/finalize", json={}, headers=admin_headers).status_code == 404
+
+
+def test_rebuild_keeps_players_without_history_and_refreshes_the_leaderboard(client, admin_headers):
+    imported, player = "imported-" + uuid.uuid4().hex[:6], "player-" + uuid.uuid4().hex[:6]
+    db.collection("user_stats").document(imported).set({"uid": imported, "total_matches": 9, "wins": 7, "goals_scored": 30})
+    event = {
+        "id": "ev-" + uuid.uuid4().hex[:6], "totalCost": 20, "scoreA": 3, "scoreB": 1,
+        "participants": [
+            {"id": "p1", "userId": player, "name": "Uno", "team": "A", "goals": 2},
+            {"id": "p2", "name": "Ospite", "team": "B"},
+        ],
+    }
+    r = client.post(f"/events/{event['id']}/finalize", json={"event": event}, headers=admin_headers)
+    assert r.status_code == 200 and r.json()["finalized"], r.text
+    db.collection("user_stats").document(player).update({"goals_scored": 99})
+
+    rebuild_player_aggregates()
+
+    kept = db.collection("user_stats").document(imported).get().to_dict()
+    assert (kept["wins"], kept["goals_scored"]) == (7, 30)
+    rebuilt = db.collection("user_stats").document(player).get().to_dict()
+    assert (rebuilt["goals_scored"], rebuilt["wins"], rebuilt["total_paid"]) == (2, 1, 10)
+    assert leaderboard.rank(player, "goals_scored").value == 2
+    assert leaderboard.rank(imported, "wins").value == 7
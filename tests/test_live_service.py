@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+import pytest
+
+import live_service
+from live_service import LiveScoreHub
+from models import Match
+
+
+class FakeWatch:
+    def __init__(self, owner: "FakeDocument"):
+        self.owner = owner
+        self.stopped = threading.Event()
+
+    def unsubscribe(self) -> None:
+        # Come BackgroundConsumer.stop(): join() del thread consumer
+        if threading.current_thread() is self.owner.consumer:
+            raise RuntimeError("cannot join current thread")
+        self.stopped.set()
+
+
+class FakeDocument:
+    def __init__(self):
+        self.callback = None
+        self.consumer = None
+        self.watch = None
+
+    def on_snapshot(self, callback):
+        self.callback = callback
+        self.watch = FakeWatch(self)
+        return self.watch
+
+    def deliver(self, data: dict) -> None:
+        # Consegna lo snapshot dal thread consumer, come fa Firestore
+        snapshot = type("Snapshot", (), {"exists": True, "to_dict": lambda self: data})()
+        errors = []
+
+        def run():
+            try:
+                self.callback([snapshot], [], None)
+            except Exception as e:
+                errors.append(e)
+
+        self.consumer = threading.Thread(target=run)
+        self.consumer.start()
+        self.consumer.join()
+        assert not errors
+
+
+class FakeDb:
+    def __init__(self):
+        self.document_ref = FakeDocument()
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return self.document_ref
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDb()
+    monkeypatch.setattr(live_service, "db", db)
+    monkeypatch.setattr(live_service, "LIVE_FIRESTORE_LISTENER", True)
+    return db
+
+
+def _match(status: str, home: int) -> dict:
+    return Match(
+        match_id="m1", home_team="A", away_team="B", start_time="2026-05-01T20:00:00",
+        status=status, home_score=home, away_score=0, league="Test",
+        created_at="2026-05-01T19:00:00", updated_at=f"2026-05-01T20:{home:02d}:00",
+    ).model_dump(mode="json")
+
+
+def test_finished_snapshot_stops_listener_off_consumer_thread(fake_db):
+    async def scenario():
+        hub = LiveScoreHub()
+        queue = await hub.subscribe("m1")
+        assert hub.stats()["listeners"] == 1
+
+        fake_db.document_ref.deliver(_match("live", 1))
+        fake_db.document_ref.deliver(_match("finished", 2))
+
+        frames = [await asyncio.wait_for(queue.get(), 1) for _ in range(3)]
+        assert frames[-1] is None
+        assert '"status":"finished"' in frames[1]
+        assert await asyncio.to_thread(fake_db.document_ref.watch.stopped.wait, 1)
+        assert hub.stats() == {"matches": 0, "subscribers": 0, "listeners": 0}
+
+    asyncio.run(scenario())
@@ -0,0 +1,73 @@
+import match_log_service
+from match_log_service import append_match_events, compact_match_events, compact_pending_matches, list_match_events
+from models import MatchLogEventCreate
+
+
+def _goal(team: str, minute: int) -> MatchLogEventCreate:
+    return MatchLogEventCreate(type="goal", team=team, minute=minute)
+
+
+def _stats_doc(match_id: str):
+    return match_log_service._stats_ref(match_id).get()
+
+
+def test_stats_of_unknown_match_is_404(client):
+    assert client.get("/matches/missing/stats").status_code == 404
+
+
+def test_event_ids_are_ordered_and_page_with_the_cursor(client, new_match):
+    match_id = new_match()
+    appended = []
+    for minute in range(5):
+        appended += append_match_events(match_id, [_goal("home", minute), _goal("away", minute)])
+    ids = [event.id for event in appended]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+
+    seen, cursor = [], ""
+    while True:
+        page = list_match_events(match_id, cursor, limit=3)
+        seen += [event.id for event in page.events]
+        cursor = page.cursor
+        if not page.has_more:
+            break
+    assert seen == ids
+    assert list_match_events(match_id, cursor).events == []
+
+
+def test_appends_raise_the_flag_once_per_compaction(client, new_match):
+    match_id = new_match()
+    append_match_events(match_id, [_goal("home", 1)])
+    raised = _stats_doc(match_id)
+    assert raised.to_dict()["needs_compaction"] is True
+
+    append_match_events(match_id, [_goal("home", 2)])
+    assert _stats_doc(match_id).update_time == raised.update_time
+
+    assert compact_match_events(match_id) == 2
+    append_match_events(match_id, [_goal("away", 3)])
+    assert _stats_doc(match_id).to_dict()["needs_compaction"] is True
+
+
+def test_compactor_clears_the_flag_when_nothing_is_pending(client, new_match):
+    match_id = new_match()
+    match_log_service._stats_ref(match_id).update({"needs_compaction": True})
+
+    assert compact_pending_matches()[match_id] == 0
+    assert _stats_doc(match_id).to_dict()["needs_compaction"] is False
+    assert match_id not in compact_pending_matches()
+
+
+def test_compactor_skips_events_younger_than_the_settle_window(client, new_match, monkeypatch):
+    match_id = new_match()
+    append_match_events(match_id, [_goal("home", 10)])
+    monkeypatch.setattr(match_log_service, "MATCH_EVENTS_SETTLE_SECONDS", 3600)
+
+    assert compact_match_events(match_id) == 0
+    stats = _stats_doc(match_id).to_dict()
+    assert stats["needs_compaction"] is True and stats["compacted_id"] == ""
+
+    monkeypatch.setattr(match_log_service, "MATCH_EVENTS_SETTLE_SECONDS", 0)
+    assert compact_match_events(match_id) == 1
+    stats = _stats_doc(match_id).to_dict()
+    assert stats["needs_compaction"] is False
+    assert (stats["counters"], stats["shots_home"]) == ({"goal_home": 1}, 1)
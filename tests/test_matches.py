@@ -0,0 +1,57 @@
+import json
+import uuid
+
+from match_service import decode_match_cursor, encode_match_cursor, get_match_by_id
+
+
+def _create_league(new_match, start_times: list) -> str:
+    league = "Lega " + uuid.uuid4().hex[:6]
+    for start_time in start_times:
+        new_match(league=league, start_time=start_time)
+    return league
+
+
+def _pages(client, **params) -> list:
+    pages, cursor = [], None
+    while True:
+        r = client.get("/matches", params={**params, **({"start_after": cursor} if cursor else {})})
+        assert r.status_code == 200, r.text
+        pages.append([(m["start_time"], m["match_id"]) for m in r.json()["matches"]])
+        cursor = r.json()["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pages_cover_every_match_once_in_order(client, new_match):
+    # Orari ripetuti: a parità di start_time l'ordine lo decide match_id
+    times = ["2026-05-01T20:00:00", "2026-05-01T20:00:00", "2026-05-02T18:00:00",
+             "2026-05-01T20:00:00", "2026-05-03T21:00:00"]
+    league = _create_league(new_match, times)
+
+    pages = _pages(client, league=league, limit=2)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    seen = [key for page in pages for key in page]
+    assert seen == sorted(seen) and len(set(seen)) == len(times)
+
+    r = client.get("/matches", params={"league": league, "format": "ndjson"})
+    assert [(m["start_time"], m["match_id"]) for m in map(json.loads, r.text.splitlines())] == seen
+
+
+def test_cursor_pages_respect_the_time_range(client, new_match):
+    league = _create_league(new_match, [f"2026-06-0{day}T20:00:00" for day in range(1, 8)])
+    pages = _pages(client, league=league, limit=2, start_from="2026-06-02", start_to="2026-06-06")
+    assert [start[:10] for page in pages for start, _ in page] == [
+        "2026-06-02", "2026-06-03", "2026-06-04", "2026-06-05",
+    ]
+
+
+def test_cursor_encoding_round_trip(client, new_match):
+    match = get_match_by_id(new_match())
+    assert decode_match_cursor(encode_match_cursor(match)) == {
+        "start_time": match.start_time, "match_id": match.match_id,
+    }
+
+
+def test_invalid_cursor_is_400(client):
+    assert client.get("/matches", params={"start_after": "???"}).status_code == 400
+    assert client.get("/matches", params={"start_after": "???", "format": "ndjson"}).status_code == 400
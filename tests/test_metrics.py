@@ -0,0 +1,9 @@
+def test_metrics_require_the_scrape_token_or_an_admin(client, user_headers, admin_headers):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers=user_headers).status_code == 403
+
+    r = client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"})
+    assert r.status_code == 200
+    assert "# TYPE" in r.text
+    assert client.get("/metrics", headers=admin_headers).status_code == 200
@@ -0,0 +1,86 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+import tag_service
+from config import db
+from datastore import run_transaction
+from handle_service import create_handle, handle_doc
+from tag_service import TAG_SPACE, allocate_tag, release_tag, reservation_ref, reserve_tags
+
+
+def _nickname(prefix: str = "Tag") -> str:
+    return prefix + uuid.uuid4().hex[:6]
+
+
+def _bitmap(nickname: str) -> bytearray:
+    return tag_service._decode_bitmap(reservation_ref(nickname).get().to_dict())
+
+
+def test_allocation_and_release_round_trip(client):
+    nickname = _nickname()
+    tags = {allocate_tag(nickname) for _ in range(50)}
+    assert len(tags) == 50 and all(tag_service.is_valid_tag(tag) for tag in tags)
+
+    tag = sorted(tags)[0]
+    with pytest.raises(ValueError):
+        allocate_tag(nickname, tag)
+    release_tag(nickname, tag)
+    assert allocate_tag(nickname, tag) == tag
+
+
+def test_reserve_tags_reports_the_taken_ones(client):
+    nickname = _nickname()
+    allocate_tag(nickname, "0100")
+    taken = run_transaction(db, reserve_tags, nickname, ["0100", "0101", "0102"])
+    assert taken == ["0100"]
+    bitmap = _bitmap(nickname)
+    assert [tag_service._is_used(bitmap, i) for i in (99, 100, 101, 102, 103)] == [False, True, True, True, False]
+
+
+def test_last_free_tag_is_found_after_random_probes():
+    bitmap = bytearray(b"\xff" * (TAG_SPACE // 8))
+    tag_service._set_used(bitmap, 4321, False)
+    assert tag_service._pick_free_index(bitmap) == 4321
+    tag_service._set_used(bitmap, 4321, True)
+    with pytest.raises(RuntimeError):
+        tag_service._pick_free_index(bitmap)
+
+
+def test_bitmap_is_shared_by_every_case_of_a_nickname(client):
+    nickname = _nickname("Case")
+    allocate_tag(nickname, "0007")
+    assert reservation_ref(nickname.upper()).id == reservation_ref(nickname).id
+    with pytest.raises(ValueError):
+        allocate_tag(f"  {nickname.lower()} ", "0007")
+
+
+def test_new_bitmap_is_seeded_from_handles_of_any_case(client):
+    nickname = _nickname("Seed")
+    batch = db.batch()
+    for tag in ("0003", "0004"):
+        create_handle(batch, handle_doc(
+            "uid-" + tag, nickname.upper(), tag, None, f"{tag}@example.com",
+            "2025-09-01T10:00:00", datetime.utcnow(),
+        ))
+    batch.commit()
+
+    with pytest.raises(ValueError):
+        allocate_tag(nickname.lower(), "0004")
+    assert allocate_tag(nickname.lower(), "0005") == "0005"
+    bitmap = _bitmap(nickname)
+    assert [i for i in range(TAG_SPACE) if tag_service._is_used(bitmap, i)] == [3, 4, 5]
+
+
+def test_batch_registration_rejects_handles_differing_only_in_case(client):
+    nickname = _nickname("Roster")
+    users = [
+        {"nickname": nickname, "tag": "0001", "password": "secret12"},
+        {"nickname": nickname.upper(), "tag": "0001", "password": "secret12"},
+        {"nickname": nickname.lower(), "tag": "0002", "password": "secret12"},
+    ]
+    r = client.post("/auth/register/batch", json={"users": users})
+    assert r.status_code == 200, r.text
+    assert [u["tag"] for u in r.json()["users"]] == ["0001", "0002"]
+    assert [e["index"] for e in r.json()["errors"]] == [1]
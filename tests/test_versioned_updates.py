@@ -0,0 +1,64 @@
+from config import db
+from datastore import update_known
+from match_service import get_match_by_id, update_match_score_and_status
+from metrics import unwrap
+from models import UpdateUserRequest
+from user_service import get_user_profile, update_user_profile
+
+
+def _round_trips(func, *args):
+    client = unwrap(db)
+    client.reset_round_trips()
+    result = func(*args)
+    return result, client.round_trips()
+
+
+def test_update_known_rereads_when_the_document_changed_elsewhere(client):
+    ref = db.collection("matches").document("versioned-1")
+    ref.set({"match_id": "versioned-1", "home_score": 0, "league": "A"})
+    known = (ref.get().to_dict(), ref.get().update_time)
+    # Un altro worker modifica la partita dopo la nostra lettura
+    ref.update({"league": "B"})
+
+    state, update_time = update_known(db, ref, {"home_score": 2}, known)
+
+    assert state == {"match_id": "versioned-1", "home_score": 2, "league": "B"}
+    assert update_time == ref.get().update_time
+
+
+def test_score_update_with_known_state_is_one_commit(client, new_match):
+    match_id = new_match()
+    get_match_by_id(match_id)
+
+    match, round_trips = _round_trips(update_match_score_and_status, match_id, 1, 0, "live")
+
+    assert round_trips == {"commit": 1}
+    assert (match.home_score, match.status) == (1, "live")
+
+
+def test_score_update_returns_changes_made_by_other_writers(client, new_match):
+    match_id = new_match()
+    get_match_by_id(match_id)
+    db.collection("matches").document(match_id).update({"league": "Altro campionato"})
+
+    match = update_match_score_and_status(match_id, 2, 2)
+
+    assert (match.home_score, match.league) == (2, "Altro campionato")
+
+
+def test_score_update_of_missing_match_returns_none(client):
+    assert update_match_score_and_status("missing-match", 1, 0) is None
+
+
+def test_profile_update_is_one_commit_and_authoritative(client):
+    r = client.post("/auth/register/nickname", json={"nickname": "Versioned", "tag": "0001", "password": "secret12"})
+    uid = r.json()["uid"]
+    get_user_profile(uid)
+
+    profile, round_trips = _round_trips(update_user_profile, uid, UpdateUserRequest(status="away"))
+    assert round_trips == {"commit": 1}
+    assert profile["status"] == "away"
+
+    db.collection("users").document(uid).update({"favorite_team": "Inter"})
+    profile = update_user_profile(uid, UpdateUserRequest(status="active"))
+    assert (profile["status"], profile["favorite_team"]) == ("active", "Inter")
@@ -1,55 +1,216 @@
+import os
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1 import Increment, SERVER_TIMESTAMP
+from cache import create_cache
+from singleflight import create_flight
 from config import db
+from datastore import run_transaction, update_known
+from handle_service import (
+    create_handle,
+    handle_doc,
+    handle_index,
+    handle_ref,
+    nickname_auth_email,
+    normalize_handle,
+    retire_handle,
+)
+from leaderboard_service import leaderboard
+from tag_service import reserve_tag
 from models import UpdateUserRequest, UserStats  # <-- Import corretti
 
-def get_user_profile(uid: str) -> Optional[dict]:  # <-- Restituisce dict
+# Cache read-through per i profili e le statistiche più richiesti
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
+_profile_cache = create_cache("user_profiles", USER_CACHE_SIZE, USER_CACHE_TTL)
+_stats_cache = create_cache("user_stats", USER_CACHE_SIZE, USER_CACHE_TTL)
+# Miss concorrenti sullo stesso profilo: un solo get() verso il datastore
+_profile_reads = create_flight("user_profiles")
+# Ultimo stato noto (profilo, update_time), base degli update con
+# precondizione (datastore.update_known): non viene servito alle letture
+_profile_state = create_cache("user_profile_state", USER_CACHE_SIZE, ttl=3600)
+
+def _load_user_profile(uid: str) -> Optional[dict]:
     doc = db.collection("users").document(uid).get()
     if not doc.exists:
+        _profile_state.invalidate(uid)
         return None
-    return doc.to_dict()
+    profile = doc.to_dict()
+    _profile_state.set(uid, (profile, doc.update_time))
+    return dict(profile)
+
+def get_user_profile(uid: str) -> Optional[dict]:  # <-- Restituisce dict
+    profile = _profile_cache.get_or_load(
+        uid, lambda: _profile_reads.do(uid, lambda: _load_user_profile(uid))
+    )
+    return dict(profile) if profile is not None else None
 
 get_user_by_uid = get_user_profile
 
-def update_user_profile(uid: str, payload: UpdateUserRequest) -> Optional[dict]:
-    doc_ref = db.collection("users").document(uid)
-    doc = doc_ref.get()
-    if not doc.exists:
+def _change_handle(
+    transaction: Any, uid: str, updates: dict, now: datetime
+) -> Optional[Tuple[dict, List[dict]]]:
+    """
+    Cambio di nickname e/o tag: prenota il nuovo tag, crea il nuovo handle
+    e disattiva il vecchio nello stesso commit del profilo. L'handle nuovo
+    eredita l'email dell'account auth, così il login continua a funzionare.
+    """
+    user_ref = db.collection("users").document(uid)
+    snapshot = user_ref.get(transaction=transaction)
+    if not snapshot.exists:
         return None
+    profile = snapshot.to_dict()
+    old_nickname, old_tag = profile.get("nickname"), profile.get("tag")
+    nickname = updates.get("nickname", old_nickname)
+    tag = updates.get("tag")
+    if nickname == old_nickname and tag in (None, old_tag):
+        transaction.update(user_ref, updates)
+        return {**profile, **updates}, []
+
+    old_handle = None
+    if old_nickname and old_tag:
+        old_snapshot = handle_ref(normalize_handle(old_nickname, old_tag)).get(transaction=transaction)
+        if old_snapshot.exists:
+            old_handle = old_snapshot.to_dict()
+    if old_handle is not None:
+        auth_email = old_handle["auth_email"]
+    else:
+        auth_email = profile.get("email") or nickname_auth_email(old_nickname, old_tag)
+
+    if tag is None and normalize_handle(nickname, old_tag) == normalize_handle(old_nickname, old_tag):
+        tag = old_tag  # cambiano solo maiuscole/minuscole: stesso handle
+    tag = reserve_tag(transaction, nickname, tag)
+    new_handle = handle_doc(
+        uid, nickname, tag, profile.get("email"), auth_email,
+        profile.get("created_at") or now.isoformat(), now,
+    )
+    changed = [new_handle]
+    if old_handle is not None and old_handle["handle"] == new_handle["handle"]:
+        transaction.update(handle_ref(new_handle["handle"]), {
+            "nickname": nickname, "updated_at": new_handle["updated_at"],
+        })
+    else:
+        create_handle(transaction, new_handle)
+        if old_handle is not None and old_handle.get("active"):
+            retire_handle(transaction, old_handle["handle"], now)
+            changed.append({**old_handle, "active": False, "updated_at": new_handle["updated_at"]})
+
+    updates = {**updates, "nickname": nickname, "tag": tag}
+    transaction.update(user_ref, updates)
+    return {**profile, **updates}, changed
+
+def update_user_profile(uid: str, payload: UpdateUserRequest) -> Optional[dict]:
     updates = {k: v for k, v in payload.dict().items() if v is not None}
     if not updates:
         return get_user_profile(uid)
-    updates["updated_at"] = datetime.utcnow().isoformat()
-    doc_ref.update(updates)
-    return get_user_profile(uid)
+    now = datetime.utcnow()
+    updates["updated_at"] = now.isoformat()
+    if "nickname" in updates or "tag" in updates:
+        try:
+            result = run_transaction(db, _change_handle, uid, updates, now)
+        except AlreadyExists:
+            raise ValueError("Il nuovo nickname#tag è già in uso")
+        finally:
+            _profile_cache.invalidate(uid)
+            _profile_state.invalidate(uid)
+            _profile_reads.forget(uid)
+        if result is None:
+            return None
+        profile, changed = result
+        handle_index.apply(changed)
+        _profile_cache.set(uid, profile)
+        return dict(profile)
+    # Un solo commit con precondizione sullo stato noto: il profilo
+    # restituito è quello dopo la scrittura, anche se altri worker o istanze
+    # lo hanno modificato (la precondizione fallisce e si rilegge)
+    try:
+        state = update_known(db, db.collection("users").document(uid), updates, _profile_state.get(uid))
+    finally:
+        _profile_cache.invalidate(uid)
+        _profile_reads.forget(uid)
+    if state is None:
+        _profile_state.invalidate(uid)
+        return None
+    _profile_state.set(uid, state)
+    _profile_cache.set(uid, dict(state[0]))
+    return dict(state[0])
 
-def get_user_stats(uid: str) -> Optional[UserStats]:
+def _load_user_stats(uid: str) -> Optional[UserStats]:
     doc = db.collection("user_stats").document(uid).get()
     if not doc.exists:
         return None
     data = doc.to_dict()
     return UserStats(**data)
 
+def get_user_stats(uid: str) -> Optional[UserStats]:
+    stats = _stats_cache.get_or_load(uid, lambda: _load_user_stats(uid))
+    return stats.model_copy() if stats is not None else None
+
+def get_many_user_stats(uids: List[str]) -> Dict[str, UserStats]:
+    """
+    Statistiche di più utenti: quelle non in cache arrivano con un solo get_all.
+    """
+    found: Dict[str, UserStats] = {}
+    missing = []
+    for uid in dict.fromkeys(uids):
+        stats = _stats_cache.get(uid)
+        if stats is not None:
+            found[uid] = stats.model_copy()
+        else:
+            missing.append(uid)
+    if missing:
+        generation = _stats_cache.generation
+        refs = [db.collection("user_stats").document(uid) for uid in missing]
+        for doc in db.get_all(refs):
+            if doc.exists:
+                stats = UserStats(**doc.to_dict())
+                _stats_cache.set(doc.id, stats, generation)
+                found[doc.id] = stats.model_copy()
+    return found
+
+def match_result_deltas(goals_scored: int, goals_conceded: int, result: str) -> Dict[str, int]:
+    if result not in ("win", "loss", "draw"):
+        raise ValueError(f"Risultato non valido: {result}")
+    return {
+        "total_matches": 1,
+        "goals_scored": goals_scored,
+        "goals_conceded": goals_conceded,
+        "clean_sheets": 1 if goals_conceded == 0 else 0,
+        "wins": 1 if result == "win" else 0,
+        "losses": 1 if result == "loss" else 0,
+        "draws": 1 if result == "draw" else 0,
+    }
+
+def stats_increment_fields(uid: str, deltas: Dict[str, float]) -> dict:
+    """
+    Campi da scrivere con set(merge=True) per sommare `deltas` alle
+    statistiche: incrementi atomici lato server, nessuna lettura preventiva.
+    """
+    fields = {"uid": uid, "last_match_at": SERVER_TIMESTAMP}
+    fields.update({field: Increment(value) for field, value in deltas.items()})
+    return fields
+
+def stats_increments(
+    uid: str,
+    goals_scored: int,
+    goals_conceded: int,
+    result: str,  # 'win' | 'loss' | 'draw'
+) -> dict:
+    return stats_increment_fields(uid, match_result_deltas(goals_scored, goals_conceded, result))
+
+def invalidate_user_stats(uid: str) -> None:
+    _stats_cache.invalidate(uid)
+
 def increment_user_stats_after_match(
     uid: str,
     goals_scored: int,
     goals_conceded: int,
     result: str,  # 'win' | 'loss' | 'draw'
 ):
+    deltas = match_result_deltas(goals_scored, goals_conceded, result)
     doc_ref = db.collection("user_stats").document(uid)
-    doc = doc_ref.get()
-    if not doc.exists:
-        stats = UserStats(uid=uid)
-    else:
-        stats = UserStats(**doc.to_dict())
-    stats.total_matches += 1
-    stats.goals_scored += goals_scored
-    stats.goals_conceded += goals_conceded
-    if result == "win":
-        stats.wins += 1
-    elif result == "loss":
-        stats.losses += 1
-    elif result == "draw":
-        stats.draws += 1
-    stats.last_match_at = datetime.utcnow()
-    doc_ref.set(stats.dict())
\ No newline at end of file
+    doc_ref.set(stats_increment_fields(uid, deltas), merge=True)
+    _stats_cache.invalidate(uid)
+    leaderboard.apply_deltas(uid, deltas)